@@ -1,4 +1,13 @@
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
+import asyncio
+import math
+import re
+import time
+from contextlib import AsyncExitStack
+import httpx
+import orjson
+from fastapi import APIRouter, Request, Response, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from app.models.schemas import (
     GenerateRequest,
     GenerateResponse,
@@ -17,48 +26,190 @@ from app.models.schemas import (
 from app.services.llm_model import LLMModel
 from app.core.config import get_settings
 from typing import Any
-from app.services.github_app import GitHubApp
+from app.services.github_app import GitHubApp, RateLimited, fail_fast_on_rate_limit, github_stats
 from app.services.code_review_controller import CodeReviewController
-from app.core.logger import get_logger
+from app.services.review_cache import ReviewCommentCache
+from app.services.review_queue import ReviewQueue, pr_dedupe_key
+from app.services.review_scanner import SCANNER_STATS
+from app.services.rag_model import CONTEXT_STATS, SCORE_GATE, RETRIEVAL_CACHE
+from app.services.vector_stores import VECTOR_STORES
+from app.core.logger import get_logger, logging_stats
+from app.core.admission import AdmissionController
 
 router = APIRouter()
 log = get_logger(__name__)
 settings = get_settings()
 llm = LLMModel()
 github_app = GitHubApp()
-code_review = CodeReviewController(llm, github_app)
+code_review = CodeReviewController(llm, github_app, ReviewCommentCache(settings.review_queue_db))
+review_queue = ReviewQueue(
+    settings.review_queue_db,
+    handler=lambda _kind, ctx, progress: code_review.run_review(ctx, progress),
+    workers=settings.review_workers,
+    max_attempts=settings.review_max_attempts,
+    backoff_s=settings.review_retry_backoff_s,
+    lease_s=settings.review_lease_s,
+)
+admission = AdmissionController(
+    global_concurrency=settings.admission_global_concurrency,
+    key_concurrency=settings.admission_key_concurrency,
+    global_rate=settings.admission_global_rate,
+    global_burst=settings.admission_global_burst,
+    key_rate=settings.admission_key_rate,
+    key_burst=settings.admission_key_burst,
+    max_queue=settings.admission_max_queue,
+    max_wait_s=settings.admission_max_wait_s,
+)
+
+
+async def _cancel_on_disconnect(request: Request, coro, poll_s: float = 0.5):
+    """Await `coro`, cancelling it if the client disconnects first (no point finishing an abandoned chat)."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_s)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                log.info("[DISCONNECT] %s client went away; cancelling", request.url.path)
+                task.cancel()
+                # 499: nginx's "client closed request"; nobody is left to read it
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _client_key(request: Request, api_key: str | None = None) -> str:
+    """Rate-limit identity: the API key when present, else the client address."""
+    if api_key and api_key.strip():
+        return api_key
+    return f"ip:{request.client.host if request.client else 'unknown'}"
 
 @router.get("/")
 def root():
     log.info("Root endpoint hit")
-    return {"message": "Welcome to the GenAI API. Use /generate, /tests, or /docs endpoints."}
+    return {"message": "Welcome to the GenAI API. Use /generate, /tests, /docs, or /pipeline endpoints."}
+
+
+@router.get("/ready")
+def ready(response: Response):
+    """Readiness: 503 until the vector indexes are open and loaded (see VECTOR_WARM_ON_STARTUP)."""
+    status = VECTOR_STORES.readiness()
+    if not settings.vector_warm_on_startup:
+        # Nothing is preloaded: indexes open lazily on first use
+        status["ready"] = True
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+
+@router.get("/metrics")
+def metrics():
+    """Operational counters: admission queue/rejections and request coalescing."""
+    return {
+        "admission": admission.stats(),
+        "coalescing": llm.inflight.stats(),
+        "llm_calls": llm.llm.stats() if hasattr(llm.llm, "stats") else {},
+        "fpf_score_gate": SCORE_GATE.stats(),
+        "fpf_retrieval_cache": RETRIEVAL_CACHE.stats(),
+        "fpf_context": CONTEXT_STATS.stats(),
+        "logging": logging_stats(),
+        "review_queue": review_queue.stats(),
+        "review_cache": code_review.review_cache.stats(),
+        "review_diff_cache": code_review.diff_cache.stats(),
+        "review_scanner": SCANNER_STATS.stats(),
+        "github": github_stats(),
+    }
 
 @router.post("/generate", response_model=GenerateResponse)
-async def generate_code(payload: GenerateRequest):
+async def generate_code(payload: GenerateRequest, request: Request):
     log.info("[QUERY][generate] lang=%s prompt.len=%d", payload.language, len(payload.prompt or ""))
-    text = llm.generate_code(payload.prompt, payload.language, payload.api_key)
+    async with admission.slot("generate", _client_key(request, payload.api_key)):
+        text = await asyncio.to_thread(llm.generate_code, payload.prompt, payload.language, payload.api_key)
     return GenerateResponse(code=text, language=payload.language)
 
 
 @router.post("/tests", response_model=BasicResponse)
-async def generate_tests(payload: BasicRequest):
+async def generate_tests(payload: BasicRequest, request: Request):
     log.info("[QUERY][tests] code.len=%d", len(payload.code or ""))
-    text = llm.generate_tests(payload.code)
+    async with admission.slot("generate", _client_key(request)):
+        text = await asyncio.to_thread(llm.generate_tests, payload.code, payload.chunked)
     return BasicResponse(code=text)
 
 @router.post("/docs", response_model=BasicResponse)
-async def generate_docs(payload: BasicRequest):
+async def generate_docs(payload: BasicRequest, request: Request):
     log.info("[QUERY][docs] code.len=%d", len(payload.code or ""))
-    text = llm.generate_docs(payload.code)
+    async with admission.slot("generate", _client_key(request)):
+        text = await asyncio.to_thread(llm.generate_docs, payload.code, payload.chunked)
     return BasicResponse(code=text)
 
 
+@router.post("/pipeline")
+async def generate_pipeline(payload: GenerateRequest, request: Request):
+    """Generate code, then tests and docs concurrently, streamed as NDJSON.
+
+    Each line is one artifact: {"artifact": "code"|"tests"|"docs", "code": "..."} or, when a
+    follow-up stage fails, {"artifact": "...", "error": "..."}. Errors in the code stage are raised
+    as regular HTTP errors because nothing has been streamed yet.
+    """
+    log.info("[QUERY][pipeline] lang=%s prompt.len=%d", payload.language, len(payload.prompt or ""))
+    # The slot is held until the stream finishes and every stage's worker thread has returned, not
+    # just until the first artifact: cancelling a stage on disconnect does not stop its thread,
+    # which keeps calling the LLM. The release runs as a background task, which Starlette awaits
+    # after the response even when the client disconnects before the body is iterated.
+    slot = AsyncExitStack()
+    await slot.enter_async_context(admission.slot("pipeline", _client_key(request, payload.api_key)))
+    try:
+        code = await asyncio.to_thread(llm.generate_code, payload.prompt, payload.language, payload.api_key)
+    except BaseException:
+        await slot.aclose()
+        raise
+    threads: list[asyncio.Task] = []
+
+    async def _release() -> None:
+        await asyncio.gather(*threads, return_exceptions=True)
+        await slot.aclose()
+
+    async def _run_stage(name: str, work: asyncio.Task) -> dict[str, Any]:
+        try:
+            return {"artifact": name, "code": await asyncio.shield(work)}
+        except HTTPException as e:
+            return {"artifact": name, "error": str(e.detail)}
+        except Exception as e:  # noqa: BLE001 - surface upstream failures per artifact
+            log.warning("[PIPELINE] %s stage failed: %s", name, e)
+            return {"artifact": name, "error": "Upstream generation failed."}
+
+    async def _stream():
+        yield orjson.dumps({"artifact": "code", "code": code, "language": payload.language}) + b"\n"
+        threads.extend([
+            asyncio.create_task(asyncio.to_thread(llm.generate_tests, code)),
+            asyncio.create_task(asyncio.to_thread(llm.generate_docs, code)),
+        ])
+        stages = [
+            asyncio.create_task(_run_stage("tests", threads[0])),
+            asyncio.create_task(_run_stage("docs", threads[1])),
+        ]
+        try:
+            for done in asyncio.as_completed(stages):
+                yield orjson.dumps(await done) + b"\n"
+        finally:
+            for t in stages:
+                t.cancel()
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson", background=BackgroundTask(_release))
+
+
+REVIEW_ACTIONS = {"opened", "reopened", "synchronize"}
+
+
 @router.post("/code-review/webhook", response_model=CodeReviewResponse)
-async def code_review_webhook(
-    request: Request,
-    background_tasks: BackgroundTasks,
-):
-    """Webhook for PR reviews: verifies signature, generates review, posts using PAT."""
+async def code_review_webhook(request: Request):
+    """Webhook for PR reviews: verifies signature and enqueues a review job (posted using PAT).
+
+    Handles `opened`, `reopened` and `synchronize`. Redeliveries (same `X-GitHub-Delivery`) and
+    events for a head SHA whose review is still queued or running are acknowledged as duplicates
+    without doing any work.
+    """
     raw_body: bytes = await request.body()
     # Verify signature if configured. If invalid, return a 200 JSON response GitHub accepts, but skip processing.
     if not code_review.signature_valid(dict(request.headers), raw_body):
@@ -80,83 +231,136 @@ async def code_review_webhook(
     base_branch = ctx.get("base_branch")
     head_branch = ctx.get("head_branch")
     diff_url = ctx.get("diff_url")
-    diff_summary = code_review.diff_summary(ctx)
-
-    def _run_review_task() -> None:
-        review_text = code_review.generate_review_text(title, ctx.get("body", ""), diff_summary)
-        log.info("[CODE-REVIEW] Generated review for: %s", title)
-        code_review.try_post_review(ctx, review_text)
-        log.info(
-            "[CODE-REVIEW] Post attempted on %s/%s#%s",
-            ctx.get("owner"),
-            ctx.get("repo"),
-            ctx.get("pr_number"),
-        )
 
-    # Only trigger for PR opened or reopened
-    if action in {"opened", "reopened"}:
-        background_tasks.add_task(_run_review_task)
+    job_id = None
+    outcome = "skipped"
+    # Full review on opened/reopened; synchronize (new commits) re-reviews only the changed files
+    if action in REVIEW_ACTIONS:
+        job, created = await asyncio.to_thread(
+            review_queue.enqueue,
+            "review",
+            ctx,
+            delivery_id=request.headers.get("x-github-delivery"),
+            dedupe_key=pr_dedupe_key(ctx),
+        )
+        job_id = job["id"]
+        outcome = "queued" if created else "duplicate"
 
     ack = (
         f"ok: pr={title} base={base_branch or '-'} head={head_branch or '-'}"
         + (" diff" if diff_url else "")
         + (" bot" if ctx.get("installation_id") else "")
         + (f" action={action}" if action else "")
-        + (" queued" if action in {"opened", "reopened"} else " skipped")
+        + f" {outcome}"
     )
-    return CodeReviewResponse(review=ack)
+    return CodeReviewResponse(review=ack, job_id=job_id)
+
+
+@router.get("/code-review/jobs/{job_id}")
+def code_review_job(job_id: str):
+    """Status of a review job (webhook or by-URL): queued | running | done | failed.
+
+    `stages` holds per-stage status and duration of the current/last attempt (diff, summary,
+    inline, post); `stage` is the one running now. `queue_wait_s` and `run_s` time the job.
+    """
+    job = review_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    stages = job["progress"]
+    running = [name for name, st in stages.items() if st.get("status") == "running"]
+    started, finished = job["started_at"], job["finished_at"]
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "pr": "{owner}/{repo}#{pr_number}".format(**{k: job["payload"].get(k) for k in ("owner", "repo", "pr_number")}),
+        "head_sha": job["payload"].get("head_sha"),
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "queue_wait_s": round(started - job["created_at"], 3) if started else None,
+        "run_s": round((finished or time.time()) - started, 3) if started and job["status"] != "queued" else None,
+        "stage": ",".join(running) or None,
+        "stages": stages,
+        "last_error": job["last_error"],
+        "result": job["result"],
+    }
 
 @router.post("/code-review/by-url", response_model=CodeReviewResponse)
-async def code_review_by_url(payload: CodeReviewByUrlRequest):
-    """Trigger a PR review by providing a GitHub Pull Request URL.
+async def code_review_by_url(payload: CodeReviewByUrlRequest, request: Request):
+    """Queue a PR review by GitHub Pull Request URL; returns a job id right away.
 
     Accepts URLs like:
       - https://github.com/<owner>/<repo>/pull/<number>
       - https://github.com/<owner>/<repo>/pull/<number>/files
+
+    The job is the same one the webhook enqueues; poll `GET /code-review/jobs/{job_id}`.
     """
     log.info("[QUERY][code-review/by-url] url=%s", payload.url)
-    import re
     m = re.match(r"^https://github\.com/([^/]+)/([^/]+)/pull/(\d+)(?:/.*)?$", payload.url.strip())
     if not m:
         raise HTTPException(status_code=422, detail="Provide a valid GitHub PR URL: https://github.com/<owner>/<repo>/pull/<number>")
     owner, repo, pr_number = m.group(1), m.group(2), int(m.group(3))
 
-    # Build context mimicking webhook payload
-    ctx = {
-        "action": "opened",
-        "title": f"PR #{pr_number}",
-        "body": "",
-        "base_branch": None,
-        "head_branch": None,
-        "diff_url": f"https://github.com/{owner}/{repo}/pull/{pr_number}.diff",
-        "repository_full": f"{owner}/{repo}",
-        "owner": owner,
-        "repo": repo,
-        "pr_number": pr_number,
-        "installation_id": None,
-    }
-    diff_summary = code_review.diff_summary(ctx)
-    review_text = code_review.generate_review_text(ctx["title"], ctx.get("body", ""), diff_summary)
-    code_review.try_post_review(ctx, review_text)
-    return CodeReviewResponse(review=f"queued: {owner}/{repo}#{pr_number}")
+    async with admission.slot("review", _client_key(request)):
+        # PR metadata gives the review a real title/description and the head SHA to dedupe on
+        try:
+            # Never sleep on GitHub's quota while holding a slot: the caller gets 503 + Retry-After
+            with fail_fast_on_rate_limit():
+                pr = await asyncio.to_thread(github_app.get_pull_request, owner, repo, pr_number)
+        except RateLimited as e:
+            log.warning("[CODE-REVIEW] %s for %s/%s#%s", e, owner, repo, pr_number)
+            raise HTTPException(
+                status_code=503,
+                detail="GitHub rate limit exhausted; please retry later.",
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+            )
+        except (RuntimeError, httpx.HTTPError) as e:
+            log.warning("[CODE-REVIEW] PR metadata unavailable for %s/%s#%s: %s", owner, repo, pr_number, e)
+            pr = {}
+        # Build context mimicking webhook payload
+        ctx = {
+            "action": "opened",
+            "title": pr.get("title") or f"PR #{pr_number}",
+            "body": pr.get("body") or "",
+            "base_branch": (pr.get("base") or {}).get("ref"),
+            "head_branch": (pr.get("head") or {}).get("ref"),
+            "head_sha": (pr.get("head") or {}).get("sha"),
+            "diff_url": f"https://github.com/{owner}/{repo}/pull/{pr_number}.diff",
+            "repository_full": f"{owner}/{repo}",
+            "owner": owner,
+            "repo": repo,
+            "pr_number": pr_number,
+            "installation_id": None,
+        }
+        job, created = await asyncio.to_thread(review_queue.enqueue, "review", ctx, dedupe_key=pr_dedupe_key(ctx))
+    outcome = "queued" if created else "duplicate"
+    return CodeReviewResponse(review=f"{outcome}: {owner}/{repo}#{pr_number}", job_id=job["id"])
 
 # Unofficial Food Packaging Forum Chatbot (new path)
 @router.post("/fpf-chatbot/chat", response_model=FpfRagResponse)
-async def fpf_rag_chat(payload: FpfRagRequest):
+async def fpf_rag_chat(payload: FpfRagRequest, request: Request):
     log.info("[QUERY][fpf-chatbot] config=%s prompt.len=%d", payload.config_key, len(payload.prompt or ""))
-    text = llm.generate_rag_response(payload.prompt, payload.api_key, payload.config_key)
+    async with admission.slot("rag", _client_key(request, payload.api_key)):
+        text = await _cancel_on_disconnect(
+            request, llm.agenerate_rag_response(payload.prompt, payload.api_key, payload.config_key)
+        )
     return FpfRagResponse(reply=text)
 
 # ChEMBL Agent (new paths)
 @router.post("/chembl-agent/run", response_model=dict)
-async def chembl_run(payload: ChemblSqlPlanRequest):
+async def chembl_run(payload: ChemblSqlPlanRequest, request: Request):
     """End-to-end run: plan → retrieve → synthesize → execute.
 
     Returns: { sql, related_tables, columns, rows, retries, repaired, no_context, not_chembl, chembl_reason }
     """
     log.info("[QUERY][chembl/run] prompt.len=%d", len(payload.prompt or ""))
     try:
-        state: dict[str, Any] = llm.run_chembl_full(payload.prompt, limit=100, api_key=payload.api_key)
+        async with admission.slot("chembl", _client_key(request, payload.api_key)):
+            state: dict[str, Any] = await asyncio.to_thread(
+                llm.run_chembl_full, payload.prompt, limit=100, api_key=payload.api_key
+            )
         # Attach prompt and persist session if memory_id provided
         state["prompt"] = payload.prompt
         if getattr(payload, "memory_id", None):
@@ -187,11 +391,18 @@ async def chembl_run(payload: ChemblSqlPlanRequest):
 
 
 @router.post("/chembl-agent/edit", response_model=ChemblSqlEditResponse)
-async def chembl_edit(payload: ChemblSqlEditRequest):
+async def chembl_edit(payload: ChemblSqlEditRequest, request: Request):
     """Apply a tweak to the last SQL for a session and return updated SQL/results."""
-    # Ensure model running with api key
-    llm.check_model_running(payload.api_key)
-    state = llm.chembl_apply_edit(payload.memory_id, payload.instruction, payload.api_key, prev_sql=getattr(payload, "prev_sql", None))
+    async with admission.slot("chembl", _client_key(request, payload.api_key)):
+        # Ensure model running with api key
+        await asyncio.to_thread(llm.check_model_running, payload.api_key)
+        state = await asyncio.to_thread(
+            llm.chembl_apply_edit,
+            payload.memory_id,
+            payload.instruction,
+            payload.api_key,
+            prev_sql=getattr(payload, "prev_sql", None),
+        )
     return ChemblSqlEditResponse(
         sql=state.get("sql", ""),
         related_tables=state.get("structured_tables", []),
@@ -207,15 +418,16 @@ async def chembl_edit(payload: ChemblSqlEditRequest):
 
 
 @router.post("/chembl-agent/reexecute", response_model=ChemblSqlReexecuteResponse)
-async def chembl_reexecute(payload: ChemblSqlReexecuteRequest):
+async def chembl_reexecute(payload: ChemblSqlReexecuteRequest, request: Request):
     """Re-execute the last SQL for a given session with a new LIMIT."""
     # Ensure model running with api key
-    llm.check_model_running(payload.api_key)
+    await asyncio.to_thread(llm.check_model_running, payload.api_key)
     prev = llm.chembl_session_get(payload.memory_id)
     if not prev:
         raise HTTPException(status_code=400, detail="Unknown memory_id; run a query first.")
     sql = (prev.get("sql") or "").strip()
     if not sql:
         raise HTTPException(status_code=400, detail="No SQL present for this session.")
-    cols, rows = llm.chembl_reexecute(payload.memory_id, payload.limit, payload.api_key)
+    async with admission.slot("chembl", _client_key(request, payload.api_key)):
+        cols, rows = await asyncio.to_thread(llm.chembl_reexecute, payload.memory_id, payload.limit, payload.api_key)
     return ChemblSqlReexecuteResponse(columns=cols, rows=rows)
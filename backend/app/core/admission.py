@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict
+
+from fastapi import HTTPException
+
+from app.core.logger import get_logger
+from app.core.singleflight import secret_digest
+
+log = get_logger(__name__)
+
+# Cost of one request per endpoint class, in concurrency units and rate-limit tokens.
+DEFAULT_WEIGHTS: Dict[str, int] = {
+    "generate": 1,
+    "pipeline": 3,
+    "rag": 2,
+    "review": 2,
+    "chembl": 4,
+}
+
+
+class _TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens/s up to `burst`."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available (0 if available now)."""
+        self._refill(now)
+        cost = min(cost, self.burst)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        self.tokens -= min(cost, self.burst)
+
+
+@dataclass
+class _KeyState:
+    bucket: _TokenBucket
+    in_flight: int = 0
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+class AdmissionController:
+    """Per-key and global concurrency + token-bucket limits with a bounded wait queue.
+
+    Requests that cannot be admitted before `max_wait_s` (or that find the queue full) are rejected
+    immediately with 429 and a `Retry-After` estimate instead of piling up behind the upstream.
+    All state lives on the event loop; no locking beyond the asyncio condition is needed.
+    """
+
+    def __init__(
+        self,
+        global_concurrency: int = 16,
+        key_concurrency: int = 4,
+        global_rate: float = 10.0,
+        global_burst: float = 40.0,
+        key_rate: float = 1.0,
+        key_burst: float = 10.0,
+        max_queue: int = 64,
+        max_wait_s: float = 10.0,
+        weights: Dict[str, int] | None = None,
+    ) -> None:
+        self.global_concurrency = max(1, global_concurrency)
+        self.key_concurrency = max(1, key_concurrency)
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.max_queue = max(0, max_queue)
+        self.max_wait_s = max(0.0, max_wait_s)
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self._global_bucket = _TokenBucket(global_rate, global_burst)
+        self._keys: Dict[str, _KeyState] = {}
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond: asyncio.Condition | None = None
+        self._admitted: Dict[str, int] = {}
+        self._rejected: Dict[str, int] = {}
+        self._max_queue_seen = 0
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def _key_state(self, key: str) -> _KeyState:
+        st = self._keys.get(key)
+        if st is None:
+            self._evict_idle()
+            st = _KeyState(bucket=_TokenBucket(self.key_rate, self.key_burst))
+            self._keys[key] = st
+        st.last_seen = time.monotonic()
+        return st
+
+    def _evict_idle(self, idle_s: float = 600.0) -> None:
+        now = time.monotonic()
+        for k in [k for k, s in self._keys.items() if s.in_flight == 0 and now - s.last_seen > idle_s]:
+            del self._keys[k]
+
+    def _try_admit(self, st: _KeyState, weight: int) -> float:
+        """Admit if possible and return 0; otherwise return the suggested wait in seconds."""
+        now = time.monotonic()
+        # A single request heavier than the caps is admitted alone rather than never
+        if self._in_flight and self._in_flight + weight > self.global_concurrency:
+            return -1.0
+        if st.in_flight and st.in_flight + weight > self.key_concurrency:
+            return -1.0
+        wait = max(st.bucket.wait_time(weight, now), self._global_bucket.wait_time(weight, now))
+        if wait > 0:
+            return wait
+        st.bucket.take(weight)
+        self._global_bucket.take(weight)
+        st.in_flight += weight
+        self._in_flight += weight
+        return 0.0
+
+    def _reject(self, endpoint: str, reason: str, retry_after: float) -> HTTPException:
+        self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        self._rejected[f"class:{endpoint}"] = self._rejected.get(f"class:{endpoint}", 0) + 1
+        seconds = max(1, math.ceil(retry_after))
+        log.warning("[ADMISSION] reject class=%s reason=%s retry_after=%ds", endpoint, reason, seconds)
+        return HTTPException(
+            status_code=429,
+            detail="Server busy; please retry shortly.",
+            headers={"Retry-After": str(seconds)},
+        )
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str, key: str | None = None) -> AsyncIterator[None]:
+        """Hold an admission slot for the duration of the block, or raise 429."""
+        weight = self.weights.get(endpoint, 1)
+        key = secret_digest(key) if key else "anonymous"
+        cond = self._condition()
+        async with cond:
+            st = self._key_state(key)
+            wait = self._try_admit(st, weight)
+            if wait != 0.0:
+                if self._waiting >= self.max_queue:
+                    raise self._reject(endpoint, "queue_full", wait if wait > 0 else 1.0)
+                deadline = time.monotonic() + self.max_wait_s
+                self._waiting += 1
+                self._max_queue_seen = max(self._max_queue_seen, self._waiting)
+                try:
+                    while wait != 0.0:
+                        remaining = deadline - time.monotonic()
+                        if wait > remaining or remaining <= 0:
+                            reason = "rate_limited" if wait > 0 else "concurrency"
+                            raise self._reject(endpoint, reason, wait if wait > 0 else self.max_wait_s)
+                        # Token waits are time-driven; concurrency waits are woken by releases
+                        timeout = wait if wait > 0 else remaining
+                        try:
+                            await asyncio.wait_for(cond.wait(), timeout=timeout)
+                        except asyncio.TimeoutError:
+                            pass
+                        wait = self._try_admit(st, weight)
+                finally:
+                    self._waiting -= 1
+            self._admitted[endpoint] = self._admitted.get(endpoint, 0) + 1
+        try:
+            yield
+        finally:
+            async with cond:
+                st.in_flight -= weight
+                self._in_flight -= weight
+                st.last_seen = time.monotonic()
+                cond.notify_all()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "in_flight_units": self._in_flight,
+            "global_concurrency": self.global_concurrency,
+            "queue_depth": self._waiting,
+            "queue_max_seen": self._max_queue_seen,
+            "queue_capacity": self.max_queue,
+            "tracked_keys": len(self._keys),
+            "admitted": dict(self._admitted),
+            "rejected": dict(self._rejected),
+        }
@@ -7,6 +7,92 @@ class Settings(BaseModel):
     openai_embedding_model: str = "text-embedding-3-large"
     temperature: str
     app_name: str = "CodeGen API"
+    # Logging (see app/core/logger.py); an empty LOG_DIR logs to stdout only
+    log_dir: str = "/var/log/genai-portfolio"
+    log_level: str = "INFO"
+    log_queue_size: int = 10000
+    log_max_payload_chars: int = 500
+    # Inline review comments: concurrent per-file LLM calls, deterministic caps, per-review deadline
+    review_inline_workers: int = 4
+    review_inline_deadline_s: float = 90.0
+    review_inline_max_total: int = 10
+    review_inline_max_per_file: int = 3
+    # Parsed PR diffs kept per head SHA; patch characters given to the summary review prompt
+    review_diff_cache_size: int = 64
+    review_summary_diff_chars: int = 12000
+    # Pack small per-file diffs into one inline-review call up to this many diff tokens (0 = one call per file)
+    review_batch_token_budget: int = 4000
+    review_batch_max_files: int = 10
+    # Local stage before the LLM: skip lockfiles/vendored/generated/minified/huge files, regex scanner
+    review_prefilter: bool = True
+    review_scanner: bool = True
+    review_max_file_changes: int = 2000
+    # Durable review job queue (see app/services/review_queue.py)
+    review_queue_db: str = "app/review_queue.sqlite3"
+    review_workers: int = 2
+    review_max_attempts: int = 3
+    review_retry_backoff_s: float = 10.0
+    # A running job whose owner has not renewed its lease for this long is requeued
+    review_lease_s: float = 60.0
+    # Shared GitHub REST client (see app/services/github_app.py); point GITHUB_API_URL at scripts/github_stub.py to test
+    github_api_url: str = "https://api.github.com"
+    github_http2: bool = True
+    github_max_connections: int = 20
+    github_timeout_s: float = 30.0
+    github_page_concurrency: int = 4
+    # Conditional-request cache for GitHub GETs (0 disables) and rate-limit pacing below the reserve
+    github_cache_mb: float = 64.0
+    github_rate_limit_reserve: int = 200
+    github_rate_limit_max_delay_s: float = 60.0
+    # Persistent Chroma store and the FPF website collection (see app/services/fpf_ingest.py)
+    chroma_db_dir: str = "app/chroma_db"
+    fpf_collection: str = "langchain"
+    # Open and load the vector indexes at startup instead of on the first query
+    vector_warm_on_startup: bool = True
+    # Embedding backend for new/re-embedded collections: "openai" or "local" (app/services/embeddings.py)
+    embedding_backend: str = "openai"
+    local_embedding_dim: int = 768
+    # Optional OpenAI-compatible endpoint (e.g. scripts/fake_llm_server.py for latency testing)
+    openai_base_url: str | None = None
+    # Hedged requests / retries for LLM calls, see app/services/llm_call.py
+    llm_hedge_enabled: bool = True
+    llm_hedge_percentile: float = 0.95
+    llm_hedge_min_samples: int = 20
+    llm_hedge_budget: float = 0.1
+    llm_max_retries: int = 2
+    llm_timeout_s: float = 60.0
+    # FPF chatbot conversation memory
+    fpf_history_max_turns: int = 6
+    fpf_history_summarize: bool = True
+    fpf_memory_ttl_s: float = 3600.0
+    fpf_memory_max_threads: int = 500
+    fpf_memory_max_bytes: int = 0
+    # "two_stage" (assess → generate) or "single_pass" (one call returns verdict + answer)
+    fpf_graph_mode: str = "two_stage"
+    # Context packing before assess/generate: dedupe, URL-only sources, token budget
+    fpf_context_packing: bool = True
+    fpf_context_token_budget: int = 1500
+    fpf_context_dedup_threshold: float = 0.8
+    # Retrieval result cache (0 entries disables it)
+    fpf_retrieval_cache_size: int = 1024
+    fpf_retrieval_cache_ttl_s: float = 3600.0
+    # Retrieval score gate in front of the LLM relevance judge
+    fpf_gate_enabled: bool = True
+    fpf_gate_low: float = 0.30
+    fpf_gate_high: float = 0.80
+    # Chunked (map-reduce) docs/tests generation for large source files
+    code_chunk_threshold_chars: int = 12000
+    code_chunk_max_chars: int = 6000
+    code_chunk_workers: int = 4
+    # Admission control (per API key and global), see app/core/admission.py
+    admission_global_concurrency: int = 16
+    admission_key_concurrency: int = 4
+    admission_global_rate: float = 10.0
+    admission_global_burst: float = 40.0
+    admission_key_rate: float = 1.0
+    admission_key_burst: float = 10.0
+    admission_max_queue: int = 64
+    admission_max_wait_s: float = 10.0
 
 
 def get_settings() -> Settings:
@@ -14,4 +100,69 @@ def get_settings() -> Settings:
         openai_model=os.getenv("OPENAI_MODEL", "gpt-4.1-mini"),
         temperature=os.getenv("TEMPERATURE", "0.3"),
         openai_embedding_model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-large"),
+        log_dir=os.getenv("LOG_DIR", "/var/log/genai-portfolio"),
+        log_level=os.getenv("LOG_LEVEL", "INFO").strip().upper(),
+        log_queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+        log_max_payload_chars=int(os.getenv("LOG_MAX_PAYLOAD_CHARS", "500")),
+        review_inline_workers=int(os.getenv("REVIEW_INLINE_WORKERS", "4")),
+        review_inline_deadline_s=float(os.getenv("REVIEW_INLINE_DEADLINE_S", "90")),
+        review_inline_max_total=int(os.getenv("REVIEW_INLINE_MAX_TOTAL", "10")),
+        review_inline_max_per_file=int(os.getenv("REVIEW_INLINE_MAX_PER_FILE", "3")),
+        review_diff_cache_size=int(os.getenv("REVIEW_DIFF_CACHE_SIZE", "64")),
+        review_summary_diff_chars=int(os.getenv("REVIEW_SUMMARY_DIFF_CHARS", "12000")),
+        review_batch_token_budget=int(os.getenv("REVIEW_BATCH_TOKEN_BUDGET", "4000")),
+        review_batch_max_files=int(os.getenv("REVIEW_BATCH_MAX_FILES", "10")),
+        review_prefilter=os.getenv("REVIEW_PREFILTER", "1").strip().lower() not in {"0", "false", "no"},
+        review_scanner=os.getenv("REVIEW_SCANNER", "1").strip().lower() not in {"0", "false", "no"},
+        review_max_file_changes=int(os.getenv("REVIEW_MAX_FILE_CHANGES", "2000")),
+        review_queue_db=os.getenv("REVIEW_QUEUE_DB", "app/review_queue.sqlite3"),
+        review_workers=int(os.getenv("REVIEW_WORKERS", "2")),
+        review_max_attempts=int(os.getenv("REVIEW_MAX_ATTEMPTS", "3")),
+        review_retry_backoff_s=float(os.getenv("REVIEW_RETRY_BACKOFF_S", "10")),
+        review_lease_s=float(os.getenv("REVIEW_LEASE_S", "60")),
+        github_api_url=os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/"),
+        github_http2=os.getenv("GITHUB_HTTP2", "1").strip().lower() not in {"0", "false", "no"},
+        github_max_connections=int(os.getenv("GITHUB_MAX_CONNECTIONS", "20")),
+        github_timeout_s=float(os.getenv("GITHUB_TIMEOUT_S", "30")),
+        github_page_concurrency=int(os.getenv("GITHUB_PAGE_CONCURRENCY", "4")),
+        github_cache_mb=float(os.getenv("GITHUB_CACHE_MB", "64")),
+        github_rate_limit_reserve=int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "200")),
+        github_rate_limit_max_delay_s=float(os.getenv("GITHUB_RATE_LIMIT_MAX_DELAY_S", "60")),
+        chroma_db_dir=os.getenv("CHROMA_DB_DIR", "app/chroma_db"),
+        fpf_collection=os.getenv("FPF_COLLECTION", "langchain"),
+        vector_warm_on_startup=os.getenv("VECTOR_WARM_ON_STARTUP", "1").strip().lower() not in {"0", "false", "no"},
+        embedding_backend=os.getenv("EMBEDDING_BACKEND", "openai").strip().lower(),
+        local_embedding_dim=int(os.getenv("LOCAL_EMBEDDING_DIM", "768")),
+        openai_base_url=os.getenv("OPENAI_BASE_URL") or None,
+        llm_hedge_enabled=os.getenv("LLM_HEDGE_ENABLED", "1").strip().lower() not in {"0", "false", "no"},
+        llm_hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+        llm_hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        llm_hedge_budget=float(os.getenv("LLM_HEDGE_BUDGET", "0.1")),
+        llm_max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        llm_timeout_s=float(os.getenv("LLM_TIMEOUT_S", "60")),
+        fpf_history_max_turns=int(os.getenv("FPF_HISTORY_MAX_TURNS", "6")),
+        fpf_history_summarize=os.getenv("FPF_HISTORY_SUMMARIZE", "1").strip().lower() not in {"0", "false", "no"},
+        fpf_memory_ttl_s=float(os.getenv("FPF_MEMORY_TTL_S", "3600")),
+        fpf_memory_max_threads=int(os.getenv("FPF_MEMORY_MAX_THREADS", "500")),
+        fpf_memory_max_bytes=int(os.getenv("FPF_MEMORY_MAX_BYTES", "0")),
+        fpf_graph_mode=os.getenv("FPF_GRAPH_MODE", "two_stage"),
+        fpf_context_packing=os.getenv("FPF_CONTEXT_PACKING", "1").strip().lower() not in {"0", "false", "no"},
+        fpf_context_token_budget=int(os.getenv("FPF_CONTEXT_TOKEN_BUDGET", "1500")),
+        fpf_context_dedup_threshold=float(os.getenv("FPF_CONTEXT_DEDUP_THRESHOLD", "0.8")),
+        fpf_retrieval_cache_size=int(os.getenv("FPF_RETRIEVAL_CACHE_SIZE", "1024")),
+        fpf_retrieval_cache_ttl_s=float(os.getenv("FPF_RETRIEVAL_CACHE_TTL_S", "3600")),
+        fpf_gate_enabled=os.getenv("FPF_GATE_ENABLED", "1").strip().lower() not in {"0", "false", "no"},
+        fpf_gate_low=float(os.getenv("FPF_GATE_LOW", "0.30")),
+        fpf_gate_high=float(os.getenv("FPF_GATE_HIGH", "0.80")),
+        code_chunk_threshold_chars=int(os.getenv("CODE_CHUNK_THRESHOLD_CHARS", "12000")),
+        code_chunk_max_chars=int(os.getenv("CODE_CHUNK_MAX_CHARS", "6000")),
+        code_chunk_workers=int(os.getenv("CODE_CHUNK_WORKERS", "4")),
+        admission_global_concurrency=int(os.getenv("ADMISSION_GLOBAL_CONCURRENCY", "16")),
+        admission_key_concurrency=int(os.getenv("ADMISSION_KEY_CONCURRENCY", "4")),
+        admission_global_rate=float(os.getenv("ADMISSION_GLOBAL_RATE", "10")),
+        admission_global_burst=float(os.getenv("ADMISSION_GLOBAL_BURST", "40")),
+        admission_key_rate=float(os.getenv("ADMISSION_KEY_RATE", "1")),
+        admission_key_burst=float(os.getenv("ADMISSION_KEY_BURST", "10")),
+        admission_max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+        admission_max_wait_s=float(os.getenv("ADMISSION_MAX_WAIT_S", "10")),
     )
@@ -1,12 +1,120 @@
 from __future__ import annotations
 
+import atexit
 import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Any, Dict
+
+# Default cap for message payloads (LLM output, prompts, SQL) written to the logs
+_max_payload_chars = 500
+_listener: QueueListener | None = None
+_queue_handler: "_BoundedQueueHandler | None" = None
 
 
 def get_logger(name: str | None = None) -> logging.Logger:
     """Return a module-level logger.
 
-    Assumes root logger is configured in app.main. This helper avoids duplicating
-    basicConfig calls and keeps consistent formatting/handlers.
+    Assumes the root logger is configured once via `configure_logging` (called from app.main).
+    This helper avoids duplicating basicConfig calls and keeps consistent formatting/handlers.
     """
     return logging.getLogger(name)
+
+
+def truncate(text: Any, limit: int | None = None) -> str:
+    """Cap a log payload to `limit` characters (default `LOG_MAX_PAYLOAD_CHARS`), noting the original size."""
+    s = text if isinstance(text, str) else str(text)
+    limit = _max_payload_chars if limit is None else limit
+    if limit <= 0 or len(s) <= limit:
+        return s
+    return f"{s[:limit]}… [+{len(s) - limit} chars]"
+
+
+class _BoundedQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped (and counted) when the queue is full."""
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(q)
+        self._lock_dropped = threading.Lock()
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+def configure_logging(
+    log_dir: str | None = "/var/log/genai-portfolio",
+    level: int | str = logging.INFO,
+    queue_size: int = 10000,
+    max_payload_chars: int = 500,
+) -> None:
+    """Configure the root logger to hand records to a background thread.
+
+    Request threads only interpolate the message and enqueue it; formatting, the daily-rotated
+    file (UTC midnight, 14 backups) and stdout writes happen in a `QueueListener` thread.
+    The queue is bounded: under a log storm records are dropped instead of stalling requests.
+    Safe to call more than once (e.g. on uvicorn reload); later calls are no-ops.
+    """
+    global _listener, _queue_handler, _max_payload_chars
+    _max_payload_chars = max_payload_chars
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(
+        fmt="%(asctime)s %(levelname)s %(name)s %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%SZ",
+    )
+    # Force UTC timestamps in logs
+    formatter.converter = time.gmtime
+
+    handlers: list[logging.Handler] = []
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = TimedRotatingFileHandler(
+            filename=os.path.join(log_dir, "app.log"),
+            when="midnight",
+            interval=1,
+            utc=True,
+            backupCount=14,  # keep two weeks of logs
+            encoding="utf-8",
+        )
+        # Name rotated files with date suffix
+        file_handler.suffix = "%Y-%m-%d"
+        handlers.append(file_handler)
+    # Also log to stdout for container logs
+    handlers.append(logging.StreamHandler())
+    for h in handlers:
+        h.setFormatter(formatter)
+
+    # Replace handlers installed by basicConfig/uvicorn on the root logger; they would write synchronously
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    _queue_handler = _BoundedQueueHandler(queue.Queue(maxsize=max(1, queue_size)))
+    root.addHandler(_queue_handler)
+    _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, int]:
+    if _queue_handler is None:
+        return {"queued": 0, "capacity": 0, "dropped": 0}
+    q = _queue_handler.queue
+    return {"queued": q.qsize(), "capacity": q.maxsize, "dropped": _queue_handler.dropped}
@@ -40,6 +40,32 @@ def generate_documentation_template(prompt):
 ]).format_messages(prompt=prompt)
 
 
+def generate_test_chunk_template(chunk, context, part, total):
+    return  ChatPromptTemplate.from_messages([
+    ("system", """You are an expert test engineer.
+     
+    You receive one part of a larger source file. Generate unit tests for the definitions in this part only.
+    - Provide only test code without markdown fences.
+    - Include the imports your tests need; the parts will be merged into a single file.
+    - Use the file context for imports and shared names; do not test it."""),
+    ("human", "File context (imports and module-level code):\n{context}\n\nPart {part} of {total}. Help me generate tests for the following code: {chunk}")
+]).format_messages(chunk=chunk, context=context or "(none)", part=part, total=total)
+
+
+def generate_documentation_chunk_template(chunk, context, part, total):
+    return  ChatPromptTemplate.from_messages([
+    ("system", """You are an expert software engineer.
+     
+    You receive one part of a larger source file. Add high-quality documentation to this part only.
+    - Always adhere to the best quality and standard practices.
+    - Improve readability with docstrings/comments only; do not change logic.
+    - Return exactly this part, updated; do not repeat the file context.
+    - Provide only the updated code without markdown fences.
+    """),
+    ("human", "File context (for reference only):\n{context}\n\nPart {part} of {total}. Help me document the following code {chunk}")
+]).format_messages(chunk=chunk, context=context or "(none)", part=part, total=total)
+
+
 def generate_code_review_template(title: str, body: str, diff_summary: str):
     return ChatPromptTemplate.from_messages([
         ("system", """You are a senior staff engineer performing an in-depth code review.
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+
+T = TypeVar("T")
+
+
+def fingerprint(op: str, **parts: Any) -> str:
+    """Return a canonical fingerprint for an operation and its arguments.
+
+    Strings are stripped so trivially different submissions (trailing newline, padding) coalesce.
+    Secrets such as API keys should be passed already hashed via `secret_digest`.
+    """
+    normalized = {k: (v.strip() if isinstance(v, str) else v) for k, v in parts.items()}
+    raw = json.dumps({"op": op, "args": normalized}, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def secret_digest(secret: str | None) -> str:
+    """Short one-way digest so secrets can participate in keys without being stored."""
+    return hashlib.sha256((secret or "").strip().encode("utf-8")).hexdigest()[:16]
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one execution (thread-safe).
+
+    The first caller for a key runs `fn`; callers arriving while it is in flight block until it
+    finishes and receive the same result or exception. Nothing is cached: the key is dropped as
+    soon as the leader completes, so a later call triggers a fresh execution.
+
+    A waiter that gives up (timeout) does not affect the leader or the other waiters. Since the
+    leader runs in its own thread, cancelling an awaiting coroutine does not cancel the shared
+    execution either.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        # key -> [shared task, number of awaiting callers]
+        self._tasks: Dict[str, List[Any]] = {}
+        self._executions = 0
+        self._coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], T], timeout: float | None = None) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+            else:
+                call.waiters += 1
+                self._coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:  # noqa: BLE001 - propagate any failure to all waiters
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for an identical in-flight request.")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async variant: identical concurrent calls await one shared task.
+
+        Unlike `do`, the shared execution is cancellable: a caller that is cancelled (e.g. its
+        client disconnected) just stops waiting, and the task itself is cancelled once no caller
+        is left waiting for it. Must be used from a single event loop.
+        """
+        with self._lock:
+            entry = self._tasks.get(key)
+            if entry is None:
+                task = asyncio.ensure_future(fn())
+                entry = [task, 0]
+                self._tasks[key] = entry
+                self._executions += 1
+                task.add_done_callback(lambda _t, e=entry: self._drop_task(key, e))
+            else:
+                self._coalesced += 1
+            entry[1] += 1
+        task = entry[0]
+        try:
+            return await asyncio.shield(task)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                abandoned = entry[1] == 0
+            if abandoned and not task.done():
+                task.cancel()
+
+    def _drop_task(self, key: str, entry: List[Any]) -> None:
+        with self._lock:
+            if self._tasks.get(key) is entry:
+                del self._tasks[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._tasks),
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+            }
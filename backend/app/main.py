@@ -2,56 +2,49 @@ import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import asyncio
 import logging
-import os
-import time
-from logging.handlers import TimedRotatingFileHandler
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 load_dotenv()
 
 from .core.config import get_settings
-from .api.routes import router as api_router
+from .core.logger import configure_logging
+from .api.routes import review_queue, router as api_router
+from .services.github_app import close_shared_client
+from .services.rag_context import load_encoding
+from .services.vector_stores import CHEMBL_COLLECTION, VECTOR_STORES
 
 settings = get_settings()
 
-# Configure logging: daily rotation at UTC midnight, logs under fixed path
-LOG_DIR = "/var/log/genai-portfolio"
-os.makedirs(LOG_DIR, exist_ok=True)
-
+# Configure logging: daily rotation at UTC midnight, written off the request path by a queue listener
+configure_logging(
+    log_dir=settings.log_dir,
+    level=settings.log_level,
+    queue_size=settings.log_queue_size,
+    max_payload_chars=settings.log_max_payload_chars,
+)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
-# Avoid duplicate handlers if module reloaded (e.g., during uvicorn reload)
-if not any(isinstance(h, TimedRotatingFileHandler) for h in logger.handlers):
-    log_path = os.path.join(LOG_DIR, "app.log")
-    file_handler = TimedRotatingFileHandler(
-        filename=log_path,
-        when="midnight",
-        interval=1,
-        utc=True,
-        backupCount=14,  # keep two weeks of logs
-        encoding="utf-8",
-    )
-    # Name rotated files with date suffix
-    file_handler.suffix = "%Y-%m-%d"
+logger.info("Starting FastAPI app at %s", datetime.now(timezone.utc).isoformat())
 
-    formatter = logging.Formatter(
-        fmt="%(asctime)s %(levelname)s %(name)s %(message)s",
-        datefmt="%Y-%m-%dT%H:%M:%SZ",
-    )
-    # Force UTC timestamps in logs
-    formatter.converter = time.gmtime
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
-    # Also log to stdout for container logs
-    if not any(isinstance(h, logging.StreamHandler) for h in logger.handlers):
-        stream_handler = logging.StreamHandler()
-        stream_handler.setFormatter(formatter)
-        logger.addHandler(stream_handler)
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Open the shared Chroma client and load the indexes in the background; /api/ready reports progress
+    if settings.vector_warm_on_startup:
+        warm_task = asyncio.create_task(  # noqa: F841 - referenced for the app lifetime
+            asyncio.to_thread(VECTOR_STORES.warm, [settings.fpf_collection, CHEMBL_COLLECTION])
+        )
+    # The token counter's encoding may need a download: fetch it now rather than inside a request
+    encoding_task = asyncio.create_task(asyncio.to_thread(load_encoding))  # noqa: F841
+    review_queue.start()
+    yield
+    review_queue.stop()
+    close_shared_client()
 
-logger.info("Starting FastAPI app at %s", datetime.now(timezone.utc).isoformat())
-app = FastAPI(title=settings.app_name)
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,6 +14,8 @@ class GenerateResponse(BaseModel):
 
 class BasicRequest(BaseModel):
     code: str = Field(..., min_length=1)
+    # None = automatic (chunk only above the size threshold); True/False forces the mode
+    chunked: bool | None = None
 
 
 class BasicResponse(BaseModel):
@@ -35,6 +37,7 @@ class PullRequestInfo(BaseModel):
 
 class CodeReviewResponse(BaseModel):
     review: str
+    job_id: str | None = None
 
 class CodeReviewByUrlRequest(BaseModel):
     url: str
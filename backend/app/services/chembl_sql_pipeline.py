@@ -11,6 +11,11 @@ import uuid
 from langgraph.graph import StateGraph, END
 import logging
 
+from app.core.logger import get_logger, truncate
+from app.services.llm_call import invoke_at
+from app.services.vector_stores import VECTOR_STORES
+
+log = get_logger(__name__)
 
 DB_PATH = os.getenv("CHEMBL_SQLITE_PATH", "app/chembl/chembl_35.db")
 READ_ONLY_URI = f"file:{DB_PATH}?mode=ro"
@@ -75,9 +80,10 @@ class ChemblSqlPipeline:
         return (t[: max_len - 1] + "…") if len(t) > max_len else t
 
     def _log_step(self, step: str, **fields: Any) -> None:
-        parts = [f"{k}={v}" for k, v in fields.items() if v is not None]
-        message = " | ".join(parts)
-        logging.getLogger(__name__).info("[CHEMBL][pipe][%s] %s", step, message)
+        if not log.isEnabledFor(logging.INFO):
+            return
+        parts = [f"{k}={truncate(v)}" for k, v in fields.items() if v is not None]
+        log.info("[CHEMBL][pipe][%s] %s", step, " | ".join(parts))
 
     # ----------------- Public API -----------------
     def plan_and_synthesize(self, prompt: str) -> Tuple[str, List[dict]]:
@@ -466,14 +472,14 @@ class ChemblSqlPipeline:
         msg = [("system", system), ("user", prompt)]
         self._log_step("PLAN.start", prompt_len=len(prompt))
         try:
-            out = self.llm.invoke(msg)
+            out = invoke_at(self.llm, msg, "chembl.plan")
         except Exception as e:  # noqa: BLE001 - upstream API may raise various exceptions
             raise ValueError(f"Planner LLM error: {e}") from e
         return (getattr(out, "content", "") or "").strip()
 
     def _retrieve_related_texts(self, query: str, k: int = 5) -> List[str]:
         self._log_step("RETRIEVE.start", query_preview=self._preview(query), k=k)
-        docs = self.vector_store.similarity_search(query, k=k)
+        docs = VECTOR_STORES.search(self.vector_store, lambda: self.vector_store.similarity_search(query, k=k))
         seen: List[str] = []
         for d in docs:
             t = (d.metadata or {}).get("text") or getattr(d, "page_content", None)
@@ -521,7 +527,7 @@ class ChemblSqlPipeline:
             )
         self._log_step("SYNTH.start", prompt_len=len(prompt), tables=len(related_tables))
         try:
-            out = self.llm.invoke([("system", system), ("user", user)])
+            out = invoke_at(self.llm, [("system", system), ("user", user)], "chembl.synthesize")
         except Exception as e:  # noqa: BLE001 - upstream API may raise various exceptions
             raise ValueError(f"Synthesis LLM error: {e}") from e
         sql = (getattr(out, "content", "") or "").strip()
@@ -551,7 +557,7 @@ class ChemblSqlPipeline:
         )
         self._log_step("PROCESS.guidelines.start")
         try:
-            out = self.llm.invoke([("system", system), ("user", user)])
+            out = invoke_at(self.llm, [("system", system), ("user", user)], "chembl.guidelines")
         except Exception as e:  # noqa: BLE001 - upstream API may raise various exceptions
             raise ValueError(f"Guidelines LLM error: {e}") from e
         text = (getattr(out, "content", "") or "").strip()
@@ -585,7 +591,7 @@ class ChemblSqlPipeline:
             "User question:\n" + (prompt or "").strip()
         )
         try:
-            out = self.llm.invoke([("system", system), ("user", user)])
+            out = invoke_at(self.llm, [("system", system), ("user", user)], "chembl.classify")
         except Exception as e:  # noqa: BLE001 - upstream API may raise various exceptions
             self._log_step("CLASSIFY.error", error=str(e))
         else:
@@ -633,7 +639,7 @@ class ChemblSqlPipeline:
         )
         self._log_step("REPAIR.start")
         try:
-            out = self.llm.invoke([("system", system), ("user", user)])
+            out = invoke_at(self.llm, [("system", system), ("user", user)], "chembl.repair")
         except Exception as e:  # noqa: BLE001 - upstream API may raise various exceptions
             raise ValueError(f"Repair LLM error: {e}") from e
         sql = (getattr(out, "content", "") or "").strip()
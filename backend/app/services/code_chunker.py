@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import ast
+import io
+import re
+import tokenize
+from dataclasses import dataclass, field
+from typing import List
+
+_IMPORT_RE = re.compile(r"^(?:import\s+\S|from\s+\S+\s+import\s|#include\b|using\s+\S|package\s+\S|require\b)")
+_PY_IMPORT_RE = re.compile(r"^(?:import\s+\S|from\s+\S+\s+import\s)")
+
+
+@dataclass
+class CodeChunks:
+    """Source split into ordered chunks at top-level definition boundaries."""
+
+    chunks: List[str]
+    context: str = ""
+    is_python: bool = False
+    strategy: str = "single"
+    sizes: List[int] = field(default_factory=list)
+
+
+def _node_start(node: ast.stmt) -> int:
+    line = node.lineno
+    for deco in getattr(node, "decorator_list", []) or []:
+        line = min(line, deco.lineno)
+    return line - 1
+
+
+def _python_boundaries(code: str, lines: List[str], max_chars: int) -> List[int] | None:
+    """Return 0-based start lines of top-level statements, or None if not valid Python.
+
+    Classes larger than `max_chars` are additionally cut between their methods so a single
+    big class does not end up as one oversized chunk.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    starts: List[int] = []
+    for node in tree.body:
+        starts.append(_node_start(node))
+        if isinstance(node, ast.ClassDef) and node.end_lineno:
+            size = sum(len(ln) + 1 for ln in lines[node.lineno - 1 : node.end_lineno])
+            if size > max_chars:
+                starts.extend(_node_start(child) for child in node.body[1:])
+    return starts
+
+
+def _heuristic_boundaries(lines: List[str]) -> List[int]:
+    """Start lines of top-level blocks for brace- or indentation-based languages.
+
+    A boundary is a non-indented line reached while brace depth is zero. Closing braces/brackets
+    at column 0 belong to the previous block. String and comment contents are not parsed, so the
+    result is approximate; reassembly stays lossless either way.
+    """
+    starts: List[int] = []
+    depth = 0
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped and depth <= 0 and not line[:1].isspace() and stripped[0] not in "}])":
+            starts.append(i)
+        depth += line.count("{") - line.count("}")
+        depth = max(depth, 0)
+    return starts
+
+
+def _segments(lines: List[str], starts: List[int]) -> List[str]:
+    """Cut lines at `starts`, attaching leading comments/blank lines to the following segment."""
+    if not starts:
+        return ["\n".join(lines)] if lines else []
+    cuts = sorted(set(starts))
+    adjusted: List[int] = []
+    for s in cuts:
+        j = s
+        # Pull preceding top-level comment lines (and the blank lines around them) into this segment
+        while j > 0 and (lines[j - 1].startswith(("#", "//", "/*")) or not lines[j - 1].strip()):
+            if adjusted and j - 1 <= adjusted[-1]:
+                break
+            j -= 1
+        adjusted.append(j)
+    if adjusted[0] != 0:
+        adjusted.insert(0, 0)
+    adjusted.append(len(lines))
+    return ["\n".join(lines[a:b]) for a, b in zip(adjusted, adjusted[1:]) if a < b]
+
+
+def _pack(segments: List[str], max_chars: int) -> List[str]:
+    """Greedily merge adjacent segments up to `max_chars`; oversized segments stay whole.
+
+    Blank segments never form a chunk of their own (each chunk is one LLM call): they stay with
+    the chunk before them, or the first chunk with text, so reassembly stays lossless.
+    """
+    packed: List[str] = []
+    current: List[str] = []
+    size = 0
+    has_text = False
+    for seg in segments:
+        seg_len = len(seg) + 1
+        if has_text and seg.strip() and size + seg_len > max_chars:
+            packed.append("\n".join(current))
+            current, size, has_text = [], 0, False
+        current.append(seg)
+        size += seg_len
+        has_text = has_text or bool(seg.strip())
+    if has_text:
+        packed.append("\n".join(current))
+    elif current and packed:
+        packed[-1] = "\n".join([packed[-1], *current])
+    return packed
+
+
+def _context(lines: List[str], is_python: bool, max_chars: int = 1500) -> str:
+    pattern = _PY_IMPORT_RE if is_python else _IMPORT_RE
+    picked = [ln for ln in lines if pattern.match(ln)]
+    text = "\n".join(picked)
+    return text[:max_chars]
+
+
+def split_code(code: str, max_chars: int = 6000) -> CodeChunks:
+    """Split source into chunks of at most ~`max_chars` at top-level definitions.
+
+    Python is split with the AST; anything else uses brace/indentation heuristics. Joining the
+    chunks with "\\n" reproduces the original text exactly.
+    """
+    lines = (code or "").split("\n")
+    starts = _python_boundaries(code or "", lines, max_chars)
+    is_python = starts is not None
+    if starts is None:
+        starts = _heuristic_boundaries(lines)
+    chunks = _pack(_segments(lines, starts), max(1, int(max_chars)))
+    return CodeChunks(
+        chunks=chunks,
+        context=_context(lines, is_python),
+        is_python=is_python,
+        strategy="ast" if is_python else "heuristic",
+        sizes=[len(c) for c in chunks],
+    )
+
+
+def merge_documented(parts: List[str]) -> str:
+    """Reassemble documented chunks in their original order."""
+    return "\n\n".join(p.strip("\n") for p in parts if p and p.strip())
+
+
+def _python_imports(part: str) -> tuple[List[str], str] | None:
+    """(top-level import statements, remaining source) of a Python part, or None if it does not parse."""
+    try:
+        tree = ast.parse(part)
+    except SyntaxError:
+        return None
+    lines = part.split("\n")
+    taken: set[int] = set()
+    imports: List[str] = []
+    others = [n for n in tree.body if not isinstance(n, (ast.Import, ast.ImportFrom))]
+    shared = {n.lineno for n in others} | {n.end_lineno for n in others}
+    for node in tree.body:
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+        span = range(node.lineno, (node.end_lineno or node.lineno) + 1)
+        # `import os; x = 1` shares its line with another statement: leave it in place
+        if shared.intersection(span) or taken.intersection(span):
+            continue
+        taken.update(span)
+        imports.append("\n".join(lines[i - 1] for i in span))
+    body = "\n".join(line for i, line in enumerate(lines, start=1) if i not in taken)
+    return imports, body
+
+
+def _top_level_names(part: str) -> set[str] | None:
+    """Names of top-level functions and classes in a Python part, or None if it does not parse."""
+    try:
+        tree = ast.parse(part)
+    except SyntaxError:
+        return None
+    return {n.name for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+
+
+def _rename(part: str, renames: dict[str, str]) -> str:
+    """Rename identifiers in `part`, skipping attribute access (`obj.name`), methods/nested defs,
+    strings and comments."""
+    lines = part.split("\n")
+    hits: List[tuple[int, int, str]] = []
+    previous = None
+    for tok in tokenize.generate_tokens(io.StringIO(part).readline):
+        member = previous is not None and (
+            previous.string == "." or (previous.string in ("def", "class") and tok.line[:1].isspace())
+        )
+        if tok.type == tokenize.NAME and tok.string in renames and not member:
+            hits.append((tok.start[0] - 1, tok.start[1], tok.string))
+        if tok.type not in (tokenize.NL, tokenize.NEWLINE, tokenize.COMMENT):
+            previous = tok
+    for row, col, name in reversed(hits):
+        line = lines[row]
+        lines[row] = line[:col] + renames[name] + line[col + len(name):]
+    return "\n".join(lines)
+
+
+def _dedupe_definitions(parts: List[str]) -> List[str]:
+    """Give later parts' colliding top-level defs/classes a `_<part>` suffix so none is shadowed.
+
+    Each chunk's tests come from a separate LLM call and often reuse names such as `test_basic`,
+    fixtures or `TestFoo`; in one module the last definition would silently replace the others.
+    References inside the renamed part (calls, fixture parameters) are renamed with it.
+    """
+    names = [_top_level_names(p) for p in parts]
+    taken: set[str] = set().union(*(n for n in names if n))
+    seen: set[str] = set()
+    out: List[str] = []
+    for idx, (part, defined) in enumerate(zip(parts, names), start=1):
+        if not defined:
+            out.append(part)
+            continue
+        renames: dict[str, str] = {}
+        for name in sorted(defined & seen):
+            new = f"{name}_{idx}"
+            while new in taken:
+                new += "_"
+            taken.add(new)
+            renames[name] = new
+        seen |= defined
+        out.append(_rename(part, renames) if renames else part)
+    return out
+
+
+def merge_tests(parts: List[str], is_python: bool) -> str:
+    """Reassemble per-chunk test files in order; for Python, hoist and dedupe top-level imports.
+
+    Imports are taken from each part's AST, so multi-line (parenthesized) imports move whole;
+    top-level functions and classes whose names collide with an earlier part are renamed; a part
+    that does not parse is kept as it is.
+    """
+    parts = [p.strip("\n") for p in parts if p and p.strip()]
+    if not is_python:
+        return "\n\n".join(parts)
+    imports: List[str] = []
+    bodies: List[str] = []
+    for part in _dedupe_definitions(parts):
+        parsed = _python_imports(part)
+        if parsed is None:
+            bodies.append(part)
+            continue
+        part_imports, body = parsed
+        for stmt in part_imports:
+            if stmt not in imports:
+                imports.append(stmt)
+        bodies.append(body.strip("\n"))
+    # `from __future__` imports must stay first in the merged module
+    imports.sort(key=lambda stmt: not stmt.startswith("from __future__"))
+    head = "\n".join(imports)
+    return "\n\n\n".join([head] + [b for b in bodies if b]) if head else "\n\n\n".join(b for b in bodies if b)
@@ -1,21 +1,45 @@
 from __future__ import annotations
 
 import json
+import sqlite3
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 from typing import Any, Dict
 
 from fastapi import HTTPException
 
 from app.services.github_app import GitHubApp
 from app.services.llm_model import LLMModel
+from app.services.llm_call import invoke_at
+from app.services.rag_context import count_tokens
+from app.services.pr_diff import DiffCache, FileDiff, PRDiff
+from app.services.review_cache import ReviewCommentCache
+from app.services.review_queue import JobProgress
+from app.services.review_scanner import SCANNER_STATS, scan_patch, skip_reason
+from app.core.config import get_settings
 from app.core.logger import get_logger
 
+_settings = get_settings()
+
+_PATTERN_CHECKS = "hardcoded secrets, eval/exec, shell=True, os.system, pickle.loads, verify=False"
+
+
+def _pattern_checks_instruction() -> str:
+    """Prompt sentence for the rule scanner's patterns: skip them when it runs, look for them when it is off."""
+    if _settings.review_scanner:
+        return f"Pattern checks ({_PATTERN_CHECKS}) run separately; do not repeat them."
+    return f"Also flag {_PATTERN_CHECKS}."
+
 
 class CodeReviewController:
     """Coordinates webhook verification, parsing, LLM review, and posting as GitHub App bot."""
 
-    def __init__(self, llm: LLMModel, gh_app: GitHubApp) -> None:
+    def __init__(self, llm: LLMModel, gh_app: GitHubApp, review_cache: ReviewCommentCache | None = None) -> None:
         self.llm = llm
         self.gh_app = gh_app
+        self.review_cache = review_cache
+        self.diff_cache = DiffCache(_settings.review_diff_cache_size)
         self.log = get_logger(__name__)
 
     def parse_payload(self, raw_body: bytes, form_or_query_payload: str | None) -> Dict[str, Any]:
@@ -52,6 +76,7 @@ class CodeReviewController:
             "body": pr.get("body") or "",
             "base_branch": (pr.get("base") or {}).get("ref"),
             "head_branch": (pr.get("head") or {}).get("ref"),
+            "head_sha": (pr.get("head") or {}).get("sha"),
             "diff_url": pr.get("diff_url"),
             "repository_full": repo_obj.get("full_name"),
             "owner": owner_obj.get("login"),
@@ -80,60 +105,165 @@ class CodeReviewController:
                 self.llm.check_model_running(env_key)
         return self.llm.generate_code_review(title, body, diff_summary)
 
+    def run_review(self, ctx: Dict[str, Any], progress: JobProgress | None = None) -> Dict[str, Any]:
+        """Review job body (run by the review queue workers): review the PR diff, then post it.
+
+        The diff is fetched once (cached per head SHA). The summary review and the inline
+        comments are both generated from it, concurrently. On `synchronize`, when an earlier
+        review of the PR is on record, only files whose patch changed since then are reviewed;
+        a push that changes no patch posts nothing. Stages (`diff`, `summary`, `inline`, `post`)
+        are reported to `progress`.
+        """
+        progress = progress or JobProgress()
+        with progress.stage("diff"):
+            diff = self.fetch_diff(ctx)
+        changed = None
+        previous = None
+        if (ctx.get("action") or "").lower() == "synchronize" and self.review_cache is not None and diff is not None:
+            previous = self.review_cache.last_reviewed(self._repo_key(ctx), int(ctx["pr_number"]))
+        if previous is not None:
+            prev_sha, prev_hashes = previous
+            fingerprints = diff.fingerprints()
+            changed = [path for path, digest in fingerprints.items() if prev_hashes.get(path) != digest]
+            if not changed:
+                self.log.info("[CODE-REVIEW] synchronize: no patch changed since %s; nothing to review", prev_sha[:7])
+                self.review_cache.record_review(self._repo_key(ctx), int(ctx["pr_number"]), ctx.get("head_sha"), fingerprints)
+                return {"skipped": "no changed patches", "files": len(fingerprints)}
+            self.review_cache.count("incremental_reviews")
+
+        diff_summary = self.diff_summary(ctx)
+        if diff is not None:
+            diff_summary += "\n" + diff.summary_text(
+                _settings.review_summary_diff_chars, only_paths=changed, max_changes=_settings.review_max_file_changes
+            )
+        if previous is not None:
+            diff_summary += f"\nIncremental review: only files changed since {previous[0][:7]} are shown."
+        # The inline prompts get the PR description as context, so they need not wait for the summary
+        context = f"{ctx.get('title') or ''}\n{ctx.get('body') or ''}"
+
+        t0 = time.perf_counter()
+
+        def _staged(name: str, fn, *args):
+            with progress.stage(name):
+                return fn(*args)
+
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="review-stage") as stages:
+            summary = stages.submit(
+                _staged, "summary", self.generate_review_text, ctx["title"], ctx.get("body", ""), diff_summary
+            )
+            inline = (
+                stages.submit(_staged, "inline", self._build_inline_comments, ctx, context, diff, changed)
+                if diff is not None else None
+            )
+            review_text = summary.result()
+            comments = inline.result() if inline is not None else []
+        self.log.info("[CODE-REVIEW] Generated review for: %s in %.1fs", ctx["title"], time.perf_counter() - t0)
+        with progress.stage("post"):
+            self._post_review(ctx, review_text, comments, diff)
+        self.log.info(
+            "[CODE-REVIEW] Post attempted on %s/%s#%s", ctx.get("owner"), ctx.get("repo"), ctx.get("pr_number")
+        )
+        result: Dict[str, Any] = {"review_chars": len(review_text), "inline_comments": len(comments)}
+        if changed is not None:
+            result["changed_files"] = len(changed)
+        return result
+
     def try_post_review(self, ctx: Dict[str, Any], review_text: str) -> None:
+        """Post `review_text` with inline comments generated from the PR diff (sequential path)."""
         owner = ctx.get("owner")
         repo = ctx.get("repo")
         pr_number = ctx.get("pr_number")
         if owner and repo and pr_number:
+            diff = self.fetch_diff(ctx)
             # Build minimal inline comments if possible
-            comments = self._build_inline_comments(ctx, review_text)
-            self.log.info("[CODE-REVIEW] Inline comments prepared: %d", len(comments))
-            if comments:
-                preview = [{"path": c.get("path"), "position": c.get("position")} for c in comments[:3]]
-                self.log.debug("[CODE-REVIEW] Inline preview (first 3): %s", preview)
-            try:
+            comments = self._build_inline_comments(ctx, review_text, diff) if diff is not None else []
+            self._post_review(ctx, review_text, comments, diff)
+
+    def _post_review(self, ctx: Dict[str, Any], review_text: str, comments: list[dict], diff: PRDiff | None) -> None:
+        owner = ctx.get("owner")
+        repo = ctx.get("repo")
+        pr_number = ctx.get("pr_number")
+        if not (owner and repo and pr_number):
+            return
+        self.log.info("[CODE-REVIEW] Inline comments prepared: %d", len(comments))
+        if comments:
+            preview = [{"path": c.get("path"), "position": c.get("position")} for c in comments[:3]]
+            self.log.debug("[CODE-REVIEW] Inline preview (first 3): %s", preview)
+        try:
+            self.gh_app.post_pull_request_review(
+                owner=str(owner),
+                repo=str(repo),
+                pr_number=int(pr_number),
+                body=review_text,
+                comments=comments if comments else None,
+            )
+            self.log.info("[CODE-REVIEW] Review posted (with inline comments).")
+        except RuntimeError as e:
+            # If inline positions are invalid (422), retry with summary-only review
+            if "422" in str(e):
+                self.log.warning("[CODE-REVIEW] Inline comments rejected by GitHub (422). Retrying without inline comments.")
                 self.gh_app.post_pull_request_review(
                     owner=str(owner),
                     repo=str(repo),
                     pr_number=int(pr_number),
                     body=review_text,
-                    comments=comments if comments else None,
+                    comments=None,
                 )
-                self.log.info("[CODE-REVIEW] Review posted (with inline comments).")
-            except RuntimeError as e:
-                # If inline positions are invalid (422), retry with summary-only review
-                if "422" in str(e):
-                    self.log.warning("[CODE-REVIEW] Inline comments rejected by GitHub (422). Retrying without inline comments.")
-                    self.gh_app.post_pull_request_review(
-                        owner=str(owner),
-                        repo=str(repo),
-                        pr_number=int(pr_number),
-                        body=review_text,
-                        comments=None,
-                    )
-                    self.log.info("[CODE-REVIEW] Review posted (summary-only).")
-                else:
-                    raise
+                self.log.info("[CODE-REVIEW] Review posted (summary-only).")
+            else:
+                raise
+        if self.review_cache is not None and diff is not None and diff.files:
+            self.review_cache.record_review(self._repo_key(ctx), int(pr_number), ctx.get("head_sha"), diff.fingerprints())
+
+    def fetch_diff(self, ctx: Dict[str, Any]) -> PRDiff | None:
+        """The PR's parsed diff, fetched once per head SHA; None if it cannot be fetched."""
+        owner, repo, pr_number = ctx.get("owner"), ctx.get("repo"), ctx.get("pr_number")
+        if not (owner and repo and pr_number):
+            return None
+        head_sha = ctx.get("head_sha")
+        key = (self._repo_key(ctx).lower(), int(pr_number), head_sha)
+        if head_sha:
+            cached = self.diff_cache.get(key)
+            if cached is not None:
+                return cached
+        try:
+            files = self.gh_app.get_pull_files(str(owner), str(repo), int(pr_number))
+        except (RuntimeError, ValueError, TypeError):
+            # If the file list cannot be fetched, fall back to summary-only review
+            return None
+        self.log.info("[CODE-REVIEW] PR files fetched: %d", len(files))
+        diff = PRDiff(head_sha=head_sha, files=[FileDiff.from_api(f) for f in files])
+        if head_sha:
+            self.diff_cache.put(key, diff)
+        return diff
+
+    @staticmethod
+    def _repo_key(ctx: Dict[str, Any]) -> str:
+        return f"{ctx.get('owner')}/{ctx.get('repo')}"
 
     # -------- Inline comments --------
-    def _build_inline_comments(self, ctx: Dict[str, Any], review_text: str) -> list[dict]:
+    def _build_inline_comments(
+        self,
+        ctx: Dict[str, Any],
+        context: str,
+        diff: PRDiff,
+        only_paths: list[str] | None = None,
+    ) -> list[dict]:
         """Use the LLM to generate targeted inline comments on added lines only.
 
         We number the unified diff lines to match GitHub's expected 'position' and provide the set
         of allowed positions (only '+' lines). The LLM must choose positions from that set.
-        """
-        owner = ctx.get("owner")
-        repo = ctx.get("repo")
-        pr_number = ctx.get("pr_number")
-        if not (owner and repo and pr_number):
-            return []
+        `only_paths` restricts the review to those files (incremental re-review). Files whose
+        patch was reviewed before reuse the cached comments instead of calling the LLM.
+        `context` (the PR description, or the summary review) is given to the model for prioritization.
 
-        try:
-            files = self.gh_app.get_pull_files(str(owner), str(repo), int(pr_number))
-        except (RuntimeError, ValueError, TypeError):
-            # If the file list cannot be fetched, fall back to summary-only review
+        Before any LLM call, non-reviewable files (lockfiles, vendored/generated/minified code,
+        oversized patches) are dropped and the local rule scanner flags risky added lines. Its
+        findings come first in each file's comments; a file already at the per-file cap from
+        findings alone is not sent to the LLM.
+        """
+        if not diff.files:
             return []
-        self.log.info("[CODE-REVIEW] PR files fetched: %d", len(files))
 
         # Ensure LLM is initialized (reuse OPENAI_API_KEY if needed)
         if getattr(self.llm, "llm", None) is None:
@@ -142,99 +272,301 @@ class CodeReviewController:
             if env_key:
                 self.llm.check_model_running(env_key)
 
-        inline: list[dict] = []
-        max_total = 10
-        max_per_file = 3
-        first_fallback: dict | None = None
-        for f in files:
-            if len(inline) >= max_total:
-                break
-            path = f.get("filename")
-            patch: str | None = f.get("patch")
-            if not path or not patch:
+        max_total = _settings.review_inline_max_total
+        max_per_file = _settings.review_inline_max_per_file
+        jobs: list[tuple[str, list[int], list[str]]] = []
+        patches: Dict[str, str] = {}
+        skipped: Dict[str, int] = {}
+        for f in diff.files:
+            reason = skip_reason(f.as_api(), _settings.review_max_file_changes) if _settings.review_prefilter else None
+            if reason is not None:
+                skipped[reason] = skipped.get(reason, 0) + 1
                 continue
-            # Compute allowed positions (only added lines) using GitHub's expected diff indexing:
-            # Count ONLY context (' '), additions ('+'), and deletions ('-') lines. Do NOT count hunk headers ('@@').
-            # This aligns with the PR review API's 'position' semantics per file.
-            lines = patch.splitlines()
-            allowed_positions: list[int] = []
-            numbered: list[str] = []
-            pos = 0
-            for line in lines:
-                if line.startswith("@@"):
-                    # hunk header; not counted in position index
-                    numbered.append(f"-----: {line}")
-                    continue
-                # Count only actual diff lines
-                if line[:1] in {" ", "+", "-"}:
-                    pos += 1
-                    if line.startswith("+") and not line.startswith("+++"):
-                        allowed_positions.append(pos)
-                    numbered.append(f"{pos:05d}: {line}")
+            if f.path and f.allowed_positions:
+                jobs.append((f.path, f.allowed_positions, f.numbered))
+                patches[f.path] = f.patch
+        if skipped:
+            self.log.info("[CODE-REVIEW] Pre-filter skipped %d file(s): %s", sum(skipped.values()), skipped)
+        if only_paths is not None:
+            wanted = set(only_paths)
+            kept = [job for job in jobs if job[0] in wanted]
+            if self.review_cache is not None:
+                self.review_cache.count("unchanged_skipped", len(jobs) - len(kept))
+            jobs = kept
+        findings: Dict[str, list[dict]] = {}
+        if _settings.review_scanner:
+            for path, _, _ in jobs:
+                hits = scan_patch(path, patches[path], max_per_file)
+                if hits:
+                    findings[path] = hits
+        SCANNER_STATS.record(skipped, [c for hits in findings.values() for c in hits], len(jobs))
+        if not jobs:
+            return []
+        first_path, first_allowed, _ = jobs[0]
+        first_fallback = {
+            "path": first_path,
+            "position": first_allowed[0],
+            "body": "Automated review: please double-check this change (see summary).",
+        }
+
+        # Files are reviewed concurrently, but results are consumed in file order so the
+        # max_total/max_per_file selection is the same as a sequential pass would make.
+        deadline = time.monotonic() + _settings.review_inline_deadline_s
+        pool = ThreadPoolExecutor(max_workers=max(1, _settings.review_inline_workers), thread_name_prefix="review-inline")
+        inline: list[dict] = []
+        try:
+            repo_key = self._repo_key(ctx)
+            digests = diff.fingerprints()
+            futures: list[Future] = []
+            pending: list[int] = []
+            for i, (path, allowed, numbered) in enumerate(jobs):
+                fut: Future = Future()
+                futures.append(fut)
+                if len(findings.get(path, ())) >= max_per_file:
+                    cached: list[dict] | None = []  # scanner findings already fill this file's comments
+                else:
+                    cached = self.review_cache.get_comments(repo_key, path, digests[path]) if self.review_cache else None
+                if cached is not None:
+                    fut.set_result(cached[:max_per_file])
                 else:
-                    # Any other header-like lines are not counted
-                    numbered.append(f"-----: {line}")
+                    pending.append(i)
+            self._submit_reviews(pool, [(i, jobs[i]) for i in pending], futures, repo_key, digests, context, max_per_file)
+            for i, fut in enumerate(futures):
+                try:
+                    per_file = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeout:
+                    # Deadline: keep whatever later files already finished (and all scanner findings)
+                    ready = [(j, f.result()) for j, f in enumerate(futures) if j >= i and f.done() and not f.exception()]
+                    self.log.warning(
+                        "[CODE-REVIEW] Inline deadline (%.0fs) hit; %d/%d files reviewed",
+                        _settings.review_inline_deadline_s, i + len(ready), len(futures),
+                    )
+                    done = dict(ready)
+                    for j in range(i, len(jobs)):
+                        merged = self._merge_findings(findings.get(jobs[j][0]), done.get(j), max_per_file)
+                        inline.extend(merged[: max_total - len(inline)])
+                    break
+                except Exception as e:  # noqa: BLE001 - a failed file (LLM call, cache write, ...) only skips itself
+                    self.log.warning("[CODE-REVIEW] Inline review of %s failed: %s", jobs[i][0], e)
+                    per_file = None
+                merged = self._merge_findings(findings.get(jobs[i][0]), per_file, max_per_file)
+                inline.extend(merged[: max_total - len(inline)])
+                if len(inline) >= max_total:
+                    break
+        finally:
+            # Unstarted files are dropped; in-flight calls finish in the background and are ignored
+            pool.shutdown(wait=False, cancel_futures=True)
 
-            if not allowed_positions:
-                continue
-            if first_fallback is None:
-                first_fallback = {
-                    "path": path,
-                    "position": allowed_positions[0],
-                    "body": "Automated review: please double-check this change (see summary).",
-                }
-
-            # Ask the LLM to produce at most max_per_file inline comments in strict JSON
-            prompt = (
-                "You are a senior code reviewer. Given a single-file unified diff, suggest at most "
-                f"{max_per_file} high-signal inline comments ONLY on added lines.\n"
-                "Focus on issues like secrets/tokens, unsafe patterns (eval/exec, subprocess shell=True, "
-                "os.system, pickle.loads), TLS verify=False, and clear bad practices.\n"
-                "Use the provided AllowedPositions (unified diff indexes) and choose positions strictly from it.\n"
-                "Return STRICT JSON with this shape: {\"comments\": [{\"position\": <int>, \"body\": \"<short suggestion>\"}, ...]}\n"
-                "Do not include code fences or any text outside JSON. Keep bodies concise (<= 200 chars).\n"
-                "Contextual Summary (may inform prioritization, do not reference it in comments):\n"
-                + (review_text[:300] if isinstance(review_text, str) else "")
-                + "\n"
-                f"Path: {path}\n"
-                f"AllowedPositions: {allowed_positions}\n"
-                "UnifiedDiffWithPositions:\n"
-                + "\n".join(numbered)
-            )
+        if not inline:
+            self.log.info("[CODE-REVIEW] Inline empty after LLM; adding single fallback inline comment.")
+            inline.append(first_fallback)
+        return inline
+
+    def _submit_reviews(
+        self,
+        pool: ThreadPoolExecutor,
+        pending: list[tuple[int, tuple[str, list[int], list[str]]]],
+        futures: list[Future],
+        repo_key: str,
+        digests: Dict[str, str],
+        review_text: str,
+        max_per_file: int,
+    ) -> None:
+        """Run the LLM reviews for `pending` files, resolving `futures[i]` with each file's comments.
+
+        Small diffs are packed into batches of up to `REVIEW_BATCH_TOKEN_BUDGET` diff tokens (one
+        call each); a batch of one, or batching disabled, uses the single-file prompt.
+        """
+        budget = _settings.review_batch_token_budget
+        if budget > 0 and len(pending) > 1:
+            costs = [count_tokens("\n".join(numbered)) + 20 for _, (_, _, numbered) in pending]
+            groups = self._pack_batches(costs, budget, max(1, _settings.review_batch_max_files))
+        else:
+            groups = [[k] for k in range(len(pending))]
 
+        def _run(group: list[int]) -> None:
+            members = [pending[k] for k in group]
             try:
-                resp = self.llm.llm.invoke(prompt)
-                text = getattr(resp, "content", str(resp)) or "{}"
-                self.log.debug("[CODE-REVIEW] LLM inline raw (trunc): %s...", text[:200].replace("\n", " "))
-                obj = self._safe_parse_json(text)
-                comments = obj.get("comments") if isinstance(obj, dict) else None
-                if not isinstance(comments, list):
-                    self.log.debug("[CODE-REVIEW] LLM inline: no comments array found.")
-                    continue
-                per_file: list[dict] = []
-                for c in comments:
-                    if not isinstance(c, dict):
-                        continue
-                    pos = c.get("position")
-                    body = c.get("body")
-                    if isinstance(pos, int) and pos in allowed_positions and isinstance(body, str) and body.strip():
-                        per_file.append({"path": path, "position": pos, "body": body.strip()})
-                    if len(per_file) >= max_per_file:
-                        break
-                self.log.info("[CODE-REVIEW] LLM inline accepted for %s: %d (allowed: %d)", path, len(per_file), len(allowed_positions))
-                inline.extend(per_file)
-            except (ValueError, TypeError):
-                self.log.warning("[CODE-REVIEW] LLM inline: parsing error; skipping file.")
-                continue
+                if len(members) == 1:
+                    i, (path, allowed, numbered) = members[0]
+                    results = {path: self._review_file_cached(
+                        repo_key, digests[path], path, allowed, numbered, review_text, max_per_file
+                    )}
+                else:
+                    results = self._review_batch_cached(
+                        repo_key, digests, [job for _, job in members], review_text, max_per_file
+                    )
+            except Exception as e:  # noqa: BLE001 - surfaced through the per-file futures
+                for i, _ in members:
+                    futures[i].set_exception(e)
+                return
+            for i, (path, _, _) in members:
+                futures[i].set_result(results.get(path))
+
+        if len(groups) < len(pending):
+            self.log.info("[CODE-REVIEW] Inline review: %d files in %d LLM calls", len(pending), len(groups))
+        for group in groups:
+            pool.submit(_run, group)
+
+    @staticmethod
+    def _merge_findings(
+        findings: list[dict] | None, per_file: list[dict] | None, max_per_file: int
+    ) -> list[dict]:
+        """Scanner findings first, then LLM comments on positions not already flagged."""
+        flagged = [{k: c[k] for k in ("path", "position", "body")} for c in findings or []]
+        taken = {c["position"] for c in flagged}
+        return (flagged + [c for c in per_file or [] if c["position"] not in taken])[:max_per_file]
 
-            if len(inline) >= max_total:
+    def _review_file_cached(self, repo_key: str, digest: str, path: str, *args: Any) -> list[dict] | None:
+        per_file = self._review_file(path, *args)
+        if per_file is not None:
+            self._cache_comments(repo_key, path, digest, per_file)
+        return per_file
+
+    def _cache_comments(self, repo_key: str, path: str, digest: str, comments: list[dict]) -> None:
+        """Store a file's comments; a failed write only costs a cache miss next time."""
+        if self.review_cache is None:
+            return
+        try:
+            self.review_cache.put_comments(repo_key, path, digest, comments)
+        except sqlite3.Error as e:
+            self.log.warning("[CODE-REVIEW] Caching comments for %s failed: %s", path, e)
+
+    def _review_file(
+        self, path: str, allowed_positions: list[int], numbered: list[str], review_text: str, max_per_file: int
+    ) -> list[dict] | None:
+        """Ask the LLM for inline comments on one file; returns only comments on allowed positions.
+
+        None means the call or its parsing failed (as opposed to the model having nothing to say).
+        """
+        # Ask the LLM to produce at most max_per_file inline comments in strict JSON
+        prompt = (
+            "You are a senior code reviewer. Given a single-file unified diff, suggest at most "
+            f"{max_per_file} high-signal inline comments ONLY on added lines.\n"
+            "Focus on logic errors, missing error handling, resource leaks, concurrency and API misuse, "
+            "and clear bad practices. " + _pattern_checks_instruction() + "\n"
+            "Use the provided AllowedPositions (unified diff indexes) and choose positions strictly from it.\n"
+            "Return STRICT JSON with this shape: {\"comments\": [{\"position\": <int>, \"body\": \"<short suggestion>\"}, ...]}\n"
+            "Do not include code fences or any text outside JSON. Keep bodies concise (<= 200 chars).\n"
+            "Contextual Summary (may inform prioritization, do not reference it in comments):\n"
+            + (review_text[:300] if isinstance(review_text, str) else "")
+            + "\n"
+            f"Path: {path}\n"
+            f"AllowedPositions: {allowed_positions}\n"
+            "UnifiedDiffWithPositions:\n"
+            + "\n".join(numbered)
+        )
+
+        try:
+            resp = invoke_at(self.llm.llm, prompt, "review.inline")
+        except Exception as e:  # noqa: BLE001 - one failing file must not sink the whole review
+            self.log.warning("[CODE-REVIEW] LLM inline failed for %s: %s", path, e)
+            return None
+        try:
+            text = getattr(resp, "content", str(resp)) or "{}"
+            self.log.debug("[CODE-REVIEW] LLM inline raw (trunc): %s...", text[:200].replace("\n", " "))
+            obj = self._safe_parse_json(text)
+            comments = obj.get("comments") if isinstance(obj, dict) else None
+            if not isinstance(comments, list):
+                self.log.debug("[CODE-REVIEW] LLM inline: no comments array found.")
+                return None
+            return self._accept_comments(path, comments, allowed_positions, max_per_file)
+        except (ValueError, TypeError):
+            self.log.warning("[CODE-REVIEW] LLM inline: parsing error; skipping file.")
+            return None
+
+    def _accept_comments(
+        self, path: str, comments: list[Any], allowed_positions: list[int], max_per_file: int
+    ) -> list[dict]:
+        """Keep model comments that sit on an allowed position and have a body, up to `max_per_file`."""
+        allowed = set(allowed_positions)
+        per_file: list[dict] = []
+        for c in comments:
+            if not isinstance(c, dict):
+                continue
+            pos = c.get("position")
+            body = c.get("body")
+            if isinstance(pos, int) and pos in allowed and isinstance(body, str) and body.strip():
+                per_file.append({"path": path, "position": pos, "body": body.strip()})
+            if len(per_file) >= max_per_file:
                 break
-        if not inline and first_fallback is not None:
-            self.log.info("[CODE-REVIEW] Inline empty after LLM; adding single fallback inline comment.")
-            inline.append(first_fallback)
-        return inline
+        self.log.info("[CODE-REVIEW] LLM inline accepted for %s: %d (allowed: %d)", path, len(per_file), len(allowed_positions))
+        return per_file
+
+    # -------- Batched inline review (several small files per LLM call) --------
+    @staticmethod
+    def _pack_batches(costs: list[int], token_budget: int, max_files: int) -> list[list[int]]:
+        """Greedy, order-preserving grouping of file indexes so each group's diff tokens fit `token_budget`.
+
+        A file over the budget on its own gets a group of one (the single-file prompt).
+        """
+        batches: list[list[int]] = []
+        current: list[int] = []
+        used = 0
+        for i, cost in enumerate(costs):
+            if current and (used + cost > token_budget or len(current) >= max_files):
+                batches.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def _review_batch_cached(
+        self, repo_key: str, digests: Dict[str, str], batch: list[tuple[str, list[int], list[str]]], *args: Any
+    ) -> Dict[str, list[dict] | None]:
+        results = self._review_batch(batch, *args)
+        for path, per_file in results.items():
+            if per_file is not None:
+                self._cache_comments(repo_key, path, digests[path], per_file)
+        return results
+
+    def _review_batch(
+        self, batch: list[tuple[str, list[int], list[str]]], review_text: str, max_per_file: int
+    ) -> Dict[str, list[dict] | None]:
+        """One LLM call for several files; the response is keyed by path and validated per file.
+
+        A file missing from a well-formed response had nothing worth commenting ([]); a failed
+        call or unparsable response yields None for every file.
+        """
+        sections = "\n\n".join(
+            f"### Path: {path}\nAllowedPositions: {allowed}\nUnifiedDiffWithPositions:\n" + "\n".join(numbered)
+            for path, allowed, numbered in batch
+        )
+        prompt = (
+            f"You are a senior code reviewer. Below are {len(batch)} single-file unified diffs. For each file, "
+            f"suggest at most {max_per_file} high-signal inline comments ONLY on added lines.\n"
+            "Focus on logic errors, missing error handling, resource leaks, concurrency and API misuse, "
+            "and clear bad practices. " + _pattern_checks_instruction() + "\n"
+            "For each file, choose positions strictly from that file's AllowedPositions (unified diff indexes).\n"
+            "Return STRICT JSON keyed by path, listing only files that get comments: "
+            "{\"files\": {\"<path>\": {\"comments\": [{\"position\": <int>, \"body\": \"<short suggestion>\"}, ...]}}}\n"
+            "Do not include code fences or any text outside JSON. Keep bodies concise (<= 200 chars).\n"
+            "Contextual Summary (may inform prioritization, do not reference it in comments):\n"
+            + (review_text[:300] if isinstance(review_text, str) else "")
+            + "\n\n"
+            + sections
+        )
+        paths = [path for path, _, _ in batch]
+        try:
+            resp = invoke_at(self.llm.llm, prompt, "review.inline_batch")
+        except Exception as e:  # noqa: BLE001 - one failing batch must not sink the whole review
+            self.log.warning("[CODE-REVIEW] LLM inline batch failed for %d files: %s", len(batch), e)
+            return {path: None for path in paths}
+        text = getattr(resp, "content", str(resp)) or "{}"
+        obj = self._safe_parse_json(text)
+        by_path = obj.get("files") if isinstance(obj, dict) else None
+        if not isinstance(by_path, dict):
+            self.log.warning("[CODE-REVIEW] LLM inline batch: no files object; skipping %d files.", len(batch))
+            return {path: None for path in paths}
+        results: Dict[str, list[dict] | None] = {}
+        for path, allowed, _ in batch:
+            entry = by_path.get(path) or {}
+            comments = entry.get("comments") if isinstance(entry, dict) else entry
+            results[path] = self._accept_comments(path, comments if isinstance(comments, list) else [], allowed, max_per_file)
+        return results
 
-        
     def _first_added_position(self, patch: str) -> int | None:
         """Return the first position index suitable for PR review comment.
 
@@ -0,0 +1,222 @@
+"""Pluggable embedding backends for the Chroma collections.
+
+- `openai`: `OpenAIEmbeddings` (network round trip per query; needs an API key).
+- `local`:  `HashedNgramEmbeddings`, a NumPy feature-hashing embedder (word uni/bigrams plus
+  character 3–5-grams). It is deterministic, runs on CPU in well under a millisecond per query
+  and needs no network or model files.
+
+Vectors from different backends (or dimensions) are not comparable, so every collection is
+stamped with the backend that built it (`embedding` metadata, e.g. `local:hashed-ngram:768` or
+`openai:text-embedding-3-large`, plus `embedding_dim`). Queries are always embedded with the collection's own
+backend. `EMBEDDING_BACKEND` only selects what new or re-embedded collections use. Collections
+without a stamp predate this module and were built with OpenAI.
+
+Re-embed an existing collection (for example to run fully offline):
+    python -m app.services.embeddings --collection chembl_schema --backend local
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import get_settings
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+EMBEDDING_META_KEY = "embedding"
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class HashedNgramEmbeddings(Embeddings):
+    """Signed feature hashing of word and character n-grams into a fixed-size, L2-normalized vector."""
+
+    def __init__(self, dim: int = 768, char_ngrams: tuple[int, int] = (3, 5)) -> None:
+        self.dim = int(dim)
+        self.char_ngrams = char_ngrams
+
+    @property
+    def spec(self) -> str:
+        return f"local:hashed-ngram:{self.dim}"
+
+    def _features(self, text: str) -> List[tuple[str, float]]:
+        words = _WORD.findall(text.lower())
+        feats: List[tuple[str, float]] = [(f"w:{w}", 1.0) for w in words]
+        feats += [(f"b:{a} {b}", 0.7) for a, b in zip(words, words[1:])]
+        lo, hi = self.char_ngrams
+        for w in words:
+            padded = f" {w} "
+            for n in range(lo, min(hi, len(padded)) + 1):
+                feats += [(f"c:{padded[i:i + n]}", 0.3) for i in range(len(padded) - n + 1)]
+        return feats
+
+    def _embed(self, text: str) -> List[float]:
+        feats = self._features(text or "")
+        if not feats:
+            return [0.0] * self.dim
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f, _ in feats), dtype=np.uint32, count=len(feats))
+        weights = np.fromiter((w for _, w in feats), dtype=np.float32, count=len(feats))
+        # Top bit picks the sign so collisions cancel out on average instead of piling up
+        signs = np.where(hashes >> 31, 1.0, -1.0).astype(np.float32)
+        vec = np.bincount(hashes % self.dim, weights=weights * signs, minlength=self.dim)
+        norm = float(np.linalg.norm(vec))
+        return (vec / norm).tolist() if norm else vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def make_embeddings(backend: str | None = None, api_key: str | None = None, model: str | None = None, dim: int | None = None):
+    """Build an embedding function for `backend` ("openai" or "local"), defaulting to Settings."""
+    settings = get_settings()
+    backend = (backend or settings.embedding_backend).strip().lower()
+    if backend == "local":
+        return HashedNgramEmbeddings(dim=dim or settings.local_embedding_dim)
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(
+            model=model or settings.openai_embedding_model,
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=settings.openai_base_url,
+        )
+    raise ValueError(f"Unknown embedding backend: {backend!r} (expected 'openai' or 'local')")
+
+
+def embedding_spec(embeddings: Any) -> str:
+    """Stamp describing `embeddings`, recorded in the collection metadata."""
+    if isinstance(embeddings, HashedNgramEmbeddings):
+        return embeddings.spec
+    return f"openai:{getattr(embeddings, 'model', 'unknown')}"
+
+
+def embeddings_for_collection(metadata: Dict[str, Any] | None, api_key: str | None = None):
+    """Embedding function matching how a collection was built (see module docstring)."""
+    settings = get_settings()
+    stamp = (metadata or {}).get(EMBEDDING_META_KEY) or f"openai:{settings.openai_embedding_model}"
+    backend, _, rest = stamp.partition(":")
+    name, _, dim = rest.partition(":")
+    if backend == "local":
+        return HashedNgramEmbeddings(dim=int(dim or settings.local_embedding_dim))
+    if backend == "openai" and settings.embedding_backend == "local":
+        log.warning(
+            "[EMBEDDINGS] collection built with %s but EMBEDDING_BACKEND=local; queries still need OpenAI "
+            "until it is re-embedded (python -m app.services.embeddings --collection <name> --backend local)",
+            stamp,
+        )
+    return make_embeddings("openai", api_key=api_key, model=name or None)
+
+
+def stamp_collection(collection, spec: str, extra: Dict[str, Any] | None = None) -> None:
+    # hnsw:* keys are fixed at creation and may not be passed to modify()
+    meta = {k: v for k, v in (collection.metadata or {}).items() if not k.startswith("hnsw:")}
+    meta[EMBEDDING_META_KEY] = spec
+    meta.update(extra or {})
+    collection.modify(metadata=meta)
+
+
+# ----------------- Re-embedding -----------------
+def reembed_collection(
+    client, name: str, embeddings, batch_size: int = 256, manifest_dir: str | None = None
+) -> Dict[str, Any]:
+    """Rebuild collection `name` with `embeddings`, keeping ids, documents and metadata.
+
+    Vectors go into a staging collection that replaces the original only once it is complete,
+    so a failed run leaves the old index untouched. The swap renames the original to a backup,
+    renames staging into place and only then drops the backup; if the second rename fails the
+    original is renamed back. Running servers reopen the new collection on their next search
+    (`VectorStores.search`). When `manifest_dir` holds an ingestion manifest for the
+    collection, it is updated to the new backend.
+    """
+    t0 = time.perf_counter()
+    staging_name = f"{name}__reembed"
+    backup_name = f"{name}__previous"
+    existing = {c.name if hasattr(c, "name") else c for c in client.list_collections()}
+    if name not in existing and backup_name in existing:
+        # A previous run stopped between the two renames: put the original back first
+        client.get_collection(backup_name).modify(name=name)
+        log.warning("[EMBEDDINGS] restored %s from %s left by an interrupted swap", name, backup_name)
+    source = client.get_collection(name)
+    try:
+        client.delete_collection(staging_name)
+    except Exception:  # noqa: BLE001 - nothing left over from a previous run
+        pass
+    # Carry the source's own metadata over; of the hnsw:* creation settings only the distance applies
+    seed = {k: v for k, v in (source.metadata or {}).items() if not k.startswith("hnsw:")}
+    space = (source.metadata or {}).get("hnsw:space")
+    if space:
+        seed["hnsw:space"] = space
+    staging = client.create_collection(staging_name, metadata=seed or None)
+
+    total = source.count()
+    dim = None
+    for offset in range(0, total, batch_size):
+        page = source.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        vectors = embeddings.embed_documents([d or "" for d in page["documents"]])
+        dim = dim or (len(vectors[0]) if vectors else None)
+        staging.upsert(ids=page["ids"], embeddings=vectors, documents=page["documents"], metadatas=page["metadatas"])
+
+    version = (source.metadata or {}).get("version")
+    next_version = str(int(version) + 1) if str(version or "0").isdigit() else "1"
+    spec = embedding_spec(embeddings)
+    stamp_collection(staging, spec, {"version": next_version, "embedding_dim": dim or 0})
+    try:
+        client.delete_collection(backup_name)
+    except Exception:  # noqa: BLE001 - no backup left over
+        pass
+    source.modify(name=backup_name)
+    try:
+        staging.modify(name=name)
+    except Exception:
+        source.modify(name=name)
+        raise
+    client.delete_collection(backup_name)
+    if manifest_dir:
+        _update_ingest_manifest(manifest_dir, name, spec, next_version)
+    return {"collection": name, "documents": total, "dim": dim, "spec": spec,
+            "took_s": round(time.perf_counter() - t0, 2)}
+
+
+def _update_ingest_manifest(manifest_dir: str, name: str, spec: str, version: str) -> None:
+    """Keep the ingestion manifest in sync so the next ingest does not re-embed everything again."""
+    from app.services.fpf_ingest import MANIFEST_NAME, load_manifest, save_manifest
+
+    path = Path(manifest_dir) / f"{name}.{MANIFEST_NAME}"
+    if path.exists():
+        manifest = load_manifest(path)
+        manifest.update(embedding_model=spec, version=int(version))
+        save_manifest(path, manifest)
+
+
+def main(argv: List[str] | None = None) -> None:
+    settings = get_settings()
+    ap = argparse.ArgumentParser(description="Re-embed a Chroma collection with another embedding backend.")
+    ap.add_argument("--collection", required=True)
+    ap.add_argument("--backend", default=settings.embedding_backend, choices=["openai", "local"])
+    ap.add_argument("--dim", type=int, default=settings.local_embedding_dim, help="local backend dimension")
+    ap.add_argument("--persist-dir", default=settings.chroma_db_dir)
+    ap.add_argument("--batch-size", type=int, default=256)
+    args = ap.parse_args(argv)
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=args.persist_dir)
+    embeddings = make_embeddings(args.backend, dim=args.dim)
+    print(reembed_collection(client, args.collection, embeddings, args.batch_size, manifest_dir=args.persist_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""Incremental ingestion of the FPF website crawl into the Chroma collection used by the chatbot.
+
+Reads a local crawl dump (HTML / markdown / text files), chunks every page and identifies each
+chunk by a content hash. Only chunks that are new since the last run are embedded. They are
+embedded in batches with bounded concurrency and upserted, and chunks that disappeared are
+deleted. A manifest next to the index records, per source file, its hash and chunk ids, so an
+unchanged file costs one hash and no embedding call.
+
+Usage:
+    python -m app.services.fpf_ingest --source ./fpf_dump --base-url https://www.foodpackagingforum.org
+    python -m app.services.fpf_ingest --source ./fpf_dump --dry-run   # report what would change
+
+The collection's `version` metadata is bumped after every run that changed it. A running server
+re-reads the collection from the store at most every few seconds and drops its cached retrievals
+when the version changes (`app/services/retrieval_cache.py`).
+
+A collection that already holds vectors but has no manifest (built before this tool) is adopted:
+every page is embedded under content-hash ids, then the untracked legacy vectors are deleted.
+The index stays queryable throughout and ends up without duplicates.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+from app.core.config import get_settings
+from app.core.logger import get_logger
+from app.services.embeddings import embedding_spec, embeddings_for_collection, make_embeddings, stamp_collection
+
+log = get_logger(__name__)
+
+SOURCE_SUFFIXES = {".html", ".htm", ".md", ".markdown", ".txt"}
+MANIFEST_NAME = "fpf_manifest.json"
+_FRONT_MATTER = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.S)
+
+
+@dataclass
+class Page:
+    path: str  # relative to the dump root, used as the manifest key
+    url: str
+    title: str
+    text: str
+    sha256: str
+
+
+@dataclass
+class Chunk:
+    id: str
+    text: str
+    metadata: Dict[str, Any]
+
+
+@dataclass
+class IngestReport:
+    files_seen: int = 0
+    files_unchanged: int = 0
+    files_changed: int = 0
+    files_removed: int = 0
+    chunks_kept: int = 0
+    chunks_embedded: int = 0
+    chunks_deleted: int = 0
+    legacy_deleted: int = 0
+    embedding_calls: int = 0
+    took_s: float = 0.0
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ----------------- Reading the dump -----------------
+def _read_html(raw: str) -> Tuple[str, str, str]:
+    """Return (text, title, canonical url) of an HTML page, dropping navigation chrome."""
+    from lxml import html as lxml_html
+
+    doc = lxml_html.fromstring(raw)
+    for bad in doc.xpath("//script|//style|//noscript|//nav|//header|//footer|//form"):
+        bad.drop_tree()
+    title = (doc.findtext(".//title") or "").strip()
+    url = ""
+    for xp in ("//link[@rel='canonical']/@href", "//meta[@property='og:url']/@content"):
+        found = doc.xpath(xp)
+        if found:
+            url = str(found[0]).strip()
+            break
+    root = doc.xpath("//main") or doc.xpath("//article") or doc.xpath("//body") or [doc]
+    text = root[0].text_content()
+    return text, title, url
+
+
+def _read_markdown(raw: str) -> Tuple[str, str, str]:
+    """Return (text, title, url); `title:` / `url:` (or `source:`) are read from YAML front matter."""
+    title = url = ""
+    m = _FRONT_MATTER.match(raw)
+    if m:
+        for line in m.group(1).splitlines():
+            key, _, value = line.partition(":")
+            key, value = key.strip().lower(), value.strip().strip("'\"")
+            if key == "title":
+                title = value
+            elif key in {"url", "source"}:
+                url = value
+        raw = raw[m.end():]
+    if not title:
+        heading = re.search(r"^#\s+(.+)$", raw, re.M)
+        title = heading.group(1).strip() if heading else ""
+    return raw, title, url
+
+
+def _normalize_text(text: str) -> str:
+    lines = [re.sub(r"[ \t ]+", " ", ln).strip() for ln in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def iter_pages(source: Path, base_url: str = "") -> Iterable[Page]:
+    for path in sorted(source.rglob("*")):
+        if not path.is_file() or path.suffix.lower() not in SOURCE_SUFFIXES:
+            continue
+        rel = path.relative_to(source).as_posix()
+        raw = path.read_text(encoding="utf-8", errors="replace")
+        if path.suffix.lower() in {".html", ".htm"}:
+            text, title, url = _read_html(raw)
+        else:
+            text, title, url = _read_markdown(raw)
+        if not url and base_url:
+            # Crawl dumps mirror the site layout: foo/bar/index.html -> <base>/foo/bar/
+            slug = re.sub(r"(^|/)index\.[^/]+$", r"\1", rel)
+            slug = re.sub(r"\.(html?|md|markdown|txt)$", "", slug)
+            url = f"{base_url.rstrip('/')}/{slug}"
+        text = _normalize_text(text)
+        yield Page(path=rel, url=url or rel, title=title, text=text, sha256=_sha256(raw))
+
+
+# ----------------- Chunking -----------------
+def chunk_page(page: Page, chunk_chars: int = 1200, overlap: int = 150) -> List[Chunk]:
+    """Split a page into overlapping chunks whose ids are hashes of (url, content).
+
+    Identical content at the same URL always gets the same id, so unchanged chunks of an edited
+    page are neither re-embedded nor rewritten.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    if not page.text:
+        return []
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_chars, chunk_overlap=overlap)
+    chunks: List[Chunk] = []
+    seen: set[str] = set()
+    for i, text in enumerate(splitter.split_text(page.text)):
+        cid = _sha256(f"{page.url}\n{text}")[:32]
+        if cid in seen:  # repeated boilerplate within one page
+            continue
+        seen.add(cid)
+        meta = {"source": page.url, "title": page.title, "path": page.path, "chunk": i}
+        chunks.append(Chunk(id=cid, text=text, metadata=meta))
+    return chunks
+
+
+# ----------------- Manifest -----------------
+def load_manifest(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {"version": 0, "embedding_model": "", "documents": {}}
+    with path.open(encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# ----------------- Embedding + upsert -----------------
+def _batches(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def embed_chunks(embeddings, chunks: List[Chunk], batch_size: int, concurrency: int) -> List[List[float]]:
+    """Embed chunk texts in batches, at most `concurrency` requests in flight; order is preserved."""
+    batches = list(_batches([c.text for c in chunks], max(1, batch_size)))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(embeddings.embed_documents, batches))
+    return [vec for batch in results for vec in batch]
+
+
+def _all_ids(collection, page_size: int = 5000) -> List[str]:
+    ids: List[str] = []
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=len(ids))["ids"]
+        ids.extend(page)
+        if len(page) < page_size:
+            return ids
+
+
+def ingest(
+    source: Path,
+    collection,
+    embeddings,
+    manifest_path: Path,
+    embedding_model: str,
+    base_url: str = "",
+    chunk_chars: int = 1200,
+    overlap: int = 150,
+    batch_size: int = 64,
+    concurrency: int = 4,
+    dry_run: bool = False,
+    adopt_existing: bool = False,
+) -> IngestReport:
+    """Sync the collection with `source`; `adopt_existing` replaces untracked (pre-manifest) vectors."""
+    t0 = time.perf_counter()
+    report = IngestReport()
+    manifest = load_manifest(manifest_path)
+    documents: Dict[str, Any] = manifest.get("documents", {})
+    # A different embedding model makes every stored vector incomparable: re-embed everything
+    full_rebuild = bool(documents) and manifest.get("embedding_model") != embedding_model
+    if full_rebuild:
+        log.info("[FPF-INGEST] embedding model changed (%s -> %s); re-embedding all chunks",
+                 manifest.get("embedding_model"), embedding_model)
+
+    to_embed: List[Chunk] = []
+    to_delete: List[str] = []
+    new_documents: Dict[str, Any] = {}
+    for page in iter_pages(source, base_url):
+        report.files_seen += 1
+        previous = documents.get(page.path)
+        if previous and previous.get("sha256") == page.sha256 and not full_rebuild:
+            report.files_unchanged += 1
+            report.chunks_kept += len(previous.get("chunks", []))
+            new_documents[page.path] = previous
+            continue
+        report.files_changed += 1
+        chunks = chunk_page(page, chunk_chars, overlap)
+        old_ids = set() if full_rebuild else set((previous or {}).get("chunks", []))
+        new_ids = [c.id for c in chunks]
+        to_embed.extend(c for c in chunks if c.id not in old_ids)
+        report.chunks_kept += sum(1 for cid in new_ids if cid in old_ids)
+        to_delete.extend(cid for cid in (previous or {}).get("chunks", []) if cid not in set(new_ids))
+        new_documents[page.path] = {"sha256": page.sha256, "url": page.url, "chunks": new_ids}
+
+    for path, previous in documents.items():
+        if path not in new_documents:
+            report.files_removed += 1
+            to_delete.extend(previous.get("chunks", []))
+
+    # Ids hash (url, text), not the path: a renamed file or two files sharing a URL reference the
+    # same ids, so only ids no current file references are deleted, and each id is upserted once
+    tracked = {cid for doc in new_documents.values() for cid in doc["chunks"]}
+    to_delete = [cid for cid in dict.fromkeys(to_delete) if cid not in tracked]
+    to_embed = list({c.id: c for c in to_embed}.values())
+    if adopt_existing:
+        legacy = [cid for cid in _all_ids(collection) if cid not in tracked]
+        report.legacy_deleted = len(legacy)
+        to_delete.extend(legacy)
+
+    report.chunks_embedded = len(to_embed)
+    report.chunks_deleted = len(to_delete)
+    report.embedding_calls = -(-len(to_embed) // max(1, batch_size))
+    if dry_run:
+        report.took_s = time.perf_counter() - t0
+        return report
+
+    if to_embed:
+        vectors = embed_chunks(embeddings, to_embed, batch_size, concurrency)
+        for batch in _batches(list(zip(to_embed, vectors)), max(1, batch_size)):
+            collection.upsert(
+                ids=[c.id for c, _ in batch],
+                embeddings=[v for _, v in batch],
+                documents=[c.text for c, _ in batch],
+                metadatas=[c.metadata for c, _ in batch],
+            )
+    if to_delete:
+        for batch in _batches(to_delete, 500):
+            collection.delete(ids=batch)
+
+    changed = bool(to_embed or to_delete)
+    version = int(manifest.get("version", 0)) + (1 if changed else 0)
+    if changed:
+        extra = {"version": str(version)}
+        if to_embed:
+            extra["embedding_dim"] = len(vectors[0])
+        stamp_collection(collection, embedding_model, extra)
+    save_manifest(
+        manifest_path,
+        {"version": version, "embedding_model": embedding_model, "documents": new_documents},
+    )
+    report.took_s = time.perf_counter() - t0
+    return report
+
+
+def main(argv: List[str] | None = None) -> None:
+    settings = get_settings()
+    ap = argparse.ArgumentParser(description="Incrementally (re)index the FPF website crawl into Chroma.")
+    ap.add_argument("--source", required=True, type=Path, help="directory with the crawl dump (HTML/markdown)")
+    ap.add_argument("--base-url", default="", help="site root used to derive URLs for pages without a canonical link")
+    ap.add_argument("--persist-dir", default=settings.chroma_db_dir)
+    ap.add_argument("--collection", default=settings.fpf_collection)
+    ap.add_argument("--chunk-chars", type=int, default=1200)
+    ap.add_argument("--overlap", type=int, default=150)
+    ap.add_argument("--batch-size", type=int, default=64, help="texts per embedding request")
+    ap.add_argument("--concurrency", type=int, default=4, help="embedding requests in flight")
+    ap.add_argument("--dry-run", action="store_true", help="only report what would change")
+    ap.add_argument("--reset", action="store_true", help="drop the collection and manifest, then rebuild")
+    args = ap.parse_args(argv)
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=args.persist_dir)
+    manifest_path = Path(args.persist_dir) / f"{args.collection}.{MANIFEST_NAME}"
+    if args.reset and not args.dry_run:
+        if args.collection in {c.name if hasattr(c, "name") else c for c in client.list_collections()}:
+            client.delete_collection(args.collection)
+        manifest_path.unlink(missing_ok=True)
+    collection = client.get_or_create_collection(args.collection)
+    adopt = not manifest_path.exists() and collection.count() > 0
+    if adopt:
+        # Legacy ids never match the content-hash ids: rebuild in place instead of duplicating
+        log.info(
+            "[FPF-INGEST] %s has %d vectors but no manifest; adopting it (re-embedding every page, "
+            "then deleting the untracked vectors)", args.collection, collection.count(),
+        )
+    # An existing collection keeps the backend it was built with (switch with the re-embed tool)
+    if collection.count():
+        embeddings = embeddings_for_collection(collection.metadata)
+    else:
+        embeddings = make_embeddings()
+    report = ingest(
+        args.source,
+        collection,
+        embeddings,
+        manifest_path,
+        embedding_model=embedding_spec(embeddings),
+        base_url=args.base_url,
+        chunk_chars=args.chunk_chars,
+        overlap=args.overlap,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        dry_run=args.dry_run,
+        adopt_existing=adopt,
+    )
+    print(json.dumps(report.__dict__, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,247 @@
 import os
 import hmac
 import hashlib
-from typing import Optional, Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Iterator
+from urllib.parse import parse_qs, urlparse
 
 import httpx
 import logging
 
-API_ROOT = "https://api.github.com"
+from app.core.config import get_settings
+
 API_VER = "2022-11-28"
+# GitHub lists at most 3000 files per pull request (30 pages of 100)
+MAX_PAGES = 30
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def _h2_installed() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def shared_client() -> httpx.Client:
+    """Process-wide pooled client: connections (and TLS sessions) are reused across requests.
+
+    HTTP/2 is negotiated when `GITHUB_HTTP2` is on (`h2` comes with the `httpx[http2]`
+    dependency); with it off, or `h2` missing from a custom install, the pool uses HTTP/1.1 keep-alive.
+    """
+    global _client
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            settings = get_settings()
+            http2 = settings.github_http2 and _h2_installed()
+            if settings.github_http2 and not http2:
+                logging.getLogger(__name__).info("[GitHub] h2 not installed; using HTTP/1.1 keep-alive")
+            _client = httpx.Client(
+                base_url=settings.github_api_url,
+                http2=http2,
+                timeout=httpx.Timeout(settings.github_timeout_s, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=settings.github_max_connections,
+                    max_keepalive_connections=settings.github_max_connections,
+                    keepalive_expiry=60.0,
+                ),
+                headers={"Accept": "application/vnd.github+json", "X-GitHub-Api-Version": API_VER},
+            )
+        return _client
+
+
+def close_shared_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+class ConditionalCache:
+    """LRU of GitHub GET responses keyed by URL, revalidated with `If-None-Match`/`If-Modified-Since`.
+
+    Every read is still sent, so a PR that changed is never served stale; an unchanged one
+    comes back as a body-less 304, which GitHub does not count against the rate limit, and
+    the stored body is returned instead. Bounded by `GITHUB_CACHE_MB`.
+    """
+
+    KEPT_HEADERS = ("content-type", "link", "etag", "last-modified")
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[Dict[str, str], bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._counts = {"not_modified": 0, "fetched": 0, "evictions": 0}
+
+    def validators(self, key: str) -> Dict[str, str]:
+        """Conditional headers for a cached URL ({} when not cached)."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return {}
+        headers = entry[0]
+        out = {}
+        if "etag" in headers:
+            out["If-None-Match"] = headers["etag"]
+        if "last-modified" in headers:
+            out["If-Modified-Since"] = headers["last-modified"]
+        return out
+
+    def not_modified(self, key: str, request: httpx.Request) -> Optional[httpx.Response]:
+        """The stored response for a 304, or None if it was evicted meanwhile."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._counts["not_modified"] += 1
+        headers, content = entry
+        return httpx.Response(200, headers=headers, content=content, request=request)
+
+    def store(self, key: str, resp: httpx.Response) -> None:
+        with self._lock:
+            self._counts["fetched"] += 1
+        if not self.max_bytes or not (resp.headers.get("etag") or resp.headers.get("last-modified")):
+            return
+        headers = {k: resp.headers[k] for k in self.KEPT_HEADERS if k in resp.headers}
+        content = resp.content
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (headers, content)
+            self._bytes += len(content)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counts["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, **self._counts}
+
+
+class RateLimited(Exception):
+    """The GitHub quota is exhausted on a request path that must not wait for the reset."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"GitHub rate limit exhausted; resets in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# Set on request paths (see `fail_fast_on_rate_limit`); queue workers and scripts pace instead
+_FAIL_FAST: ContextVar[bool] = ContextVar("github_rate_limit_fail_fast", default=False)
+
+
+@contextmanager
+def fail_fast_on_rate_limit() -> Iterator[None]:
+    """Within this block (and `asyncio.to_thread` calls made from it) GitHub calls never sleep:
+    they skip pacing and raise `RateLimited` when the quota is exhausted.
+    """
+    token = _FAIL_FAST.set(True)
+    try:
+        yield
+    finally:
+        _FAIL_FAST.reset(token)
+
+
+class RateLimitTracker:
+    """Follows `X-RateLimit-*` response headers and paces requests before the limit runs out.
+
+    Above `reserve` remaining requests nothing waits. Below it, each request waits so that the
+    remaining budget is spread over the time left until reset (up to `max_delay_s` per request);
+    at zero it waits for the reset. Under `fail_fast_on_rate_limit` nothing waits: an exhausted
+    quota raises `RateLimited` instead, so request threads and admission slots are not held.
+    """
+
+    def __init__(self, reserve: int, max_delay_s: float) -> None:
+        self.reserve = reserve
+        self.max_delay_s = max_delay_s
+        self._lock = threading.Lock()
+        self._limit: Optional[int] = None
+        self._remaining: Optional[int] = None
+        self._reset_at = 0.0
+        self._throttled = 0
+        self._throttled_s = 0.0
+        self._rejected = 0
+
+    def update(self, headers: httpx.Headers) -> None:
+        remaining = headers.get("x-ratelimit-remaining")
+        if remaining is None or not remaining.isdigit():
+            return
+        with self._lock:
+            self._remaining = int(remaining)
+            limit = headers.get("x-ratelimit-limit")
+            self._limit = int(limit) if limit and limit.isdigit() else self._limit
+            reset = headers.get("x-ratelimit-reset")
+            self._reset_at = float(reset) if reset and reset.isdigit() else self._reset_at
+
+    def delay(self) -> float:
+        with self._lock:
+            remaining, window = self._remaining, self._reset_at - time.time()
+        if remaining is None or remaining > self.reserve or window <= 0:
+            return 0.0
+        return min(window / max(remaining, 1) if remaining > 0 else window, self.max_delay_s)
+
+    def wait(self) -> None:
+        delay = self.delay()
+        if delay <= 0:
+            return
+        if _FAIL_FAST.get():
+            with self._lock:
+                exhausted = self._remaining == 0
+                self._rejected += exhausted
+                retry_after = self._reset_at - time.time()
+            if exhausted:
+                raise RateLimited(retry_after)
+            return
+        with self._lock:
+            self._throttled += 1
+            self._throttled_s += delay
+        logging.getLogger(__name__).info(
+            "[GitHub] Rate limit low (%s left); waiting %.1fs", self._remaining, delay
+        )
+        time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self._limit,
+                "remaining": self._remaining,
+                "reset_in_s": max(0, round(self._reset_at - time.time())) if self._reset_at else None,
+                "throttled": self._throttled,
+                "throttled_s": round(self._throttled_s, 1),
+                "rejected": self._rejected,
+            }
+
+
+_settings = get_settings()
+HTTP_CACHE = ConditionalCache(int(_settings.github_cache_mb * 1024 * 1024))
+RATE_LIMIT = RateLimitTracker(_settings.github_rate_limit_reserve, _settings.github_rate_limit_max_delay_s)
+
+
+def github_stats() -> Dict[str, Any]:
+    """GitHub client counters for `/api/metrics`."""
+    return {"cache": HTTP_CACHE.stats(), "rate_limit": RATE_LIMIT.stats()}
+
+
+def _page_number(url: Optional[str]) -> Optional[int]:
+    if not url:
+        return None
+    values = parse_qs(urlparse(url).query).get("page")
+    return int(values[0]) if values and values[0].isdigit() else None
 
 
 class GitHubApp:
@@ -55,41 +289,87 @@ class GitHubApp:
         comments: Optional[list[dict]] = None,
         event: str = "COMMENT",
     ) -> Dict[str, Any]:
-        url = f"{API_ROOT}/repos/{owner}/{repo}/pulls/{pr_number}/reviews"
-        headers = {
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": API_VER,
-            "Authorization": f"token {self.personal_token}",
-        }
         payload: Dict[str, Any] = {"body": body, "event": event}
         if comments:
             payload["comments"] = comments
 
-        with httpx.Client(timeout=20) as client:
-            resp = client.post(url, headers=headers, json=payload)
+        RATE_LIMIT.wait()
+        resp = shared_client().post(
+            f"/repos/{owner}/{repo}/pulls/{pr_number}/reviews", headers=self._auth_headers(), json=payload
+        )
+        RATE_LIMIT.update(resp.headers)
         if resp.status_code >= 300:
             raise RuntimeError(f"Posting PR review failed: {resp.status_code} {resp.text}")
         return resp.json()
 
+    def get_pull_request(self, owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
+        """PR metadata: title, body, head/base refs and the head SHA."""
+        return self._get(f"/repos/{owner}/{repo}/pulls/{pr_number}", None, "Fetching PR failed").json()
+
     def get_pull_files(
         self,
         owner: str,
         repo: str,
         pr_number: int,
         per_page: int = 100,
+        page_concurrency: Optional[int] = None,
     ) -> list[Dict[str, Any]]:
-        """Fetch the list of changed files for a PR, including unified patches.
+        """Fetch every changed file of a PR, including unified patches.
 
-        Note: For large PRs this may be paginated; we fetch up to `per_page` (default 100).
+        Follows the `Link` header. When it advertises the last page and `page_concurrency`
+        (default `GITHUB_PAGE_CONCURRENCY`) is above 1, the remaining pages are fetched in
+        parallel over the shared pool; results keep GitHub's order either way.
         """
-        url = f"{API_ROOT}/repos/{owner}/{repo}/pulls/{pr_number}/files?per_page={per_page}"
-        headers = {
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": API_VER,
-            "Authorization": f"token {self.personal_token}",
-        }
-        with httpx.Client(timeout=30) as client:
-            resp = client.get(url, headers=headers)
+        path = f"/repos/{owner}/{repo}/pulls/{pr_number}/files"
+        if page_concurrency is None:
+            page_concurrency = get_settings().github_page_concurrency
+        return self._get_all_pages(path, {"per_page": per_page}, page_concurrency, "Fetching PR files failed")
+
+    # --------- HTTP helpers ---------
+    def _auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"token {self.personal_token}"}
+
+    def _get(self, url: str, params: Optional[Dict[str, Any]], error: str) -> httpx.Response:
+        """Conditional GET: a 304 for a cached URL returns the cached body (see `ConditionalCache`)."""
+        client = shared_client()
+        request = client.build_request("GET", url, params=params, headers=self._auth_headers())
+        key = str(request.url)
+        request.headers.update(HTTP_CACHE.validators(key))
+        RATE_LIMIT.wait()
+        resp = client.send(request)
+        RATE_LIMIT.update(resp.headers)
+        if resp.status_code == 304:
+            cached = HTTP_CACHE.not_modified(key, request)
+            if cached is not None:
+                return cached
+            # Evicted between the lookup and the 304: ask again without validators
+            request.headers.pop("If-None-Match", None)
+            request.headers.pop("If-Modified-Since", None)
+            resp = client.send(request)
+            RATE_LIMIT.update(resp.headers)
         if resp.status_code >= 300:
-            raise RuntimeError(f"Fetching PR files failed: {resp.status_code} {resp.text}")
-        return resp.json()
+            raise RuntimeError(f"{error}: {resp.status_code} {resp.text}")
+        HTTP_CACHE.store(key, resp)
+        return resp
+
+    def _get_all_pages(
+        self, path: str, params: Dict[str, Any], page_concurrency: int, error: str
+    ) -> list[Dict[str, Any]]:
+        first = self._get(path, params, error)
+        items = list(first.json())
+        last_page = min(_page_number(first.links.get("last", {}).get("url")) or 0, MAX_PAGES)
+        if page_concurrency > 1 and last_page > 1:
+            pages = range(2, last_page + 1)
+            with ThreadPoolExecutor(max_workers=min(page_concurrency, len(pages))) as pool:
+                for resp in pool.map(lambda page: self._get(path, {**params, "page": page}, error), pages):
+                    items.extend(resp.json())
+            return items
+
+        next_url = first.links.get("next", {}).get("url")
+        fetched = 1
+        while next_url and fetched < MAX_PAGES:
+            resp = self._get(next_url, None, error)
+            items.extend(resp.json())
+            next_url = resp.links.get("next", {}).get("url")
+            fetched += 1
+        return items
@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List
+
+from langchain_core.runnables import RunnableLambda
+
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+_TRANSIENT_NAMES = {
+    "APITimeoutError",
+    "APIConnectionError",
+    "RateLimitError",
+    "InternalServerError",
+    "ServiceUnavailableError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "RemoteProtocolError",
+}
+_TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Dedicated pool so hedges never compete with request handler threads
+_POOL_SIZE = 32
+_POOL = ThreadPoolExecutor(max_workers=_POOL_SIZE, thread_name_prefix="llm-call")
+_pool_lock = threading.Lock()
+_pool_busy = 0  # submitted and not finished (running or waiting for a thread)
+
+
+def _submit(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    global _pool_busy
+    with _pool_lock:
+        _pool_busy += 1
+    fut = _POOL.submit(fn, *args, **kwargs)
+    fut.add_done_callback(_release)
+    return fut
+
+
+def _release(_fut: Future) -> None:
+    global _pool_busy
+    with _pool_lock:
+        _pool_busy -= 1
+
+
+def _pool_saturated() -> bool:
+    with _pool_lock:
+        return _pool_busy >= _POOL_SIZE
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Best-effort classification of retryable upstream errors (timeouts, 429, 5xx, resets)."""
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    if type(exc).__name__ in _TRANSIENT_NAMES:
+        return True
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return isinstance(status, int) and status in _TRANSIENT_STATUS
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per call site."""
+
+    def __init__(self, window: int = 200) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, site: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(site, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, site: str, p: float, min_samples: int) -> float | None:
+        with self._lock:
+            samples = self._samples.get(site)
+            if not samples or len(samples) < min_samples:
+                return None
+            ordered = sorted(samples)
+        idx = min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))
+        return ordered[idx]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = {k: sorted(v) for k, v in self._samples.items()}
+        out: Dict[str, Dict[str, float]] = {}
+        for site, ordered in items.items():
+            n = len(ordered)
+            out[site] = {
+                "n": n,
+                "p50_ms": round(ordered[n // 2] * 1000, 1),
+                "p95_ms": round(ordered[min(n - 1, int(0.95 * (n - 1) + 0.5))] * 1000, 1),
+            }
+        return out
+
+
+class HedgeBudget:
+    """Token bucket that caps hedges to a fraction of calls.
+
+    Every call earns `ratio` tokens (up to `burst`) and every hedge spends one, so in the long
+    run at most `ratio` of calls are duplicated, even when the upstream slows down and every
+    call crosses the percentile.
+    """
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0) -> None:
+        self.ratio = max(0.0, ratio)
+        self.burst = burst
+        self._tokens = burst if self.ratio else 0.0
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class HedgedLLM:
+    """Wrap a chat model with per-site hedging and jittered retries.
+
+    `invoke(input, site=...)` starts the call; if it has not returned after the site's learned
+    latency percentile, an identical hedge request is fired and whichever finishes first wins.
+    Hedges are capped to `hedge_budget` of calls (see `HedgeBudget`), and the delay is measured
+    from when the primary starts running, not from when it was queued on the call pool.
+    Transient errors are retried with full-jitter exponential backoff. Sites without enough samples
+    are never hedged. Any other attribute is delegated to the wrapped model.
+
+    In the sync path a losing call that is already running cannot be interrupted; its result is
+    discarded. The async path (`ainvoke`) cancels the losing task outright.
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 0.95,
+        min_samples: int = 20,
+        min_hedge_delay_s: float = 0.25,
+        hedge_budget: float = 0.1,
+        max_retries: int = 2,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 8.0,
+        tracker: LatencyTracker | None = None,
+    ) -> None:
+        self._llm = llm
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.min_hedge_delay_s = min_hedge_delay_s
+        self.max_retries = max(0, max_retries)
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.tracker = tracker or LatencyTracker()
+        self.budget = HedgeBudget(hedge_budget)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            "calls": 0, "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0, "retries": 0, "failures": 0,
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for attributes not defined on the wrapper (e.g. get_name, model_name)
+        return getattr(self._llm, name)
+
+    @property
+    def wrapped(self) -> Any:
+        return self._llm
+
+    # ----------------- Public API -----------------
+    def invoke(self, input: Any, site: str = "default", **kwargs: Any) -> Any:
+        self._count("calls")
+        self.budget.earn()
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._hedged_call(input, site, kwargs)
+            except Exception as e:  # noqa: BLE001 - classified below, re-raised when not retryable
+                if attempt >= self.max_retries or not is_transient(e):
+                    self._count("failures")
+                    raise
+                delay = self._backoff(attempt)
+                self._count("retries")
+                log.warning("[LLM-CALL][%s] transient error (%s); retry %d in %.2fs", site, type(e).__name__, attempt + 1, delay)
+                time.sleep(delay)
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    async def ainvoke(self, input: Any, site: str = "default", **kwargs: Any) -> Any:
+        self._count("calls")
+        self.budget.earn()
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._ahedged_call(input, site, kwargs)
+            except Exception as e:  # noqa: BLE001 - classified below, re-raised when not retryable
+                if attempt >= self.max_retries or not is_transient(e):
+                    self._count("failures")
+                    raise
+                delay = self._backoff(attempt)
+                self._count("retries")
+                log.warning("[LLM-CALL][%s] transient error (%s); retry %d in %.2fs", site, type(e).__name__, attempt + 1, delay)
+                await asyncio.sleep(delay)
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, "sites": self.tracker.snapshot()}
+
+    # ----------------- Internals -----------------
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform over [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+
+    def _hedge_delay(self, site: str) -> float | None:
+        if not self.hedge_enabled:
+            return None
+        p = self.tracker.percentile(site, self.hedge_percentile, self.min_samples)
+        return None if p is None else max(self.min_hedge_delay_s, p)
+
+    def _may_hedge(self, site: str, pool: bool) -> bool:
+        """Whether a slow call may be duplicated now: budget left and, in the sync path, a free pool thread."""
+        if (pool and _pool_saturated()) or not self.budget.spend():
+            self._count("hedges_skipped")
+            log.debug("[LLM-CALL][%s] hedge skipped (budget or pool exhausted)", site)
+            return False
+        return True
+
+    def _hedged_call(self, input: Any, site: str, kwargs: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        delay = self._hedge_delay(site)
+        if delay is None:
+            result = self._llm.invoke(input, **kwargs)
+            self.tracker.record(site, time.perf_counter() - start)
+            return result
+
+        started = threading.Event()
+
+        def run_primary() -> Any:
+            started.set()
+            return self._llm.invoke(input, **kwargs)
+
+        primary = _submit(run_primary)
+        # Time spent waiting for a pool thread does not count toward the hedge delay
+        while not started.wait(0.05):
+            if primary.done():
+                break
+        start = time.perf_counter()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._may_hedge(site, pool=True):
+            result = primary.result()
+            self.tracker.record(site, time.perf_counter() - start)
+            return result
+
+        self._count("hedges")
+        log.info("[LLM-CALL][%s] hedging after %.0fms", site, delay * 1000)
+        hedge = _submit(self._llm.invoke, input, **kwargs)
+        pending: List[Future] = [primary, hedge]
+        first_error: BaseException | None = None
+        while pending:
+            done, rest = wait(pending, return_when=FIRST_COMPLETED)
+            pending = list(rest)
+            for fut in done:
+                err = fut.exception()
+                if err is None:
+                    for loser in pending:
+                        loser.cancel()
+                    if fut is hedge:
+                        self._count("hedge_wins")
+                    self.tracker.record(site, time.perf_counter() - start)
+                    return fut.result()
+                first_error = first_error or err
+        raise first_error  # type: ignore[misc]
+
+    async def _ahedged_call(self, input: Any, site: str, kwargs: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        delay = self._hedge_delay(site)
+        if delay is None:
+            result = await self._llm.ainvoke(input, **kwargs)
+            self.tracker.record(site, time.perf_counter() - start)
+            return result
+
+        primary = asyncio.ensure_future(self._llm.ainvoke(input, **kwargs))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._may_hedge(site, pool=False):
+                self._count("hedges")
+                log.info("[LLM-CALL][%s] hedging after %.0fms", site, delay * 1000)
+                tasks.add(asyncio.ensure_future(self._llm.ainvoke(input, **kwargs)))
+            first_error: BaseException | None = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    err = task.exception()
+                    if err is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        self.tracker.record(site, time.perf_counter() - start)
+                        return task.result()
+                    first_error = first_error or err
+            raise first_error  # type: ignore[misc]
+        finally:
+            # Cancel the loser (or everything, if we were cancelled ourselves)
+            for task in tasks:
+                task.cancel()
+
+
+def invoke_at(llm: Any, input: Any, site: str, **kwargs: Any) -> Any:
+    """Invoke `llm`, tagging the call site when it is a HedgedLLM (plain models are called as-is).
+
+    Extra kwargs (e.g. `response_format`) are forwarded to the model call.
+    """
+    if isinstance(llm, HedgedLLM):
+        return llm.invoke(input, site=site, **kwargs)
+    return llm.invoke(input, **kwargs)
+
+
+async def ainvoke_at(llm: Any, input: Any, site: str, **kwargs: Any) -> Any:
+    """Async counterpart of `invoke_at`."""
+    if isinstance(llm, HedgedLLM):
+        return await llm.ainvoke(input, site=site, **kwargs)
+    return await llm.ainvoke(input, **kwargs)
+
+
+def make_llm_node(
+    name: str,
+    llm: Any,
+    site: str,
+    prepare: Callable[[Any], Any],
+    finish: Callable[[Any, Any], Any],
+    on_error: Callable[[Exception, Any], Any] | None = None,
+    **kwargs: Any,
+) -> RunnableLambda:
+    """Build a graph node runnable with both a sync and an async body around one LLM call.
+
+    `prepare(state)` returns either a final state update (dict, no call needed) or
+    `(input, ctx)`; `finish(response, ctx)` turns the response into the update. When given,
+    `on_error(exc, ctx)` handles a failed call instead of raising. Only the call itself differs
+    between `graph.stream` (blocking `invoke_at`) and `graph.astream` (awaited `ainvoke_at`,
+    cancellable).
+    """
+
+    def run(state):
+        prepared = prepare(state)
+        if isinstance(prepared, dict):
+            return prepared
+        input, ctx = prepared
+        try:
+            response = invoke_at(llm, input, site, **kwargs)
+        except Exception as e:  # noqa: BLE001 - delegated to on_error when provided
+            if on_error is None:
+                raise
+            return on_error(e, ctx)
+        return finish(response, ctx)
+
+    async def arun(state):
+        prepared = prepare(state)
+        if isinstance(prepared, dict):
+            return prepared
+        input, ctx = prepared
+        try:
+            response = await ainvoke_at(llm, input, site, **kwargs)
+        except Exception as e:  # noqa: BLE001 - delegated to on_error when provided
+            if on_error is None:
+                raise
+            return on_error(e, ctx)
+        return finish(response, ctx)
+
+    return RunnableLambda(run, afunc=arun, name=name)
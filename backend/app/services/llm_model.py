@@ -1,19 +1,25 @@
 import re
 from fastapi import HTTPException
 from langchain_openai import ChatOpenAI
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from app.core.config import get_settings
+from app.core.singleflight import SingleFlight, fingerprint, secret_digest
 from app.core.prompts import (
     generate_code_template,
     generate_test_template,
     generate_documentation_template,
     generate_code_review_template,
+    generate_test_chunk_template,
+    generate_documentation_chunk_template,
 )
-from app.services.rag_model import build_langgraph, rag_answer_process
+from app.services.code_chunker import split_code, merge_documented, merge_tests
+from app.services.rag_model import arag_answer_process, build_langgraph, rag_answer_process
 from app.services.chembl_sql_pipeline import ChemblSqlPipeline
+from app.services.vector_stores import CHEMBL_COLLECTION, VECTOR_STORES
+from app.services.llm_call import HedgedLLM, LatencyTracker, invoke_at
+import asyncio
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 _settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -33,6 +39,10 @@ class LLMModel:
         self._chembl_sessions: dict[str, dict] = {}
         # Minimal concurrency safety for (re)initialization
         self._init_lock = threading.RLock()
+        # Concurrent identical requests share one upstream execution
+        self.inflight = SingleFlight()
+        # Per-call-site latency history survives key changes so hedging stays calibrated
+        self.latency = LatencyTracker()
 
     def check_model_running(self, api_key: str):
         # Normalize provided key
@@ -51,6 +61,7 @@ class LLMModel:
                     model=self.model,
                     temperature=self.temperature,
                     openai_api_key=incoming_key,
+                    base_url=_settings.openai_base_url,
                     timeout=15,  # shorter timeout for key validation
                 )
                 try:
@@ -63,17 +74,28 @@ class LLMModel:
 
                 # Commit the new key and initialize the rest only after validation succeeds
                 self.api_key = incoming_key
-                self.llm = temp_llm
-                self.embeddings = OpenAIEmbeddings(model=_settings.openai_embedding_model, api_key=incoming_key)
-                self.vector_store_website = Chroma(
-                    embedding_function=self.embeddings,
-                    persist_directory="app/chroma_db",
-                )
-                self.vector_store_sql = Chroma(
-                    collection_name="chembl_schema",
-                    embedding_function=self.embeddings,
-                    persist_directory="app/chroma_db",
+                # Retries are owned by the hedging wrapper, so the client itself does not retry
+                self.llm = HedgedLLM(
+                    ChatOpenAI(
+                        model=self.model,
+                        temperature=self.temperature,
+                        openai_api_key=incoming_key,
+                        base_url=_settings.openai_base_url,
+                        timeout=_settings.llm_timeout_s,
+                        max_retries=0,
+                    ),
+                    hedge_enabled=_settings.llm_hedge_enabled,
+                    hedge_percentile=_settings.llm_hedge_percentile,
+                    min_samples=_settings.llm_hedge_min_samples,
+                    hedge_budget=_settings.llm_hedge_budget,
+                    max_retries=_settings.llm_max_retries,
+                    tracker=self.latency,
                 )
+                # Shared, already-open collections; only their embedding function follows the key
+                VECTOR_STORES.bind_key(incoming_key)
+                self.vector_store_website = VECTOR_STORES.store(_settings.fpf_collection)
+                self.vector_store_sql = VECTOR_STORES.store(CHEMBL_COLLECTION)
+                self.embeddings = self.vector_store_website.embeddings
 
             # If model not yet initialized and no valid key provided now, error
             if not self.llm:
@@ -87,38 +109,73 @@ class LLMModel:
         self.check_model_running(api_key)
         if not prompt or len(prompt) < 1 or len(prompt) > 8000:
             raise HTTPException(status_code=400, detail="Please introduce code-related prompt")
-        processed_prompt = generate_code_template(language, prompt)
-        response = self.llm.invoke(processed_prompt)
-        text = response.content or ""
-        return self.strip_markdown_fences(text)
+
+        def _run() -> str:
+            processed_prompt = generate_code_template(language, prompt)
+            response = invoke_at(self.llm, processed_prompt, "generate")
+            text = response.content or ""
+            return self.strip_markdown_fences(text)
+
+        key = fingerprint("generate", prompt=prompt, language=language, key=secret_digest(api_key))
+        return self.inflight.do(key, _run)
 
     # ---------------------- Tests Generation ----------------------
-    def generate_tests(self, code: str):
+    def generate_tests(self, code: str, chunked: bool | None = None):
         logger.info("[LLM][tests] code.len=%d", len(code or ""))
         if not self.llm:
             raise HTTPException(status_code=400, detail="Model not initialized; generate code first or supply API key.")
+        if self._use_chunks(code, chunked):
+            return self._generate_chunked(code, generate_test_chunk_template, "tests")
         processed_prompt = generate_test_template(code)
-        response = self.llm.invoke(processed_prompt)
+        response = invoke_at(self.llm, processed_prompt, "tests")
         text = response.content or ""
         return self.strip_markdown_fences(text)
 
     # ---------------------- Documentation Generation ----------------------
-    def generate_docs(self, code: str):
+    def generate_docs(self, code: str, chunked: bool | None = None):
         logger.info("[LLM][docs] code.len=%d", len(code or ""))
         if not self.llm:
             raise HTTPException(status_code=400, detail="Model not initialized; generate code first or supply API key.")
+        if self._use_chunks(code, chunked):
+            return self._generate_chunked(code, generate_documentation_chunk_template, "docs")
         processed_prompt = generate_documentation_template(code)
-        response = self.llm.invoke(processed_prompt)
+        response = invoke_at(self.llm, processed_prompt, "docs")
         text = response.content or ""
         return self.strip_markdown_fences(text)
 
+    # ---------------------- Chunked (map-reduce) Generation ----------------------
+    def _use_chunks(self, code: str, chunked: bool | None) -> bool:
+        """Explicit flag wins; otherwise chunk only files above the configured threshold."""
+        if chunked is not None:
+            return chunked
+        return len(code or "") > _settings.code_chunk_threshold_chars
+
+    def _generate_chunked(self, code: str, template, kind: str) -> str:
+        """Split at top-level definitions, run one prompt per chunk concurrently, merge in order."""
+        split = split_code(code, _settings.code_chunk_max_chars)
+        total = len(split.chunks)
+        logger.info("[LLM][%s] chunked: strategy=%s parts=%d sizes=%s", kind, split.strategy, total, split.sizes)
+
+        def _one(idx: int) -> str:
+            prompt = template(split.chunks[idx], split.context, idx + 1, total)
+            response = invoke_at(self.llm, prompt, f"{kind}.chunk")
+            return self.strip_markdown_fences(response.content or "")
+
+        workers = max(1, min(_settings.code_chunk_workers, total))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"chunk-{kind}") as pool:
+            # map() yields in submission order, which keeps reassembly deterministic
+            parts = list(pool.map(_one, range(total)))
+        if kind == "tests":
+            return merge_tests(parts, split.is_python)
+        return merge_documented(parts)
+
     # ---------------------- Code Review Generation ----------------------
     def generate_code_review(self, title: str, body: str | None, diff_summary: str | None):
         logger.info("[LLM][code-review] title.len=%d body.len=%d", len(title or ""), len(body or ""))
         if not self.llm:
             raise HTTPException(status_code=400, detail="Model not initialized; supply API key via /generate first.")
         processed_prompt = generate_code_review_template(title, body or "", diff_summary or "")
-        response = self.llm.invoke(processed_prompt)
+        response = invoke_at(self.llm, processed_prompt, "review.summary")
         text = response.content or ""
         return self.strip_markdown_fences(text)
     
@@ -127,7 +184,17 @@ class LLMModel:
             logger.info("Initializing RAG chain")
             logger.info("Using model: %s", self.llm.get_name())
             self.initialize_chain()
-        return rag_answer_process(self.rag_chain, prompt, config_key)
+        key = fingerprint("rag", prompt=prompt, config_key=config_key, key=secret_digest(api_key))
+        return self.inflight.do(key, lambda: rag_answer_process(self.rag_chain, prompt, config_key))
+
+    async def agenerate_rag_response(self, prompt, api_key, config_key):
+        """Async path: runs the graph with `astream`; cancelling the caller cancels the graph."""
+        if not await asyncio.to_thread(self.check_model_running, api_key) or not self.rag_chain:
+            logger.info("Initializing RAG chain")
+            logger.info("Using model: %s", self.llm.get_name())
+            self.initialize_chain()
+        key = fingerprint("rag", prompt=prompt, config_key=config_key, key=secret_digest(api_key))
+        return await self.inflight.ado(key, lambda: arag_answer_process(self.rag_chain, prompt, config_key))
 
     def initialize_chain(self):
         self.rag_chain = build_langgraph(self.llm, self.vector_store_website)
@@ -137,7 +204,10 @@ class LLMModel:
         self.check_model_running(api_key)
         if not self.chembl_pipeline:
             self.chembl_pipeline = ChemblSqlPipeline(self.llm, self.vector_store_sql)
-        return self.chembl_pipeline.run_all(prompt, limit)
+        key = fingerprint("chembl", prompt=prompt, limit=limit, key=secret_digest(api_key))
+        state = self.inflight.do(key, lambda: self.chembl_pipeline.run_all(prompt, limit))
+        # Shallow copy: callers attach per-session fields to the returned state
+        return dict(state)
 
     def chembl_session_set(self, memory_id: str, state: dict):
         # Store last state for a session id
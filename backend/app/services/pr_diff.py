@@ -0,0 +1,150 @@
+"""One parsed view of a pull request's diff, shared by the summary and inline review stages.
+
+The PR's files are fetched once (paginated files API) and turned into `FileDiff` entries with
+the patch hash, the review-API positions of added lines and the numbered diff lines the inline
+prompts use. `DiffCache` keeps parsed diffs per (repository, PR, head SHA), so a retry or a
+re-trigger of the same head does not refetch or reparse.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.services.review_cache import patch_hash as hash_patch
+from app.services.review_scanner import skip_reason
+
+MAX_LISTED_FILES = 200
+
+
+def number_patch(patch: str) -> Tuple[List[int], List[str]]:
+    """(allowed positions, numbered diff lines) for one file's patch.
+
+    Positions follow the PR review API: count only context (' '), addition ('+') and deletion
+    ('-') lines, not hunk headers ('@@'). Only added lines are allowed comment targets.
+    """
+    allowed_positions: List[int] = []
+    numbered: List[str] = []
+    pos = 0
+    for line in patch.splitlines():
+        if line.startswith("@@"):
+            # hunk header; not counted in position index
+            numbered.append(f"-----: {line}")
+            continue
+        if line[:1] in {" ", "+", "-"}:
+            pos += 1
+            if line.startswith("+") and not line.startswith("+++"):
+                allowed_positions.append(pos)
+            numbered.append(f"{pos:05d}: {line}")
+        else:
+            # Any other header-like lines are not counted
+            numbered.append(f"-----: {line}")
+    return allowed_positions, numbered
+
+
+@dataclass
+class FileDiff:
+    path: str
+    status: str
+    patch: str
+    additions: int = 0
+    deletions: int = 0
+    changes: int = 0
+    patch_hash: str = ""
+    allowed_positions: List[int] = field(default_factory=list)
+    numbered: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_api(cls, f: Dict[str, Any]) -> "FileDiff":
+        patch = f.get("patch") or ""
+        allowed, numbered = number_patch(patch) if patch else ([], [])
+        return cls(
+            path=str(f.get("filename") or ""),
+            status=str(f.get("status") or "modified"),
+            patch=patch,
+            additions=int(f.get("additions") or 0),
+            deletions=int(f.get("deletions") or 0),
+            changes=int(f.get("changes") or 0),
+            patch_hash=hash_patch(patch) if patch else "",
+            allowed_positions=allowed,
+            numbered=numbered,
+        )
+
+    def as_api(self) -> Dict[str, Any]:
+        """Files-API shaped dict (what `skip_reason` and other per-file checks take)."""
+        return {"filename": self.path, "status": self.status, "patch": self.patch,
+                "additions": self.additions, "deletions": self.deletions, "changes": self.changes}
+
+
+@dataclass
+class PRDiff:
+    head_sha: Optional[str]
+    files: List[FileDiff]
+
+    def fingerprints(self) -> Dict[str, str]:
+        """{path: patch hash} for every file that has a patch."""
+        return {f.path: f.patch_hash for f in self.files if f.path and f.patch}
+
+    def summary_text(
+        self, max_chars: int = 12000, only_paths: Iterable[str] | None = None, max_changes: int = 2000
+    ) -> str:
+        """Compact diff for the summary prompt: a file list, then patches in file order up to `max_chars`.
+
+        Non-reviewable files (lockfiles, generated, more than `max_changes` changed lines, ...) are
+        listed but their patches left out; pass the same `max_changes` as the inline stage.
+        """
+        wanted = set(only_paths) if only_paths is not None else None
+        shown = [f for f in self.files if wanted is None or f.path in wanted]
+        added = sum(f.additions for f in shown)
+        deleted = sum(f.deletions for f in shown)
+        lines = [f"Files changed: {len(shown)} (+{added}/-{deleted})"]
+        lines += [f"- {f.path} ({f.status}, +{f.additions}/-{f.deletions})" for f in shown[:MAX_LISTED_FILES]]
+        if len(shown) > MAX_LISTED_FILES:
+            lines.append(f"- ... and {len(shown) - MAX_LISTED_FILES} more")
+        budget = max_chars - sum(len(line) + 1 for line in lines)
+        omitted = 0
+        for f in shown:
+            if not f.patch or skip_reason(f.as_api(), max_changes) is not None:
+                continue
+            block = f"\n--- {f.path}\n{f.patch}"
+            if len(block) > budget:
+                omitted += 1
+                continue
+            lines.append(block)
+            budget -= len(block) + 1
+        if omitted:
+            lines.append(f"\n({omitted} patch(es) omitted to fit the prompt)")
+        return "\n".join(lines)
+
+
+class DiffCache:
+    """Small LRU of parsed diffs keyed by (repository, PR, head SHA)."""
+
+    def __init__(self, max_entries: int = 64) -> None:
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, PRDiff]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: tuple) -> Optional[PRDiff]:
+        with self._lock:
+            diff = self._entries.get(key)
+            if diff is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return diff
+
+    def put(self, key: tuple, diff: PRDiff) -> None:
+        with self._lock:
+            self._entries[key] = diff
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self._hits, "misses": self._misses}
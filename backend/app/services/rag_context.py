@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence, Tuple
+
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+_WORD = re.compile(r"\w+")
+_encoding: Any = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def load_encoding() -> Any:
+    """Load the tiktoken encoding once (may download its BPE file); None when it is unavailable.
+
+    Called from the app's startup task so the download happens off the request path; concurrent
+    first callers wait for the load instead of falling back to the estimate.
+    """
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:  # noqa: BLE001 - missing package or offline BPE download
+                log.debug("[FPF][context] tiktoken unavailable (%s); estimating tokens", e)
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when its encoding is available locally, else a ~4 chars/token estimate."""
+    encoding = load_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _source_url(metadata: Dict[str, Any] | None) -> str:
+    meta = metadata or {}
+    for key in ("source", "url", "link", "href"):
+        value = meta.get(key)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return ""
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + n]) for i in range(len(words) - n + 1)}
+
+
+def _similarity(a: set, b: set) -> float:
+    """Overlap coefficient: 1.0 when one chunk's shingles are contained in the other's."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def legacy_serialize(docs: Sequence[Any]) -> str:
+    """The pre-packing `[RETRIEVED]` body (full metadata dict per chunk), used as the savings baseline."""
+    return "\n\n".join(f"Source: {doc.metadata}\nContent: {doc.page_content}" for doc in docs)
+
+
+@dataclass
+class PackedContext:
+    text: str
+    docs: List[Any] = field(default_factory=list)
+    scores: List[float] = field(default_factory=list)
+    tokens_before: int = 0
+    tokens_after: int = 0
+    duplicates: int = 0
+    over_budget: int = 0
+
+
+def pack_context(
+    scored: Sequence[Tuple[Any, float]],
+    token_budget: int = 1500,
+    dedup_threshold: float = 0.8,
+) -> PackedContext:
+    """Dedupe retrieved chunks, keep only their URL, and fit them to `token_budget` by relevance.
+
+    Chunks are taken in descending score order. A chunk is dropped when its text repeats (exactly
+    or with shingle overlap >= `dedup_threshold`) one already kept, or when it no longer fits the
+    budget. The top chunk is truncated rather than dropped so an answer stays possible.
+    """
+    ranked = sorted(scored, key=lambda pair: float(pair[1]), reverse=True)
+    packed = PackedContext(text="", tokens_before=count_tokens(legacy_serialize([d for d, _ in scored])))
+    seen_hashes: set[str] = set()
+    kept_shingles: List[set] = []
+    blocks: List[str] = []
+    used = 0
+    for doc, score in ranked:
+        content = (doc.page_content or "").strip()
+        digest = hashlib.sha1(" ".join(_WORD.findall(content.lower())).encode("utf-8")).hexdigest()
+        shingles = _shingles(content)
+        if digest in seen_hashes or any(_similarity(shingles, s) >= dedup_threshold for s in kept_shingles):
+            packed.duplicates += 1
+            continue
+        url = _source_url(getattr(doc, "metadata", None))
+        block = f"Source: {url}\n{content}" if url else content
+        cost = count_tokens(block) + 2
+        if used + cost > token_budget:
+            if blocks:
+                packed.over_budget += 1
+                continue
+            # Keep a truncated top chunk: roughly proportional cut in characters
+            keep_chars = max(1, int(len(block) * token_budget / max(cost, 1)))
+            block = block[:keep_chars]
+            cost = count_tokens(block)
+        seen_hashes.add(digest)
+        kept_shingles.append(shingles)
+        blocks.append(block)
+        packed.docs.append(doc)
+        packed.scores.append(float(score))
+        used += cost
+    packed.text = "\n\n".join(blocks)
+    packed.tokens_after = count_tokens(packed.text)
+    return packed
+
+
+class ContextStats:
+    """Aggregate prompt-token savings of context packing for `/api/metrics`."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "tokens_before": 0, "tokens_after": 0, "duplicates": 0, "over_budget": 0}
+
+    def record(self, packed: PackedContext) -> None:
+        with self._lock:
+            self._counts["requests"] += 1
+            self._counts["tokens_before"] += packed.tokens_before
+            self._counts["tokens_after"] += packed.tokens_after
+            self._counts["duplicates"] += packed.duplicates
+            self._counts["over_budget"] += packed.over_budget
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        before = counts["tokens_before"]
+        saved = before - counts["tokens_after"]
+        return {
+            **counts,
+            "tokens_saved": saved,
+            "saved_pct": round(100.0 * saved / before, 1) if before else 0.0,
+        }
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Tuple
+
+
+class ScoreGate:
+    """Decide answerability from retrieval relevance scores, deferring to the LLM judge only when unsure.
+
+    - best score >= `high`: answer directly (skip judge)
+    - best score <  `low`:  reject directly (skip judge)
+    - otherwise:            ambiguous band, ask the LLM judge
+
+    Judge verdicts are bucketed by score so thresholds can be recalibrated from `/api/metrics`:
+    a bucket whose verdicts are (almost) all "yes" can move above `high`, all "no" below `low`.
+    """
+
+    def __init__(self, low: float = 0.30, high: float = 0.80, enabled: bool = True) -> None:
+        self.low = low
+        self.high = max(high, low)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {"total": 0, "skip_accept": 0, "skip_reject": 0, "judged": 0, "no_scores": 0}
+        self._calibration: Dict[str, Dict[str, int]] = {}
+
+    def decide(self, scores: List[float]) -> Tuple[bool | None, str]:
+        """Return (can_answer, reason); can_answer is None when the LLM judge must decide."""
+        with self._lock:
+            self._counts["total"] += 1
+            if not self.enabled or not scores:
+                if self.enabled:
+                    self._counts["no_scores"] += 1
+                self._counts["judged"] += 1
+                return None, ""
+            best = max(scores)
+            if best >= self.high:
+                self._counts["skip_accept"] += 1
+                return True, f"score_gate best={best:.2f}>={self.high:.2f}"
+            if best < self.low:
+                self._counts["skip_reject"] += 1
+                return False, f"score_gate best={best:.2f}<{self.low:.2f}"
+            self._counts["judged"] += 1
+            return None, ""
+
+    def reject_reason(self, scores: List[float]) -> str | None:
+        """Single-pass variant: only a confident reject can skip the call (accepting still needs the answer)."""
+        with self._lock:
+            self._counts["total"] += 1
+            if self.enabled and scores and max(scores) < self.low:
+                self._counts["skip_reject"] += 1
+                return f"score_gate best={max(scores):.2f}<{self.low:.2f}"
+            self._counts["judged"] += 1
+            return None
+
+    def record_verdict(self, scores: List[float], can_answer: bool) -> None:
+        if not scores:
+            return
+        bucket = f"{int(max(scores) * 10) / 10:.1f}"
+        with self._lock:
+            b = self._calibration.setdefault(bucket, {"yes": 0, "no": 0})
+            b["yes" if can_answer else "no"] += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            counts = dict(self._counts)
+            calibration = {k: dict(v) for k, v in sorted(self._calibration.items())}
+        total = counts["total"] or 1
+        skipped = counts["skip_accept"] + counts["skip_reject"]
+        return {
+            **counts,
+            "skip_rate": round(skipped / total, 4),
+            "thresholds": {"low": self.low, "high": self.high, "enabled": self.enabled},
+            "judge_calibration": calibration,
+        }
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from app.core.logger import get_logger
+from app.services.llm_call import make_llm_node
+
+log = get_logger(__name__)
+
+SUMMARY_MARKER = "[SUMMARY]"
+# Per-turn scaffolding that is useless once the turn has been answered
+_TRANSIENT_MARKERS = ("[RETRIEVED]", "[ASSESS]")
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """In-memory checkpointer that bounds per-thread history and total thread count.
+
+    - Only the latest `keep_checkpoints` checkpoints per thread (and the blobs/writes they
+      reference) are retained; older history is never read by the chatbot.
+    - Threads idle for longer than `ttl_s` are evicted, and at most `max_threads` threads are
+      kept (least recently used first out). `max_bytes` optionally caps the serialized size.
+
+    The base saver is not thread-safe, so every storage access goes through one lock.
+    """
+
+    def __init__(
+        self,
+        ttl_s: float = 3600.0,
+        max_threads: int = 500,
+        keep_checkpoints: int = 2,
+        max_bytes: int = 0,
+        sweep_interval_s: float = 30.0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.ttl_s = ttl_s
+        self.max_threads = max(1, max_threads)
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.max_bytes = max(0, max_bytes)
+        self.sweep_interval_s = sweep_interval_s
+        self._lock = threading.RLock()
+        self._last_access: "OrderedDict[str, float]" = OrderedDict()
+        self._last_sweep = 0.0
+        self._evicted = 0
+
+    # ----------------- Access tracking -----------------
+    def _touch(self, thread_id: str) -> None:
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def get_tuple(self, config):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            out = super().put(config, checkpoint, metadata, new_versions)
+            self._touch(thread_id)
+            self._prune_thread(thread_id, config["configurable"].get("checkpoint_ns", ""))
+            self._maybe_sweep()
+            return out
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def list(self, config, **kwargs):
+        with self._lock:
+            # Materialize under the lock; the base implementation is a generator over live dicts
+            return iter(list(super().list(config, **kwargs)))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            super().delete_thread(thread_id)
+            self._last_access.pop(thread_id, None)
+
+    # ----------------- Bounding -----------------
+    def _prune_thread(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage.get(thread_id, {}).get(checkpoint_ns)
+        if not checkpoints or len(checkpoints) <= self.keep_checkpoints:
+            return
+        # Checkpoint ids are time-ordered (uuid6), so sorting keeps the newest at the end
+        ordered = sorted(checkpoints.keys())
+        drop, keep = ordered[: -self.keep_checkpoints], ordered[-self.keep_checkpoints :]
+        for cid in drop:
+            del checkpoints[cid]
+            self.writes.pop((thread_id, checkpoint_ns, cid), None)
+        referenced: set[tuple[str, Any]] = set()
+        for cid in keep:
+            saved = self.serde.loads_typed(checkpoints[cid][0])
+            referenced.update((ch, ver) for ch, ver in (saved.get("channel_versions") or {}).items())
+        for key in [k for k in self.blobs.keys() if k[0] == thread_id and k[1] == checkpoint_ns]:
+            if (key[2], key[3]) not in referenced:
+                del self.blobs[key]
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval_s and len(self._last_access) <= self.max_threads:
+            return
+        self._last_sweep = now
+        expired = [t for t, ts in self._last_access.items() if self.ttl_s > 0 and now - ts > self.ttl_s]
+        for thread_id in expired:
+            self._evict(thread_id)
+        while len(self._last_access) > self.max_threads:
+            self._evict(next(iter(self._last_access)))
+        if self.max_bytes:
+            while len(self._last_access) > 1 and self._approx_bytes() > self.max_bytes:
+                self._evict(next(iter(self._last_access)))
+
+    def _evict(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        self._last_access.pop(thread_id, None)
+        self._evicted += 1
+        log.debug("[FPF][memory] evicted thread %s", thread_id)
+
+    def _approx_bytes(self) -> int:
+        blob_bytes = sum(len(v[1]) for v in self.blobs.values() if isinstance(v, tuple) and len(v) > 1)
+        ckpt_bytes = sum(
+            len(saved[0][1]) + len(saved[1][1])
+            for ns in self.storage.values()
+            for cps in ns.values()
+            for saved in cps.values()
+        )
+        return blob_bytes + ckpt_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": len(self._last_access),
+                "evicted": self._evicted,
+                "approx_bytes": self._approx_bytes(),
+            }
+
+
+# ----------------- Conversation window -----------------
+def _is_transient(msg: BaseMessage) -> bool:
+    content = getattr(msg, "content", None)
+    return msg.type == "system" and isinstance(content, str) and content.startswith(_TRANSIENT_MARKERS)
+
+
+def _is_summary(msg: BaseMessage) -> bool:
+    content = getattr(msg, "content", None)
+    return msg.type == "system" and isinstance(content, str) and content.startswith(SUMMARY_MARKER)
+
+
+def _summary_prompt(previous_summary: str, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    transcript = "\n".join(
+        f"{'User' if m.type == 'human' else 'Assistant'}: {m.content}" for m in messages if isinstance(m.content, str)
+    )
+    sys = SystemMessage(
+        content=(
+            "Summarize the earlier part of a conversation between a user and an assistant about the Food Packaging Forum. "
+            "Keep facts, names, and open questions the user may refer back to. Be concise (max ~120 words); no preamble."
+        )
+    )
+    user = HumanMessage(
+        content=(f"Existing summary:\n{previous_summary or '(none)'}\n\nNew turns to fold in:\n{transcript}")
+    )
+    return [sys, user]
+
+
+def make_compact_node(llm, max_turns: int = 6, summarize: bool = True):
+    """Build a node that keeps conversation state bounded after each answered turn.
+
+    Drops the `[RETRIEVED]`/`[ASSESS]` scaffolding of finished turns and, once more than
+    `max_turns` user turns are stored, folds the oldest half into a single `[SUMMARY]` system
+    message (or simply drops them when summarization is disabled or fails).
+    """
+    max_turns = max(1, max_turns)
+
+    def prepare(state):
+        messages: List[BaseMessage] = list(state["messages"])
+        removals: List[Any] = [RemoveMessage(id=m.id) for m in messages if _is_transient(m) and m.id]
+        dialogue = [m for m in messages if not _is_transient(m) and not _is_summary(m)]
+        human_idx = [i for i, m in enumerate(dialogue) if m.type == "human"]
+        if len(human_idx) <= max_turns:
+            return {"messages": removals} if removals else {}
+
+        # Keep the newest half of the window verbatim; hysteresis avoids summarizing every turn
+        keep_turns = max(1, max_turns // 2)
+        cut = human_idx[-keep_turns]
+        old = dialogue[:cut]
+        summaries = [m for m in messages if _is_summary(m)]
+        previous = "\n".join(m.content[len(SUMMARY_MARKER):].strip() for m in summaries)
+        removals += [RemoveMessage(id=m.id) for m in old + summaries if m.id]
+        if not summarize:
+            return _compacted(removals, len(old), "")
+        prompt = _summary_prompt(previous, [m for m in old if m.type in {"human", "ai"}])
+        return prompt, (removals, len(old))
+
+    def finish(res, ctx):
+        removals, dropped = ctx
+        return _compacted(removals, dropped, (getattr(res, "content", "") or "").strip())
+
+    def on_error(e: Exception, ctx):
+        # History is best-effort; never fail the turn
+        log.warning("[FPF][memory] summarization failed, dropping old turns: %s", e)
+        removals, dropped = ctx
+        return _compacted(removals, dropped, "")
+
+    return make_llm_node("compact", llm, "fpf.summarize", prepare, finish, on_error=on_error)
+
+
+def _compacted(removals: List[Any], dropped: int, summary: str) -> dict:
+    new_msgs: List[Any] = [SystemMessage(content=f"{SUMMARY_MARKER} {summary}")] if summary else []
+    log.debug("[FPF][memory] compacted %d messages into summary=%s", dropped, bool(new_msgs))
+    return {"messages": removals + new_msgs}
+
+
+def answered_message(state) -> AIMessage | None:
+    """Return the latest AI answer in `state`, ignoring trailing system bookkeeping."""
+    for m in reversed(state["messages"]):
+        if m.type == "ai":
+            return m
+    return None
@@ -1,13 +1,40 @@
+import asyncio
 import json
 import re
 import logging
 import random
-from datetime import datetime, timezone
+import time
 from langchain_core.tools import tool
 from langchain_core.messages import SystemMessage, AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.graph import MessagesState, StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+
+from app.core.config import get_settings
+from app.core.logger import truncate
+from app.services.llm_call import make_llm_node
+from app.services.rag_memory import BoundedMemorySaver, answered_message, make_compact_node
+from app.services.rag_gate import ScoreGate
+from app.services.rag_context import ContextStats, legacy_serialize, pack_context
+from app.services.retrieval_cache import RetrievalCache
+from app.services.vector_stores import VECTOR_STORES
+
+_settings = get_settings()
+# Process-wide so its skip-rate metric covers every compiled graph
+SCORE_GATE = ScoreGate(
+    low=_settings.fpf_gate_low,
+    high=_settings.fpf_gate_high,
+    enabled=_settings.fpf_gate_enabled,
+)
+# FAQ-style questions repeat across users; shared by every graph over the website collection
+RETRIEVAL_CACHE = RetrievalCache(
+    max_entries=_settings.fpf_retrieval_cache_size,
+    ttl_s=_settings.fpf_retrieval_cache_ttl_s,
+)
+
+# Prompt-token savings of context packing across all requests
+CONTEXT_STATS = ContextStats()
+log = logging.getLogger(__name__)
 
 def _fallback_message() -> str:
     """Return a short variation of the no-information message."""
@@ -37,29 +64,111 @@ def _ensure_query_text(q) -> str:
                 return s
     return str(q)
 
-def make_retrieve_tool(vector_store):
-    def retrieve(state: MessagesState):
-        """Retrieve information for the latest user message and append a retrieval message.
-        Emits a SystemMessage starting with [RETRIEVED] and attaches docs in additional_kwargs.artifact.
-        """
+def make_retrieve_tool(vector_store, cache: RetrievalCache | None = None):
+    def _query(state: MessagesState) -> str:
         # Find the latest human message
         question = ""
         for m in reversed(state["messages"]):
             if m.type == "human":
                 question = m.content
                 break
-        qtext = _ensure_query_text(question).strip()
-        if not qtext:
-            return {"messages": [SystemMessage(content="[RETRIEVED]")]}  # no docs
+        return _ensure_query_text(question).strip()
 
-        retrieved_docs = vector_store.similarity_search(qtext, k=4)
-        serialized = "\n\n".join(
-            (f"Source: {doc.metadata}\nContent: {doc.page_content}")
-            for doc in retrieved_docs
+    def _message(scored) -> dict:
+        scores = [float(score) for _, score in scored]
+        if not _settings.fpf_context_packing:
+            retrieved_docs = [doc for doc, _ in scored]
+            serialized = legacy_serialize(retrieved_docs)
+            extra = {}
+        else:
+            # Deduped, URL-only, budgeted context; scores stay complete for the gate
+            packed = pack_context(scored, _settings.fpf_context_token_budget, _settings.fpf_context_dedup_threshold)
+            CONTEXT_STATS.record(packed)
+            retrieved_docs, serialized = packed.docs, packed.text
+            extra = {"context_tokens": {"before": packed.tokens_before, "after": packed.tokens_after}}
+            log.debug(
+                "[FPF][context] chunks=%d kept=%d dup=%d over_budget=%d tokens %d -> %d",
+                len(scored), len(packed.docs), packed.duplicates, packed.over_budget,
+                packed.tokens_before, packed.tokens_after,
+            )
+        msg = SystemMessage(
+            content=f"[RETRIEVED]\n{serialized}",
+            additional_kwargs={"artifact": retrieved_docs, "scores": scores, **extra},
         )
-        msg = SystemMessage(content=f"[RETRIEVED]\n{serialized}", additional_kwargs={"artifact": retrieved_docs})
         return {"messages": [msg]}
-    return retrieve
+
+    def retrieve(state: MessagesState):
+        """Retrieve information for the latest user message and append a retrieval message.
+        Emits a SystemMessage starting with [RETRIEVED] and attaches docs in additional_kwargs.artifact
+        and their relevance scores (0..1, higher is closer) in additional_kwargs.scores.
+        """
+        qtext = _query(state)
+        if not qtext:
+            return {"messages": [SystemMessage(content="[RETRIEVED]")]}  # no docs
+
+        def _search():
+            return VECTOR_STORES.search(
+                vector_store, lambda: vector_store.similarity_search_with_relevance_scores(qtext, k=4)
+            )
+
+        scored = cache.get_or_search(vector_store, qtext, 4, _search) if cache is not None else _search()
+        return _message(scored)
+
+    async def aretrieve(state: MessagesState):
+        qtext = _query(state)
+        if not qtext:
+            return {"messages": [SystemMessage(content="[RETRIEVED]")]}  # no docs
+
+        async def _search():
+            return await VECTOR_STORES.asearch(
+                vector_store, lambda: vector_store.asimilarity_search_with_relevance_scores(qtext, k=4)
+            )
+
+        scored = await cache.aget_or_search(vector_store, qtext, 4, _search) if cache is not None else await _search()
+        return _message(scored)
+
+    return RunnableLambda(retrieve, afunc=aretrieve, name="retrieve")
+
+
+def _conversation_messages(state: MessagesState) -> list:
+    """Dialogue to send to the model: rolling summary first, then the recent turns.
+
+    Internal markers are excluded; the retrieved context is placed in the system prompt instead.
+    """
+    summary_messages = []
+    conversation_messages = []
+    for message in state["messages"]:
+        if message.type == "system":
+            content = getattr(message, "content", None)
+            if isinstance(content, str) and content.startswith(("[ASSESS]", "[RETRIEVED]")):
+                continue
+            if isinstance(content, str) and content.startswith("[SUMMARY]"):
+                summary_messages.append(message)
+                continue
+            conversation_messages.append(message)
+        elif message.type == "human":
+            conversation_messages.append(message)
+        elif message.type == "ai" and not getattr(message, "tool_calls", None):
+            conversation_messages.append(message)
+    return summary_messages + conversation_messages
+
+
+def _latest_retrieval(state: MessagesState) -> tuple[list, list[float]]:
+    """Return the latest contiguous block of retrieval messages and their relevance scores."""
+    block = []
+    for message in reversed(state["messages"]):
+        content = getattr(message, "content", None)
+        if message.type == "tool" or (isinstance(content, str) and content.startswith("[RETRIEVED]")):
+            block.append(message)
+        elif block:
+            break
+    block = block[::-1]
+    scores: list[float] = []
+    for msg in block:
+        add_kwargs = getattr(msg, "additional_kwargs", None)
+        if isinstance(add_kwargs, dict) and isinstance(add_kwargs.get("scores"), list):
+            scores.extend(float(s) for s in add_kwargs["scores"])
+    return block, scores
 
 
 # Step 2: Execute the retrieval.
@@ -67,8 +176,8 @@ def make_retrieve_tool(vector_store):
 
 # Step 3: Generate a response using the retrieved content.
 def make_generate_node(llm):
-    def generate(state: MessagesState):
-        """Generate answer."""
+    def prepare(state: MessagesState):
+        """Build the answer prompt from the latest retrieval block."""
         # Get most recent contiguous block of retrieval messages (tool or [RETRIEVED] markers)
         recent_tool_messages = []
         started = False
@@ -107,27 +216,16 @@ def make_generate_node(llm):
             "\n\n"
             f"{docs_content}"
         )
-        conversation_messages = []
-        for message in state["messages"]:
-            if message.type == "system":
-                # Exclude internal assessment markers from prompt
-                content = getattr(message, "content", None)
-                if isinstance(content, str) and content.startswith("[ASSESS]"):
-                    continue
-                conversation_messages.append(message)
-            elif message.type == "human":
-                conversation_messages.append(message)
-            elif message.type == "ai" and not getattr(message, "tool_calls", None):
-                conversation_messages.append(message)
-        prompt = [SystemMessage(system_message_content)] + conversation_messages
-
-        # Run
-        response = llm.invoke(prompt)
+        prompt = [SystemMessage(system_message_content)] + _conversation_messages(state)
+        return prompt, None
+
+    def finish(response, _ctx):
         return {"messages": [response]}
-    return generate
 
-def make_assess_node(llm):
-    def assess(state: MessagesState):
+    return make_llm_node("generate", llm, "fpf.generate", prepare, finish)
+
+def make_assess_node(llm, gate: ScoreGate | None = None):
+    def prepare(state: MessagesState):
         """Decide if retrieved documents are sufficient to answer the question."""
         # Collect retrieval messages (tool or [RETRIEVED])
         recent_tool_messages = []
@@ -166,6 +264,13 @@ def make_assess_node(llm):
             marker = SystemMessage(content="[ASSESS] can_answer=false reason=no_docs")
             return {"messages": [marker]}
 
+        _, scores = _latest_retrieval(state)
+        if gate is not None:
+            gated, gate_reason = gate.decide(scores)
+            if gated is not None:
+                marker = SystemMessage(content=f"[ASSESS] can_answer={'true' if gated else 'false'} reason={gate_reason}")
+                return {"messages": [marker]}
+
         docs_content = "\n\n".join(msg.content for msg in tool_messages)
         # Get the last user question
         question = None
@@ -188,7 +293,9 @@ def make_assess_node(llm):
                 "Respond as JSON: {\"can_answer\": true|false, \"reason\": \"...\"}"
             )
         )
-        res = llm.invoke([sys, user])
+        return [sys, user], scores
+
+    def finish(res, scores):
         can_answer = False
         reason = ""
         if isinstance(res.content, str):
@@ -203,9 +310,12 @@ def make_assess_node(llm):
                 except json.JSONDecodeError:
                     # Leave defaults when parsing fails
                     pass
+        if gate is not None:
+            gate.record_verdict(scores, can_answer)
         marker = SystemMessage(content=f"[ASSESS] can_answer={'true' if can_answer else 'false'} reason={reason}")
         return {"messages": [marker]}
-    return assess
+
+    return make_llm_node("assess", llm, "fpf.assess", prepare, finish)
 
 def _assess_condition(state: MessagesState):
     # Route to generate if we see an assessment allowing it; otherwise END
@@ -215,25 +325,106 @@ def _assess_condition(state: MessagesState):
             return "generate" if "can_answer=true" in content else END
     return END
 
+def make_answer_node(llm, gate: ScoreGate | None = None):
+    """Single-pass alternative to assess → generate: one JSON call returns verdict and answer."""
+    def prepare(state: MessagesState):
+        """Judge sufficiency and answer in one completion; emits [ASSESS] plus the AI answer."""
+        tool_messages, scores = _latest_retrieval(state)
+        # "[RETRIEVED]" alone (no newline) means the retriever found nothing
+        docs_content = "\n\n".join(
+            m.content.partition("\n")[2] if m.content.startswith("[RETRIEVED]") else m.content
+            for m in tool_messages
+        ).strip()
+        if not docs_content:
+            return {"messages": [SystemMessage(content="[ASSESS] can_answer=false reason=no_docs")]}
+        gate_reason = gate.reject_reason(scores) if gate is not None else None
+        if gate_reason:
+            return {"messages": [SystemMessage(content=f"[ASSESS] can_answer=false reason={gate_reason}")]}
+
+        sys = SystemMessage(
+            content=(
+                "You are an assistant for question-answering tasks at FPF. "
+                "First decide strictly whether the retrieved context below contains sufficient, directly relevant "
+                "information to answer the user's latest question without hallucination. If it does, answer using only "
+                "that context and append the URL of the sources you used at the bottom of the answer.\n"
+                "Return ONLY a valid JSON object: {\"can_answer\": true|false, \"reason\": \"short\", \"answer\": \"...\"}. "
+                "When can_answer is false, leave answer empty.\n\n"
+                f"Retrieved context:\n{docs_content}"
+            )
+        )
+        return [sys] + _conversation_messages(state), scores
+
+    def finish(res, scores):
+        can_answer, reason, text = False, "", ""
+        content = res.content if isinstance(res.content, str) else ""
+        match = re.search(r"\{[\s\S]*\}", content)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+                can_answer = bool(data.get("can_answer", False))
+                reason = str(data.get("reason", ""))
+                text = str(data.get("answer") or "").strip()
+            except json.JSONDecodeError:
+                pass
+        can_answer = can_answer and bool(text)
+        if gate is not None:
+            gate.record_verdict(scores, can_answer)
+        marker = SystemMessage(content=f"[ASSESS] can_answer={'true' if can_answer else 'false'} reason={reason}")
+        if not can_answer:
+            return {"messages": [marker]}
+        return {"messages": [marker, AIMessage(content=text)]}
+
+    return make_llm_node(
+        "answer", llm, "fpf.answer", prepare, finish, response_format={"type": "json_object"}
+    )
+
+def _answer_condition(state: MessagesState):
+    # The single-pass node appends the AI answer only when it judged the context sufficient
+    last = state["messages"][-1] if state["messages"] else None
+    return "compact" if last is not None and last.type == "ai" else "no_answer"
+
 def make_no_answer_node():
     def no_answer(_state: MessagesState):
         # Friendly fallback when we cannot safely answer
         return {"messages": [AIMessage(content=_fallback_message())]}
     return no_answer
 
-def build_langgraph(llm, vector_store):
+def build_langgraph(llm, vector_store, mode: str | None = None):
+    """Compile the FPF graph.
+
+    mode "two_stage" (default): retrieve → assess (LLM judge) → generate | no_answer.
+    mode "single_pass": retrieve → answer (one call returning verdict + answer) → END | no_answer.
+    """
+    mode = (mode or _settings.fpf_graph_mode or "two_stage").strip().lower()
 
-    memory = MemorySaver()
+    memory = BoundedMemorySaver(
+        ttl_s=_settings.fpf_memory_ttl_s,
+        max_threads=_settings.fpf_memory_max_threads,
+        max_bytes=_settings.fpf_memory_max_bytes,
+    )
     graph_builder = StateGraph(MessagesState)
 
-    graph_builder.add_node(make_retrieve_tool(vector_store))
-    graph_builder.add_node(make_assess_node(llm))
-    graph_builder.add_node(make_generate_node(llm))
+    graph_builder.add_node(make_retrieve_tool(vector_store, RETRIEVAL_CACHE if _settings.fpf_retrieval_cache_size > 0 else None))
     graph_builder.add_node(make_no_answer_node())
-
+    graph_builder.add_node(
+        "compact",
+        make_compact_node(llm, _settings.fpf_history_max_turns, _settings.fpf_history_summarize),
+    )
     graph_builder.set_entry_point("retrieve")
-    graph_builder.add_edge("retrieve", "assess")
-    graph_builder.add_conditional_edges("assess", _assess_condition, {"generate": "generate", END: "no_answer"})
+
+    if mode == "single_pass":
+        graph_builder.add_node(make_answer_node(llm, SCORE_GATE))
+        graph_builder.add_edge("retrieve", "answer")
+        graph_builder.add_conditional_edges("answer", _answer_condition, {"compact": "compact", "no_answer": "no_answer"})
+    else:
+        graph_builder.add_node(make_assess_node(llm, SCORE_GATE))
+        graph_builder.add_node(make_generate_node(llm))
+        graph_builder.add_edge("retrieve", "assess")
+        graph_builder.add_conditional_edges("assess", _assess_condition, {"generate": "generate", END: "no_answer"})
+        graph_builder.add_edge("generate", "compact")
+    # Every answered turn ends by trimming per-turn scaffolding and folding old turns
+    graph_builder.add_edge("no_answer", "compact")
+    graph_builder.add_edge("compact", END)
 
     return graph_builder.compile(checkpointer=memory)
 
@@ -246,44 +437,74 @@ class FpfRagPipeline:
         self.graph = build_langgraph(llm, vector_store)
 
     def answer(self, question: str, config_key: str):
-        log = logging.getLogger(__name__)
-        last = None
-        for step in self.graph.stream(
+        return _stream_answer(self.graph, question, config_key)
+
+def rag_answer_process(graph_or_pipeline, question, config_key):
+    # Backwards-compatible wrapper: accept compiled graph or pipeline instance
+    if hasattr(graph_or_pipeline, "answer"):
+        return graph_or_pipeline.answer(question, config_key)
+    return _stream_answer(graph_or_pipeline, question, config_key)
+
+
+async def arag_answer_process(graph_or_pipeline, question, config_key):
+    """Async counterpart of `rag_answer_process` using `graph.astream`.
+
+    Retrieval and LLM calls are awaited, so cancelling the caller (e.g. on client disconnect)
+    cancels the in-flight node and its upstream request.
+    """
+    graph = getattr(graph_or_pipeline, "graph", graph_or_pipeline)
+    log = logging.getLogger(__name__)
+    debug = log.isEnabledFor(logging.DEBUG)
+    t0 = time.perf_counter()
+    last = None
+    steps = 0
+    try:
+        async for step in graph.astream(
             {"messages": [{"role": "user", "content": question}]},
             stream_mode="values",
             config={"configurable": {"thread_id": config_key}},
         ):
             last = step
-            msg = step["messages"][-1]
-            content = getattr(msg, "content", "")
-            # Print and log the step output (traceback of LLM answers)
-            ts = datetime.now(timezone.utc).isoformat()
-            print(f"[{ts}] [LANGGRAPH][{config_key}] {content[:500]}")
-            log.info("[LANGGRAPH][%s] %s", config_key, content)
+            steps += 1
+            if debug:
+                content = getattr(step["messages"][-1], "content", "")
+                log.debug("[LANGGRAPH][%s] %s", config_key, truncate(content))
+    except asyncio.CancelledError:
+        log.info("[LANGGRAPH][%s] cancelled after %d steps", config_key, steps)
+        raise
 
-        if not last:
-            return _fallback_message()
-        return last["messages"][-1].content
+    answer = answered_message(last) if last else None
+    log.info(
+        "[LANGGRAPH][%s] steps=%d answered=%s took_ms=%d",
+        config_key, steps, answer is not None, int((time.perf_counter() - t0) * 1000),
+    )
+    if answer is None:
+        return _fallback_message()
+    return answer.content
 
-def rag_answer_process(graph_or_pipeline, question, config_key):
-    # Backwards-compatible wrapper: accept compiled graph or pipeline instance
-    if hasattr(graph_or_pipeline, "answer"):
-        return graph_or_pipeline.answer(question, config_key)
-    graph = graph_or_pipeline
+
+def _stream_answer(graph, question, config_key):
     log = logging.getLogger(__name__)
+    debug = log.isEnabledFor(logging.DEBUG)
+    t0 = time.perf_counter()
     last = None
+    steps = 0
     for step in graph.stream(
         {"messages": [{"role": "user", "content": question}]},
         stream_mode="values",
         config={"configurable": {"thread_id": config_key}},
     ):
         last = step
-        msg = step["messages"][-1]
-        content = getattr(msg, "content", "")
-        ts = datetime.now(timezone.utc).isoformat()
-        print(f"[{ts}] [LANGGRAPH][{config_key}] {content[:500]}")
-        log.info("[LANGGRAPH][%s] %s", config_key, content)
+        steps += 1
+        if debug:
+            content = getattr(step["messages"][-1], "content", "")
+            log.debug("[LANGGRAPH][%s] %s", config_key, truncate(content))
 
-    if not last:
+    answer = answered_message(last) if last else None
+    log.info(
+        "[LANGGRAPH][%s] steps=%d answered=%s took_ms=%d",
+        config_key, steps, answer is not None, int((time.perf_counter() - t0) * 1000),
+    )
+    if answer is None:
         return _fallback_message()
-    return last["messages"][-1].content
+    return answer.content
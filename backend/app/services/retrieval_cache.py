@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+Scored = List[Tuple[Any, float]]
+
+
+def normalize_query(text: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive form of a question."""
+    t = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return t.rstrip(" ?!.")
+
+
+Fingerprint = Tuple[str, str, int, Any]
+
+
+def collection_version(vector_store: Any) -> Fingerprint:
+    """(collection name, id, document count, metadata 'version') — changes whenever the index is rebuilt.
+
+    The collection is re-fetched from the client: a long-lived handle's `metadata` is the model
+    cached when it was opened, so a `version` bump written by another process (`fpf_ingest`,
+    `embeddings`) would never show up on it. A rebuilt or swapped collection also gets a new id.
+    """
+    coll = getattr(vector_store, "_collection", None)
+    if coll is None:
+        return ("", "", -1, None)
+    name = getattr(coll, "name", "")
+    client = getattr(vector_store, "_client", None)
+    fresh = client.get_collection(name) if client is not None else coll
+    meta = getattr(fresh, "metadata", None) or {}
+    return (name, str(getattr(fresh, "id", "")), int(fresh.count()), meta.get("version"))
+
+
+class RetrievalCache:
+    """LRU + TTL cache of scored similarity-search results keyed by (collection, normalized query, k).
+
+    The collection fingerprint (name, id, count, metadata version) is re-read at most every
+    `version_check_s` seconds; when it changes, all entries for that collection are dropped.
+    A hit returns the cached (Document, score) pairs without any embedding call or vector search.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 3600.0, version_check_s: float = 5.0) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.version_check_s = version_check_s
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple[float, Scored]]" = OrderedDict()
+        self._versions: Dict[str, Tuple[float, Fingerprint]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def _check_version(self, vector_store: Any) -> str:
+        coll = getattr(vector_store, "_collection", None)
+        name = getattr(coll, "name", "") if coll is not None else ""
+        now = time.monotonic()
+        with self._lock:
+            seen = self._versions.get(name)
+            if seen and now - seen[0] < self.version_check_s:
+                return name
+        try:
+            version = collection_version(vector_store)
+        except Exception as e:  # noqa: BLE001 - a failed probe must not break retrieval
+            log.debug("[RETRIEVAL-CACHE] version probe failed: %s", e)
+            return name
+        with self._lock:
+            if seen and seen[1] != version:
+                for key in [k for k in self._entries if k[0] == name]:
+                    del self._entries[key]
+                self._invalidations += 1
+                log.info("[RETRIEVAL-CACHE] collection %s changed %s -> %s; invalidated", name, seen[1], version)
+            self._versions[name] = (now, version)
+        return name
+
+    def get_or_search(self, vector_store: Any, query: str, k: int, search: Callable[[], Scored]) -> Scored:
+        key, hit = self._lookup(vector_store, query, k)
+        if hit is not None:
+            return hit
+        return self._store(key, search())
+
+    async def aget_or_search(
+        self, vector_store: Any, query: str, k: int, search: Callable[[], Awaitable[Scored]]
+    ) -> Scored:
+        """Async counterpart of `get_or_search`; `search` is awaited on a miss."""
+        key, hit = self._lookup(vector_store, query, k)
+        if hit is not None:
+            return hit
+        return self._store(key, await search())
+
+    def _lookup(self, vector_store: Any, query: str, k: int) -> Tuple[tuple, Scored | None]:
+        name = self._check_version(vector_store)
+        key = (name, normalize_query(query), int(k))
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit and (self.ttl_s <= 0 or now - hit[0] < self.ttl_s):
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return key, list(hit[1])
+            if hit:
+                del self._entries[key]
+            self._misses += 1
+        return key, None
+
+    def _store(self, key: tuple, result: Scored) -> Scored:
+        result = list(result)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return list(result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+                "invalidations": self._invalidations,
+            }
@@ -0,0 +1,112 @@
+"""Per-file inline comment cache and last-reviewed-head fingerprints for incremental re-reviews.
+
+- `review_file_comments`: (repository, path, patch hash) → the inline comments generated for
+  that exact patch. A file whose patch is unchanged reuses them without an LLM call.
+- `review_heads`: per PR, the head SHA last reviewed and the patch hash of each of its files.
+  On `synchronize`, only files whose hash differs from that snapshot are reviewed and commented.
+
+Stored next to the review job queue (same SQLite file, separate connection).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS review_file_comments (
+    repo TEXT NOT NULL,
+    path TEXT NOT NULL,
+    patch_hash TEXT NOT NULL,
+    comments TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (repo, path, patch_hash)
+);
+CREATE TABLE IF NOT EXISTS review_heads (
+    repo TEXT NOT NULL,
+    pr INTEGER NOT NULL,
+    head_sha TEXT,
+    files TEXT NOT NULL,
+    reviewed_at REAL NOT NULL,
+    PRIMARY KEY (repo, pr)
+);
+"""
+
+
+def patch_hash(patch: str) -> str:
+    return hashlib.sha256(patch.encode("utf-8")).hexdigest()[:32]
+
+
+class ReviewCommentCache:
+    def __init__(self, db_path: str, max_age_s: float = 30 * 24 * 3600.0) -> None:
+        self.db_path = db_path
+        self.max_age_s = max_age_s
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._counts = {"hits": 0, "misses": 0, "unchanged_skipped": 0, "incremental_reviews": 0}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Callers hold self._lock
+        if self._conn is None:
+            if self.db_path != ":memory:":
+                Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            cutoff = time.time() - self.max_age_s
+            conn.execute("DELETE FROM review_file_comments WHERE created_at < ?", (cutoff,))
+            conn.execute("DELETE FROM review_heads WHERE reviewed_at < ?", (cutoff,))
+            self._conn = conn
+        return self._conn
+
+    def get_comments(self, repo: str, path: str, digest: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT comments FROM review_file_comments WHERE repo = ? AND path = ? AND patch_hash = ?",
+                (repo.lower(), path, digest),
+            ).fetchone()
+            self._counts["hits" if row else "misses"] += 1
+        if row is None:
+            return None
+        return [{"path": path, **c} for c in json.loads(row[0])]
+
+    def put_comments(self, repo: str, path: str, digest: str, comments: List[Dict[str, Any]]) -> None:
+        stored = [{"position": c["position"], "body": c["body"]} for c in comments]
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO review_file_comments (repo, path, patch_hash, comments, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (repo.lower(), path, digest, json.dumps(stored), time.time()),
+            )
+
+    def last_reviewed(self, repo: str, pr: int) -> Optional[Tuple[str, Dict[str, str]]]:
+        """(head SHA, {path: patch hash}) of the PR's last posted review, if any."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT head_sha, files FROM review_heads WHERE repo = ? AND pr = ?", (repo.lower(), int(pr))
+            ).fetchone()
+        return (row[0] or "", json.loads(row[1])) if row else None
+
+    def record_review(self, repo: str, pr: int, head_sha: Optional[str], files: Dict[str, str]) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO review_heads (repo, pr, head_sha, files, reviewed_at) VALUES (?, ?, ?, ?, ?)",
+                (repo.lower(), int(pr), head_sha, json.dumps(files), time.time()),
+            )
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counts)
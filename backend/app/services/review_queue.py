@@ -0,0 +1,390 @@
+"""Durable review job queue: a SQLite table drained by a fixed pool of worker threads.
+
+Jobs survive restarts. A claimed job carries a lease (`owner`, `lease_until`) that its process
+renews while the job runs; only a `running` job whose lease has expired (its process crashed or
+was stopped) is requeued, so several processes can share one database without taking over each
+other's live jobs. A job is skipped as
+a duplicate when its `X-GitHub-Delivery` id was seen before (a webhook redelivery), or when a
+job for the same (repository, PR, head SHA) is still queued or running. A finished review does not
+block a new one, so `reopened` or an explicit by-URL request reviews the PR again. Failed attempts
+are retried with
+exponential backoff until `max_attempts`, then marked `failed`.
+
+Handlers report per-stage progress through `JobProgress`; it is stored with the job so the
+status endpoint can show which stage a review is in and how long each stage took.
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS review_jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    delivery_id TEXT,
+    dedupe_key TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    last_error TEXT,
+    result TEXT,
+    progress TEXT,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS review_jobs_delivery ON review_jobs (delivery_id) WHERE delivery_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS review_jobs_dedupe ON review_jobs (dedupe_key, status);
+CREATE INDEX IF NOT EXISTS review_jobs_ready ON review_jobs (status, run_after);
+"""
+
+
+def pr_dedupe_key(ctx: Dict[str, Any]) -> Optional[str]:
+    """`owner/repo#number@head_sha`, or None when the head SHA is unknown (no PR-level dedupe)."""
+    owner, repo, number, sha = ctx.get("owner"), ctx.get("repo"), ctx.get("pr_number"), ctx.get("head_sha")
+    if not (owner and repo and number and sha):
+        return None
+    return f"{owner}/{repo}#{number}@{sha}".lower()
+
+
+class JobProgress:
+    """Per-stage status and timing of one job attempt, saved on every transition."""
+
+    def __init__(self, save: Callable[[Dict[str, Any]], None] | None = None) -> None:
+        self._save = save
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        self._update(name, status="running", started_at=time.time())
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self._update(name, status="failed", duration_ms=int((time.perf_counter() - t0) * 1000))
+            raise
+        self._update(name, status="done", duration_ms=int((time.perf_counter() - t0) * 1000))
+
+    def _update(self, name: str, **fields: Any) -> None:
+        with self._lock:
+            self.stages.setdefault(name, {}).update(fields)
+            snapshot = {k: dict(v) for k, v in self.stages.items()}
+        if self._save is not None:
+            self._save(snapshot)
+
+
+class ReviewQueue:
+    """SQLite-backed job queue with a worker pool; `handler(kind, payload, progress)` runs each job.
+
+    The handler's return value (a JSON-serializable dict or None) is stored as the job result.
+    Any exception counts as a failed attempt.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        handler: Callable[[str, Dict[str, Any], JobProgress], Optional[Dict[str, Any]]],
+        workers: int = 2,
+        max_attempts: int = 3,
+        backoff_s: float = 10.0,
+        backoff_max_s: float = 300.0,
+        retention_s: float = 7 * 24 * 3600.0,
+        poll_s: float = 1.0,
+        lease_s: float = 60.0,
+    ) -> None:
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_s = backoff_s
+        self.backoff_max_s = backoff_max_s
+        self.retention_s = retention_s
+        self.poll_s = poll_s
+        self.lease_s = max(1.0, lease_s)
+        # Lease owner for jobs claimed by this queue; unique per process and per instance
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = False
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._counts = {"enqueued": 0, "duplicates": 0, "retries": 0, "completed": 0, "failed": 0}
+
+    # --------- Storage ---------
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Callers hold self._lock; one connection serializes every statement
+        if self._conn is None:
+            if self.db_path != ":memory:":
+                Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(review_jobs)")}
+            # Databases created before progress reporting / job leases
+            for name, kind in (("progress", "TEXT"), ("owner", "TEXT"), ("lease_until", "REAL")):
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE review_jobs ADD COLUMN {name} {kind}")
+            self._conn = conn
+        return self._conn
+
+    def _row(self, row: sqlite3.Row | None) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["progress"] = json.loads(job["progress"]) if job.get("progress") else {}
+        return job
+
+    # --------- Producer side ---------
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        delivery_id: Optional[str] = None,
+        dedupe_key: Optional[str] = None,
+    ) -> tuple[Dict[str, Any], bool]:
+        """Insert a job unless it duplicates one already seen; returns (job, created)."""
+        now = time.time()
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = None
+                if delivery_id:
+                    existing = conn.execute(
+                        "SELECT * FROM review_jobs WHERE delivery_id = ?", (delivery_id,)
+                    ).fetchone()
+                if existing is None and dedupe_key:
+                    existing = conn.execute(
+                        "SELECT * FROM review_jobs WHERE dedupe_key = ? AND status IN (?, ?) "
+                        "ORDER BY created_at DESC LIMIT 1",
+                        (dedupe_key, *ACTIVE_STATUSES),
+                    ).fetchone()
+                if existing is not None:
+                    conn.execute("COMMIT")
+                    self._counts["duplicates"] += 1
+                    return self._row(existing), False
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO review_jobs (id, kind, delivery_id, dedupe_key, payload, status, run_after, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                    (job_id, kind, delivery_id, dedupe_key, json.dumps(payload), now, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._counts["enqueued"] += 1
+            self._wakeup.notify()
+            job = conn.execute("SELECT * FROM review_jobs WHERE id = ?", (job_id,)).fetchone()
+        log.info("[REVIEW-QUEUE] enqueued %s kind=%s key=%s delivery=%s", job_id, kind, dedupe_key, delivery_id)
+        return self._row(job), True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._row(self.conn.execute("SELECT * FROM review_jobs WHERE id = ?", (job_id,)).fetchone())
+
+    # --------- Workers ---------
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            self._stop = False
+            self._stopped.clear()
+            conn = self.conn
+            # Jobs whose owner crashed or stopped are picked up again; live leases are left alone
+            recovered = self._requeue_expired()
+            pruned = conn.execute(
+                "DELETE FROM review_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - self.retention_s,),
+            ).rowcount
+            for i in range(self.workers):
+                t = threading.Thread(target=self._work, name=f"review-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            t = threading.Thread(target=self._heartbeat, name="review-lease", daemon=True)
+            t.start()
+            self._threads.append(t)
+        log.info(
+            "[REVIEW-QUEUE] %d workers started as %s (recovered=%d pruned=%d)",
+            self.workers, self.worker_id, recovered, pruned,
+        )
+
+    def stop(self, timeout_s: float = 5.0) -> None:
+        with self._lock:
+            self._stop = True
+            self._stopped.set()
+            self._wakeup.notify_all()
+            threads, self._threads = self._threads, []
+        for t in threads:
+            t.join(timeout=timeout_s)
+
+    def _requeue_expired(self) -> int:
+        """Return `running` jobs with a lapsed (or no) lease to the queue (caller holds the lock)."""
+        now = time.time()
+        return self.conn.execute(
+            "UPDATE review_jobs SET status = 'queued', run_after = ?, owner = NULL, lease_until = NULL "
+            "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+            (now, now),
+        ).rowcount
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest due job to `running` under this queue's lease (caller holds the lock).
+
+        `BEGIN IMMEDIATE` takes the database write lock, so two processes never claim the same row.
+        """
+        now = time.time()
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._requeue_expired()
+            row = conn.execute(
+                "SELECT id FROM review_jobs WHERE status = 'queued' AND run_after <= ? "
+                "ORDER BY run_after, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE review_jobs SET status = 'running', attempts = attempts + 1, started_at = ?, "
+                    "progress = NULL, owner = ?, lease_until = ? WHERE id = ?",
+                    (now, self.worker_id, now + self.lease_s, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return self._row(conn.execute("SELECT * FROM review_jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def _heartbeat(self) -> None:
+        """Renew the lease of every job this queue is running, a few times per lease period."""
+        while not self._stopped.wait(self.lease_s / 3):
+            try:
+                with self._lock:
+                    self.conn.execute(
+                        "UPDATE review_jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                        (time.time() + self.lease_s, self.worker_id),
+                    )
+            except sqlite3.Error as e:  # a missed renewal is retried on the next beat
+                log.warning("[REVIEW-QUEUE] lease renewal failed: %s", e)
+
+    def _idle_wait(self) -> float:
+        """Sleep until the next backed-off job is due, but at most `poll_s` (caller holds the lock)."""
+        due = self.conn.execute("SELECT MIN(run_after) FROM review_jobs WHERE status = 'queued'").fetchone()[0]
+        if due is None:
+            return self.poll_s
+        return min(self.poll_s, max(0.01, due - time.time()))
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                job = None
+                while not self._stop:
+                    job = self._claim()
+                    if job is not None:
+                        break
+                    self._wakeup.wait(self._idle_wait())
+                if self._stop:
+                    if job is not None:
+                        self.conn.execute(
+                            "UPDATE review_jobs SET status = 'queued', owner = NULL, lease_until = NULL WHERE id = ?",
+                            (job["id"],),
+                        )
+                    return
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
+        progress = JobProgress(lambda stages: self._save_progress(job["id"], stages))
+        try:
+            result = self.handler(job["kind"], job["payload"], progress)
+        except Exception as e:  # noqa: BLE001 - any failure is retried or recorded
+            self._fail(job, e)
+            return
+        with self._lock:
+            owned = self.conn.execute(
+                "UPDATE review_jobs SET status = 'done', finished_at = ?, last_error = NULL, result = ?, "
+                "lease_until = NULL WHERE id = ? AND owner = ?",
+                (time.time(), json.dumps(result) if result is not None else None, job["id"], self.worker_id),
+            ).rowcount
+            if owned:
+                self._counts["completed"] += 1
+        if not owned:
+            log.warning("[REVIEW-QUEUE] %s finished after its lease was taken over", job["id"])
+            return
+        log.info("[REVIEW-QUEUE] %s done in %.1fs (attempt %d)", job["id"], time.perf_counter() - t0, job["attempts"])
+
+    def _save_progress(self, job_id: str, stages: Dict[str, Any]) -> None:
+        with self._lock:
+            self.conn.execute(
+                "UPDATE review_jobs SET progress = ? WHERE id = ? AND owner = ?",
+                (json.dumps(stages), job_id, self.worker_id),
+            )
+
+    def _fail(self, job: Dict[str, Any], error: Exception) -> None:
+        attempts = job["attempts"]
+        message = f"{type(error).__name__}: {error}"
+        with self._lock:
+            if attempts < self.max_attempts:
+                delay = min(self.backoff_max_s, self.backoff_s * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+                self.conn.execute(
+                    "UPDATE review_jobs SET status = 'queued', run_after = ?, last_error = ?, owner = NULL, "
+                    "lease_until = NULL WHERE id = ? AND owner = ?",
+                    (time.time() + delay, message, job["id"], self.worker_id),
+                )
+                self._counts["retries"] += 1
+                log.warning("[REVIEW-QUEUE] %s attempt %d failed (%s); retrying in %.0fs", job["id"], attempts, message, delay)
+            else:
+                self.conn.execute(
+                    "UPDATE review_jobs SET status = 'failed', finished_at = ?, last_error = ?, lease_until = NULL "
+                    "WHERE id = ? AND owner = ?",
+                    (time.time(), message, job["id"], self.worker_id),
+                )
+                self._counts["failed"] += 1
+                log.error("[REVIEW-QUEUE] %s failed after %d attempts: %s", job["id"], attempts, message)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_status = {
+                row["status"]: row["n"]
+                for row in self.conn.execute("SELECT status, COUNT(*) AS n FROM review_jobs GROUP BY status")
+            }
+            oldest = self.conn.execute(
+                "SELECT MIN(created_at) FROM review_jobs WHERE status = 'queued'"
+            ).fetchone()[0]
+            return {
+                "workers": self.workers,
+                "worker_id": self.worker_id,
+                "queued": by_status.get("queued", 0),
+                "running": by_status.get("running", 0),
+                "done": by_status.get("done", 0),
+                "failed": by_status.get("failed", 0),
+                "oldest_queued_s": round(time.time() - oldest, 1) if oldest else 0.0,
+                **self._counts,
+            }
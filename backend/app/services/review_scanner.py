@@ -0,0 +1,163 @@
+"""Local review stage run before the LLM: skip non-reviewable files, flag risky added lines.
+
+- `skip_reason(file)`: lockfiles, vendored/generated/build output, minified assets, removed
+  files and oversized patches are not worth an LLM call (None means "review it").
+- `scan_patch(path, patch)`: regex rules over added lines only (hardcoded secrets, eval/exec,
+  `shell=True`, `os.system`, `pickle.loads`, `verify=False`). Findings carry the GitHub review
+  `position` of the line, counted exactly like `pr_diff.number_patch`.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+LOCKFILES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb",
+    "poetry.lock", "pipfile.lock", "uv.lock", "pdm.lock", "cargo.lock", "gemfile.lock",
+    "composer.lock", "go.sum", "podfile.lock", "packages.lock.json", "mix.lock", "pubspec.lock",
+}
+_SKIP_DIRS = re.compile(
+    r"(^|/)(vendor|vendored|third_party|thirdparty|node_modules|bower_components|"
+    r"__generated__|generated|\.yarn)/",
+    re.IGNORECASE,
+)
+# Build output only at the repository root; `src/build/` or `pkg/dist/` are usually sources
+_ROOT_BUILD_DIRS = re.compile(r"^(dist|build)/", re.IGNORECASE)
+_GENERATED_NAMES = re.compile(
+    r"(\.min\.(js|css)|\.map|\.pb\.go|_pb2(_grpc)?\.pyi?|\.pb\.(h|cc)|\.g\.dart|\.designer\.cs|"
+    r"\.generated\.\w+|\.snap|\.svg)$",
+    re.IGNORECASE,
+)
+# A generator's header comment, e.g. "// Code generated by protoc-gen-go. DO NOT EDIT." or "# @generated"
+_GENERATED_MARKER = re.compile(
+    r"^\W+(?:@generated\b|Code generated\b.*\bDO NOT EDIT\b|"
+    r"(?:This file (?:is|was|has been) )?(?:auto-?generated|automatically generated)\b)",
+    re.IGNORECASE,
+)
+# How many of the file's first lines may hold that header
+HEADER_LINES = 5
+_HUNK_AT_TOP = re.compile(r"^@@ -\d+(?:,\d+)? \+1(?:,\d+)? @@")
+# Added lines this long are minified/bundled output, not code anyone wrote
+MINIFIED_LINE_CHARS = 500
+
+
+def _has_generated_header(patch: str) -> bool:
+    """Whether the file's first lines, when the patch shows them, carry a generator header."""
+    lines = patch.splitlines()
+    if not lines or not _HUNK_AT_TOP.match(lines[0]):
+        return False
+    head: List[str] = []
+    for line in lines[1:]:
+        if line.startswith("@@") or len(head) >= HEADER_LINES:
+            break
+        if line[:1] in (" ", "+"):  # lines of the new file; '-' lines are gone
+            head.append(line[1:])
+    return any(_GENERATED_MARKER.match(line) for line in head)
+
+
+def skip_reason(f: Dict[str, Any], max_changes: int = 2000) -> Optional[str]:
+    """Why a PR file should not be reviewed, or None if it should."""
+    path = str(f.get("filename") or "")
+    name = path.rsplit("/", 1)[-1].lower()
+    patch = f.get("patch") or ""
+    if not patch:
+        return "no_patch"  # binary, too large for GitHub to render, or a pure rename
+    if f.get("status") == "removed":
+        return "removed"
+    if name in LOCKFILES:
+        return "lockfile"
+    if _SKIP_DIRS.search(path) or _ROOT_BUILD_DIRS.match(path):
+        return "vendored"
+    if _GENERATED_NAMES.search(name) or _has_generated_header(patch):
+        return "generated"
+    if int(f.get("changes") or 0) > max_changes:
+        return "too_large"
+    added = [line for line in patch.splitlines() if line.startswith("+") and not line.startswith("+++")]
+    if added and max(len(line) for line in added) > MINIFIED_LINE_CHARS:
+        return "minified"
+    return None
+
+
+@dataclass(frozen=True)
+class Rule:
+    id: str
+    pattern: Pattern[str]
+    message: str
+
+
+RULES: Tuple[Rule, ...] = (
+    Rule("secret", re.compile(
+        r"AKIA[0-9A-Z]{16}|gh[pousr]_[A-Za-z0-9]{36,}|github_pat_[A-Za-z0-9_]{40,}|sk-[A-Za-z0-9_-]{20,}|"
+        r"xox[abposr]-[A-Za-z0-9-]{10,}|-----BEGIN (?:RSA |EC |DSA |OPENSSH |PGP )?PRIVATE KEY-----"
+    ), "Looks like a hardcoded credential. Remove it, rotate it, and load it from the environment or a secret store."),
+    Rule("secret", re.compile(
+        r"""(?i)\b(?:api[_-]?key|secret(?:[_-]?key)?|passw(?:or)?d|access[_-]?token|auth[_-]?token)\b\s*[:=]\s*['"][^'"\s]{8,}['"]"""
+    ), "Hardcoded secret-like value. Read it from configuration/environment instead of committing it."),
+    Rule("eval-exec", re.compile(r"(?<![\w.])(?:eval|exec)\s*\("),
+         "`eval`/`exec` runs arbitrary code; use a safe parser (e.g. `ast.literal_eval`, `json.loads`) or explicit dispatch."),
+    Rule("shell-true", re.compile(r"\bshell\s*=\s*True\b"),
+         "`shell=True` enables shell injection; pass an argument list and keep `shell=False`."),
+    Rule("os-system", re.compile(r"\bos\.system\s*\("),
+         "`os.system` goes through the shell; prefer `subprocess.run([...], check=True)` with an argument list."),
+    Rule("pickle-loads", re.compile(r"\b(?:c?[pP]ickle|dill|joblib)\.loads?\s*\("),
+         "Unpickling untrusted data can execute code; use a data format such as JSON, or verify the source."),
+    Rule("verify-false", re.compile(r"\bverify\s*=\s*False\b"),
+         "`verify=False` disables TLS certificate checks; keep verification on (or pass a CA bundle)."),
+)
+
+
+def added_lines(patch: str) -> List[Tuple[int, str]]:
+    """(position, text without '+') for each added line, positions as GitHub counts them (hunk headers excluded)."""
+    out: List[Tuple[int, str]] = []
+    pos = 0
+    for line in patch.splitlines():
+        if line.startswith("@@"):
+            continue
+        if line[:1] in {" ", "+", "-"}:
+            pos += 1
+            if line.startswith("+") and not line.startswith("+++"):
+                out.append((pos, line[1:]))
+    return out
+
+
+def scan_patch(path: str, patch: str, max_findings: int = 3) -> List[Dict[str, Any]]:
+    """Inline comments for rule hits on added lines: at most one per line, first `max_findings`."""
+    findings: List[Dict[str, Any]] = []
+    for position, text in added_lines(patch):
+        stripped = text.lstrip()
+        if stripped.startswith(("#", "//")) and "-----BEGIN" not in stripped:
+            continue  # commented-out code is not executed
+        for rule in RULES:
+            if rule.pattern.search(text):
+                findings.append({"path": path, "position": position, "body": rule.message, "rule": rule.id})
+                break
+        if len(findings) >= max_findings:
+            break
+    return findings
+
+
+class ScannerStats:
+    """Counters for `/api/metrics`: files skipped per reason and scanner findings per rule."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._skipped: Dict[str, int] = {}
+        self._findings: Dict[str, int] = {}
+        self._reviewed = 0
+
+    def record(self, skipped: Dict[str, int], findings: List[Dict[str, Any]], reviewed: int) -> None:
+        with self._lock:
+            self._reviewed += reviewed
+            for reason, n in skipped.items():
+                self._skipped[reason] = self._skipped.get(reason, 0) + n
+            for finding in findings:
+                self._findings[finding["rule"]] = self._findings.get(finding["rule"], 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"files_reviewed": self._reviewed, "skipped": dict(self._skipped), "findings": dict(self._findings)}
+
+
+SCANNER_STATS = ScannerStats()
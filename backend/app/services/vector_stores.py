@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, TypeVar
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import get_settings
+from app.core.logger import get_logger
+from app.services.embeddings import EMBEDDING_META_KEY, embeddings_for_collection
+
+log = get_logger(__name__)
+
+CHEMBL_COLLECTION = "chembl_schema"
+T = TypeVar("T")
+
+
+def _collection_missing(exc: BaseException) -> bool:
+    """Chroma's error for a handle whose collection was deleted or swapped out (e.g. by a re-embed)."""
+    return type(exc).__name__ in {"NotFoundError", "InvalidCollectionException"} or "does not exist" in str(exc)
+
+
+class BoundEmbeddings(Embeddings):
+    """Stable embedding function handed to a shared store; the real backend is (re)bound per API key."""
+
+    def __init__(self, collection: str) -> None:
+        self.collection = collection
+        self._target: Embeddings | None = None
+
+    def bind(self, target: Embeddings) -> None:
+        self._target = target
+
+    @property
+    def target(self) -> Embeddings:
+        if self._target is None:
+            raise RuntimeError(f"No embedding backend bound for collection {self.collection!r} (API key missing?)")
+        return self._target
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.target.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.target.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.target.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.target.aembed_query(text)
+
+
+class VectorStores:
+    """Process-wide persistent Chroma client with reusable collection handles.
+
+    The client and each collection's index are opened once (ideally at startup via `warm`) and
+    shared by every request. A key change only rebinds the embedding function of each store, so
+    it no longer reopens the database or reloads indexes.
+
+    Searches go through `search`/`asearch`, which re-read the collection from the store at most
+    every `check_s` seconds (and right away when a query hits a deleted collection). When another
+    process replaced it (`fpf_ingest --reset`, the re-embed tool) the store's collection handle is
+    swapped in place and its embedding function rebound to the backend now stamped on it.
+    """
+
+    def __init__(self, persist_dir: str, check_s: float = 5.0) -> None:
+        self.persist_dir = persist_dir
+        self.check_s = check_s
+        self._lock = threading.RLock()
+        self._client = None
+        self._stores: Dict[str, Chroma] = {}
+        self._embeddings: Dict[str, BoundEmbeddings] = {}
+        self._api_key: str | None = None
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._checked: Dict[str, float] = {}
+        self._specs: Dict[str, str | None] = {}  # embedding stamp each store is bound to
+        self._warming = False
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import chromadb
+                from chromadb.config import Settings as ChromaSettings
+
+                t0 = time.perf_counter()
+                self._client = chromadb.PersistentClient(
+                    path=self.persist_dir, settings=ChromaSettings(anonymized_telemetry=False)
+                )
+                log.info("[VECTORS] opened %s in %.0fms", self.persist_dir, (time.perf_counter() - t0) * 1000)
+            return self._client
+
+    def store(self, name: str) -> Chroma:
+        with self._lock:
+            vs = self._stores.get(name)
+            if vs is None:
+                bound = BoundEmbeddings(name)
+                vs = Chroma(client=self.client, collection_name=name, embedding_function=bound)
+                self._embeddings[name] = bound
+                self._stores[name] = vs
+                self._checked[name] = time.monotonic()
+                self._bind(name, vs._collection.metadata)
+            return vs
+
+    def bind_key(self, api_key: str | None) -> None:
+        """Bind every store's embedding function to `api_key` (local backends ignore it)."""
+        with self._lock:
+            self._api_key = api_key
+            for name in self._stores:
+                # Re-read the collection: a cached handle's metadata is frozen at open time
+                self._bind(name, self._fetch(name).metadata)
+
+    def _fetch(self, name: str):
+        """Current collection from the store; reopens the store's handle if it was replaced."""
+        fresh = self.client.get_collection(name)
+        vs = self._stores[name]
+        current = vs._chroma_collection
+        if current is None or current.id != fresh.id:
+            log.info("[VECTORS] collection %s was replaced (id %s -> %s); reopened",
+                     name, getattr(current, "id", None), fresh.id)
+        # The handle's metadata is a snapshot, so keep the fresh one even when the id is unchanged
+        vs._chroma_collection = fresh
+        return fresh
+
+    def _bind(self, name: str, metadata: Dict[str, Any] | None) -> None:
+        metadata = metadata or {}
+        # OpenAI embeddings are unusable without a key; leave the store unbound until one arrives
+        if self._api_key or str(metadata.get(EMBEDDING_META_KEY, "")).startswith("local:"):
+            self._embeddings[name].bind(embeddings_for_collection(metadata, self._api_key))
+            self._specs[name] = metadata.get(EMBEDDING_META_KEY)
+
+    def revalidate(self, vs: Chroma, force: bool = False) -> None:
+        """Re-read `vs`'s collection if it is a shared store and the check is due (or `force`)."""
+        name = getattr(vs, "_collection_name", None)
+        now = time.monotonic()
+        with self._lock:
+            if self._stores.get(name) is not vs:
+                return
+            if not force and now - self._checked.get(name, 0.0) < self.check_s:
+                return
+            self._checked[name] = now
+            try:
+                metadata = self._fetch(name).metadata
+            except Exception as e:  # noqa: BLE001 - keep serving from the current handle
+                log.warning("[VECTORS] re-reading %s failed: %s", name, e)
+                return
+            if self._embeddings[name]._target is None or self._specs.get(name) != (metadata or {}).get(EMBEDDING_META_KEY):
+                self._bind(name, metadata)
+
+    def search(self, vs: Chroma, fn: Callable[[], T]) -> T:
+        """Run a query on `vs`, reopening its collection first if it was replaced meanwhile."""
+        self.revalidate(vs)
+        try:
+            return fn()
+        except Exception as e:
+            if not _collection_missing(e):
+                raise
+            self.revalidate(vs, force=True)
+            return fn()
+
+    async def asearch(self, vs: Chroma, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async counterpart of `search`."""
+        self.revalidate(vs)
+        try:
+            return await fn()
+        except Exception as e:
+            if not _collection_missing(e):
+                raise
+            self.revalidate(vs, force=True)
+            return await fn()
+
+    def warm(self, names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Open each collection and force its vector index into memory with one cheap query."""
+        self._warming = True
+        try:
+            for name in names:
+                t0 = time.perf_counter()
+                status: Dict[str, Any] = {"loaded": False}
+                try:
+                    collection = self.store(name)._collection
+                    status["count"] = collection.count()
+                    if status["count"]:
+                        sample = collection.peek(1)["embeddings"]
+                        collection.query(query_embeddings=[list(sample[0])], n_results=1, include=[])
+                    status["loaded"] = True
+                except Exception as e:  # noqa: BLE001 - reported via readiness, never fatal
+                    status["error"] = str(e)
+                    log.warning("[VECTORS] warming %s failed: %s", name, e)
+                status["load_ms"] = int((time.perf_counter() - t0) * 1000)
+                with self._lock:
+                    self._status[name] = status
+                log.info("[VECTORS] warmed %s: %s", name, status)
+        finally:
+            self._warming = False
+        return self.readiness()
+
+    def readiness(self) -> Dict[str, Any]:
+        with self._lock:
+            collections = {k: dict(v) for k, v in self._status.items()}
+            bound = {k: v._target is not None for k, v in self._embeddings.items()}
+        for name, ok in bound.items():
+            collections.setdefault(name, {"loaded": False})["embeddings_bound"] = ok
+        return {
+            "ready": bool(collections) and not self._warming and all(c.get("loaded") for c in collections.values()),
+            "warming": self._warming,
+            "collections": collections,
+        }
+
+
+VECTOR_STORES = VectorStores(get_settings().chroma_db_dir)
@@ -0,0 +1,128 @@
+"""Measure per-request logging overhead: synchronous handlers vs the queue-backed pipeline.
+
+Replays the log traffic of one FPF chatbot request (graph steps carrying retrieved context and
+the answer) plus one ChEMBL run (~25 `_log_step` calls) and reports the time spent in logging
+calls on the request thread.
+
+- before: `print()` + INFO with the full content of every graph step, eager `_log_step`
+  formatting, file + stdout handlers written synchronously by the caller.
+- after:  `app.core.logger.configure_logging` (QueueHandler → QueueListener), per-step content
+  only at DEBUG and truncated, one INFO summary per answer, guarded `_log_step`.
+
+Usage:
+    python scripts/bench_logging.py --requests 2000 --content-chars 6000 --gap-ms 2
+
+stdout is redirected to /dev/null while measuring so terminal speed does not skew results.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from logging.handlers import TimedRotatingFileHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core import logger as app_logger  # noqa: E402
+
+GRAPH_STEPS = 6
+CHEMBL_STEPS = 25
+
+
+def _sync_setup(log_dir: str, stream) -> None:
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.setLevel(logging.INFO)
+    fmt = logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s", "%Y-%m-%dT%H:%M:%SZ")
+    fmt.converter = time.gmtime
+    fh = TimedRotatingFileHandler(os.path.join(log_dir, "app.log"), when="midnight", utc=True, encoding="utf-8")
+    sh = logging.StreamHandler(stream)
+    for h in (fh, sh):
+        h.setFormatter(fmt)
+        root.addHandler(h)
+
+
+def _request_before(log: logging.Logger, content: str, fields: dict) -> None:
+    for _ in range(GRAPH_STEPS):
+        print(f"[ts] [LANGGRAPH][bench] {content[:500]}")
+        log.info("[LANGGRAPH][%s] %s", "bench", content)
+    for i in range(CHEMBL_STEPS):
+        message = " | ".join(f"{k}={v}" for k, v in fields.items() if v is not None)
+        log.info("[CHEMBL][pipe][%s] %s", f"STEP{i}", message)
+
+
+def _request_after(log: logging.Logger, content: str, fields: dict) -> None:
+    debug = log.isEnabledFor(logging.DEBUG)
+    for _ in range(GRAPH_STEPS):
+        if debug:
+            log.debug("[LANGGRAPH][%s] %s", "bench", app_logger.truncate(content))
+    log.info("[LANGGRAPH][%s] steps=%d answered=%s took_ms=%d", "bench", GRAPH_STEPS, True, 0)
+    for i in range(CHEMBL_STEPS):
+        if log.isEnabledFor(logging.INFO):
+            message = " | ".join(f"{k}={app_logger.truncate(v)}" for k, v in fields.items() if v is not None)
+            log.info("[CHEMBL][pipe][%s] %s", f"STEP{i}", message)
+
+
+def _measure(fn, requests: int, content: str, fields: dict, gap_s: float) -> list[float]:
+    log = logging.getLogger("bench")
+    samples = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        fn(log, content, fields)
+        samples.append((time.perf_counter() - t0) * 1e6)
+        if gap_s:
+            time.sleep(gap_s)
+    return samples
+
+
+def _report(name: str, samples: list[float]) -> None:
+    ordered = sorted(samples)
+    p99 = ordered[int(len(ordered) * 0.99) - 1]
+    print(
+        f"{name:<7} mean={statistics.fmean(samples):8.1f}us  p50={statistics.median(samples):8.1f}us  "
+        f"p99={p99:8.1f}us  max={ordered[-1]:8.1f}us"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--content-chars", type=int, default=6000, help="size of each graph step payload")
+    ap.add_argument("--queue-size", type=int, default=10000)
+    ap.add_argument(
+        "--gap-ms", type=float, default=2.0,
+        help="idle time between requests (stands in for LLM latency; 0 = back-to-back log storm)",
+    )
+    args = ap.parse_args()
+
+    content = ("retrieved context " * (args.content_chars // 18 + 1))[: args.content_chars]
+    fields = {"prompt_preview": content[:140], "sql_head": "SELECT * FROM molecule_dictionary", "took_ms": 12, "rows": 50}
+
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            _sync_setup(log_dir, devnull)
+            before = _measure(_request_before, args.requests, content, fields, args.gap_ms / 1000)
+
+            app_logger.configure_logging(log_dir=log_dir, queue_size=args.queue_size)
+            # Point the listener's stdout handler at /dev/null as well
+            for h in app_logger._listener.handlers:  # noqa: SLF001 - benchmark only
+                if type(h) is logging.StreamHandler:
+                    h.setStream(devnull)
+            after = _measure(_request_after, args.requests, content, fields, args.gap_ms / 1000)
+            stats = app_logger.logging_stats()
+            app_logger.shutdown_logging()
+
+    print(f"per-request logging overhead over {args.requests} requests ({args.content_chars}-char payloads):")
+    _report("before", before)
+    _report("after", after)
+    print(f"queue: dropped={stats['dropped']} capacity={stats['capacity']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Local OpenAI-compatible fake model server with injectable latency and faults.
+
+Serves `POST /v1/chat/completions` and `POST /v1/embeddings` with canned responses so the
+backend can be exercised without upstream access. Point the backend at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=fake uvicorn app.main:app
+
+Usage:
+    python scripts/fake_llm_server.py --port 8900 --latency-ms 300 --jitter-ms 100 \
+        --slow-rate 0.05 --slow-ms 4000 --error-rate 0.02
+
+`--slow-rate` injects occasional long stalls (what hedging is meant to hide) and `--error-rate`
+returns 503s (what retries are meant to absorb). `GET /stats` reports request counters.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_stats = {"chat": 0, "embeddings": 0, "slow": 0, "errors": 0}
+_lock = threading.Lock()
+
+
+def _bump(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+def _fake_embedding(text: str, dim: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rnd = random.Random(seed)
+    vec = [rnd.uniform(-1, 1) for _ in range(dim)]
+    norm = sum(v * v for v in vec) ** 0.5 or 1.0
+    return [v / norm for v in vec]
+
+
+def _reply_for(messages: list[dict]) -> str:
+    text = " ".join(str(m.get("content", "")) for m in messages).lower()
+    if "can_answer" in text:
+        return json.dumps({"can_answer": True, "reason": "fake judge", "answer": "Fake answer."})
+    if "is_chembl" in text:
+        return json.dumps({"is_chembl": True, "confidence": 0.9, "reason": "fake classifier"})
+    if '"comments"' in text or "allowedpositions" in text:
+        return json.dumps({"comments": [], "files": {}})
+    if "sqlite" in text and "sql" in text:
+        return "SELECT 1 AS one"
+    return "Fake completion."
+
+
+def make_handler(args: argparse.Namespace):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt: str, *a) -> None:  # keep the console quiet
+            return
+
+        def _send(self, status: int, obj: dict) -> None:
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client gave up (e.g. a cancelled hedge loser)
+
+        def _delay(self) -> None:
+            delay = max(0.0, args.latency_ms + random.uniform(-args.jitter_ms, args.jitter_ms)) / 1000
+            if random.random() < args.slow_rate:
+                _bump("slow")
+                delay += args.slow_ms / 1000
+            time.sleep(delay)
+
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path.rstrip("/").endswith("/stats"):
+                with _lock:
+                    self._send(200, dict(_stats))
+                return
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self) -> None:  # noqa: N802
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if random.random() < args.error_rate:
+                _bump("errors")
+                self._send(503, {"error": {"message": "injected fault", "type": "server_error"}})
+                return
+            self._delay()
+            if self.path.endswith("/chat/completions"):
+                _bump("chat")
+                content = _reply_for(payload.get("messages") or [])
+                self._send(200, {
+                    "id": f"chatcmpl-fake-{time.time_ns()}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "fake"),
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                })
+                return
+            if self.path.endswith("/embeddings"):
+                _bump("embeddings")
+                inputs = payload.get("input") or []
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                data = [
+                    {"object": "embedding", "index": i, "embedding": _fake_embedding(str(t), args.embedding_dim)}
+                    for i, t in enumerate(inputs)
+                ]
+                self._send(200, {"object": "list", "data": data, "model": payload.get("model", "fake"), "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+                return
+            self._send(404, {"error": "not found"})
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of calls that stall")
+    parser.add_argument("--slow-ms", type=float, default=3000.0, help="extra delay for stalled calls")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument("--embedding-dim", type=int, default=3072)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"fake LLM server on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
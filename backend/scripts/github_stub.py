@@ -0,0 +1,215 @@
+"""Local stub of the GitHub REST endpoints used by the code review flow.
+
+Serves a synthetic pull request with `--files` changed files, paginated exactly like GitHub
+(`per_page`/`page` query parameters and a `Link` header with `next`/`last`), and accepts review
+posts. Point the backend at it with:
+
+    GITHUB_API_URL=http://127.0.0.1:8901 GITHUB_TOKEN=fake uvicorn app.main:app
+
+Usage:
+    python scripts/github_stub.py --port 8901 --files 250 --latency-ms 40
+
+Endpoints:
+    GET  /repos/{owner}/{repo}/pulls/{n}          pull request object (initial head from --head-sha)
+    GET  /repos/{owner}/{repo}/pulls/{n}/files    paginated file list with unified patches
+    POST /repos/{owner}/{repo}/pulls/{n}/reviews  records the review and echoes an id
+    POST /push                                    simulate new commits: {"files": [0, 3]} (or
+                                                  {"count": n}) changes those files' patches and
+                                                  the head SHA; returns the new head
+    GET  /stats                                   counters, incl. TCP connections accepted
+    GET  /reviews                                 the reviews posted so far
+
+The server speaks HTTP/1.1 with keep-alive, so `connections` in `/stats` staying far below
+`requests` shows that the client reuses its pool. GETs carry an `ETag` and answer a matching
+`If-None-Match` with 304; `X-RateLimit-*` headers count down from `--rate-limit` (304s are free,
+as on GitHub), and `not_modified` in `/stats` counts the revalidated reads.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_stats = {"connections": 0, "requests": 0, "pull": 0, "files_pages": 0, "reviews": 0, "not_modified": 0}
+_rate = {"remaining": 0, "reset": 0}
+_reviews: list[dict] = []
+_revisions: dict[int, int] = {}  # file index -> number of pushes that touched it
+_head = {"sha": ""}
+_lock = threading.Lock()
+
+_PULL = re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/pulls/(?P<number>\d+)(?P<rest>/files|/reviews)?/?$")
+
+
+def _bump(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+def _patch(index: int, lines: int) -> str:
+    rev = _revisions.get(index, 0)
+    body = "\n".join(f"+value_{index}_{i} = compute({i}, rev={rev})" for i in range(lines))
+    return f"@@ -0,0 +1,{lines} @@\n{body}"
+
+
+def _file(index: int, lines: int) -> dict:
+    return {
+        "sha": f"{index:040x}",
+        "filename": f"src/module_{index:04d}.py",
+        "status": "added",
+        "additions": lines,
+        "deletions": 0,
+        "changes": lines,
+        "patch": _patch(index, lines),
+    }
+
+
+def make_handler(args: argparse.Namespace):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def setup(self) -> None:
+            super().setup()
+            _bump("connections")
+
+        def log_message(self, fmt: str, *a) -> None:  # keep the console quiet
+            return
+
+        def _rate_headers(self, cost: int) -> dict:
+            with _lock:
+                now = int(time.time())
+                if now >= _rate["reset"]:
+                    _rate.update(remaining=args.rate_limit, reset=now + 3600)
+                _rate["remaining"] = max(0, _rate["remaining"] - cost)
+                return {"X-RateLimit-Limit": str(args.rate_limit),
+                        "X-RateLimit-Remaining": str(_rate["remaining"]),
+                        "X-RateLimit-Reset": str(_rate["reset"])}
+
+        def _send_cacheable(self, obj, headers: dict | None = None) -> None:
+            """200 with an ETag, or an empty 304 when the client already holds this body."""
+            etag = '"' + hashlib.sha1(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                _bump("not_modified")
+                self.send_response(304)
+                for k, v in {"ETag": etag, **self._rate_headers(0)}.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send(200, obj, {"ETag": etag, **self._rate_headers(1), **(headers or {})})
+
+        def _send(self, status: int, obj, headers: dict | None = None) -> None:
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _delay(self) -> None:
+            if args.latency_ms:
+                time.sleep(args.latency_ms / 1000)
+
+        def _files_page(self, path: str, query: dict) -> None:
+            per_page = max(1, min(100, int((query.get("per_page") or ["30"])[0])))
+            page = max(1, int((query.get("page") or ["1"])[0]))
+            last = max(1, -(-args.files // per_page))
+            start = (page - 1) * per_page
+            items = [_file(i, args.lines_per_file) for i in range(start, min(start + per_page, args.files))]
+            base = f"http://{self.headers.get('Host')}{path}?per_page={per_page}"
+            links = []
+            if page < last:
+                links.append(f'<{base}&page={page + 1}>; rel="next"')
+                links.append(f'<{base}&page={last}>; rel="last"')
+            if page > 1:
+                links.append(f'<{base}&page=1>; rel="first"')
+                links.append(f'<{base}&page={page - 1}>; rel="prev"')
+            _bump("files_pages")
+            self._send_cacheable(items, {"Link": ", ".join(links)} if links else None)
+
+        def do_GET(self) -> None:  # noqa: N802
+            _bump("requests")
+            url = urlparse(self.path)
+            if url.path.rstrip("/") == "/stats":
+                with _lock:
+                    self._send(200, dict(_stats))
+                return
+            if url.path.rstrip("/") == "/reviews":
+                with _lock:
+                    self._send(200, list(_reviews))
+                return
+            match = _PULL.match(url.path)
+            if not match:
+                self._send(404, {"message": "Not Found"})
+                return
+            self._delay()
+            if match["rest"] == "/files":
+                self._files_page(url.path, parse_qs(url.query))
+                return
+            if match["rest"] is None:
+                _bump("pull")
+                self._send_cacheable({
+                    "number": int(match["number"]),
+                    "title": "Stub pull request",
+                    "body": "Synthetic PR served by scripts/github_stub.py",
+                    "state": "open",
+                    "head": {"ref": "feature", "sha": _head["sha"]},
+                    "base": {"ref": "main"},
+                    "changed_files": args.files,
+                })
+                return
+            self._send(404, {"message": "Not Found"})
+
+        def do_POST(self) -> None:  # noqa: N802
+            _bump("requests")
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if urlparse(self.path).path.rstrip("/") == "/push":
+                touched = payload.get("files") or list(range(int(payload.get("count") or 1)))
+                with _lock:
+                    for index in touched:
+                        _revisions[int(index)] = _revisions.get(int(index), 0) + 1
+                    _head["sha"] = f"{int(_head['sha'], 16) + 1:040x}"
+                    self._send(200, {"head_sha": _head["sha"], "touched": touched})
+                return
+            match = _PULL.match(urlparse(self.path).path)
+            if not match or match["rest"] != "/reviews":
+                self._send(404, {"message": "Not Found"})
+                return
+            self._delay()
+            with _lock:
+                _stats["reviews"] += 1
+                review_id = _stats["reviews"]
+                _reviews.append({"id": review_id, "pull": int(match["number"]), **payload})
+            self._send(200, {"id": review_id, "state": "COMMENTED"}, self._rate_headers(1))
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--files", type=int, default=250, help="changed files in the synthetic PR")
+    parser.add_argument("--lines-per-file", type=int, default=12)
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="delay per API call")
+    parser.add_argument("--head-sha", default="0" * 39 + "1")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="requests per hour before X-RateLimit-Remaining hits 0")
+    args = parser.parse_args()
+    _head["sha"] = args.head_sha
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"GitHub stub on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
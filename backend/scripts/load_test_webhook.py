@@ -0,0 +1,272 @@
+"""Load-test the code review webhook: ack latency, end-to-end review latency, throughput, backlog.
+
+Replays `pull_request` webhook payloads, signed with a valid `X-Hub-Signature-256`, against
+`POST /api/code-review/webhook` at increasing sender concurrency. Each event is rewritten to a
+fresh repository, PR number, head SHA and delivery id, so the queue's dedupe and the review
+caches see new work every time. Every acknowledged job is polled through
+`GET /api/code-review/jobs/{id}` until it is done or failed, and `/api/metrics` is sampled
+for the queue backlog while a level runs.
+
+Run it against a backend wired to the local stubs (one terminal each):
+
+    python scripts/github_stub.py --files 40 --latency-ms 40
+    python scripts/fake_llm_server.py --latency-ms 800 --jitter-ms 200
+    GITHUB_WEBHOOK_SECRET=loadtest GITHUB_API_URL=http://127.0.0.1:8901 GITHUB_TOKEN=fake \\
+        OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=fake REVIEW_WORKERS=4 \\
+        uvicorn app.main:app --port 8000
+
+Usage:
+    python scripts/load_test_webhook.py --secret loadtest --levels 1,4,16 --events 40
+    python scripts/load_test_webhook.py --payload recorded/opened.json --payload recorded/sync.json
+
+`--payload` takes recorded GitHub deliveries (the JSON body); without it a minimal `opened`
+event is used. Per level the report shows ack p50/p95, end-to-end p50/p95 (webhook sent →
+job finished), reviews completed per minute, the largest `queued` backlog seen, and the LLM
+and GitHub calls the level cost (from the stubs' `/stats`, when reachable).
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import hashlib
+import hmac
+import json
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+TERMINAL = {"done", "failed"}
+
+
+def _template() -> Dict[str, Any]:
+    return {
+        "action": "opened",
+        "number": 1,
+        "pull_request": {
+            "number": 1,
+            "title": "Load test pull request",
+            "body": "Replayed by scripts/load_test_webhook.py",
+            "head": {"ref": "feature", "sha": "0" * 40},
+            "base": {"ref": "main"},
+            "diff_url": "https://github.com/loadtest/repo/pull/1.diff",
+        },
+        "repository": {"name": "repo", "full_name": "loadtest/repo", "owner": {"login": "loadtest"}},
+    }
+
+
+def _event(template: Dict[str, Any], run: str, seq: int) -> Dict[str, Any]:
+    """A copy of `template` that the backend treats as a new PR head (no dedupe, no cache hits)."""
+    event = copy.deepcopy(template)
+    if event.get("action") not in {"opened", "reopened", "synchronize"}:
+        event["action"] = "opened"
+    owner = ((event.get("repository") or {}).get("owner") or {}).get("login") or "loadtest"
+    name = f"lt-{run}-{seq}"
+    event["repository"] = {**(event.get("repository") or {}), "name": name, "full_name": f"{owner}/{name}",
+                           "owner": {"login": owner}}
+    pr = event.setdefault("pull_request", {})
+    event["number"] = pr["number"] = seq + 1
+    pr["head"] = {**(pr.get("head") or {}), "sha": hashlib.sha1(f"{run}-{seq}".encode()).hexdigest()}
+    pr["diff_url"] = f"https://github.com/{owner}/{name}/pull/{seq + 1}.diff"
+    return event
+
+
+def _sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _stub_stats(client: httpx.Client, url: Optional[str]) -> Dict[str, int]:
+    if not url:
+        return {}
+    try:
+        return client.get(f"{url.rstrip('/')}/stats", timeout=5).json()
+    except (httpx.HTTPError, ValueError):
+        return {}
+
+
+class BacklogSampler(threading.Thread):
+    """Polls `/api/metrics` and keeps the largest queued/running counts seen."""
+
+    def __init__(self, client: httpx.Client, target: str, interval_s: float) -> None:
+        super().__init__(daemon=True)
+        self.client, self.url, self.interval_s = client, f"{target}/api/metrics", interval_s
+        self.max_queued = 0
+        self.max_running = 0
+        self._halt = threading.Event()
+
+    def run(self) -> None:
+        while not self._halt.is_set():
+            try:
+                queue = self.client.get(self.url, timeout=5).json().get("review_queue") or {}
+                self.max_queued = max(self.max_queued, int(queue.get("queued") or 0))
+                self.max_running = max(self.max_running, int(queue.get("running") or 0))
+            except (httpx.HTTPError, ValueError):
+                pass
+            self._halt.wait(self.interval_s)
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+
+
+def run_level(args: argparse.Namespace, client: httpx.Client, templates: List[Dict[str, Any]],
+              concurrency: int) -> Dict[str, Any]:
+    run = uuid.uuid4().hex[:8]
+    llm_before = _stub_stats(client, args.llm_stats)
+    gh_before = _stub_stats(client, args.github_stats)
+    sampler = BacklogSampler(client, args.target, args.sample_s)
+    sampler.start()
+
+    def send(seq: int) -> Dict[str, Any]:
+        body = json.dumps(_event(templates[seq % len(templates)], run, seq)).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "X-GitHub-Event": "pull_request",
+            "X-GitHub-Delivery": str(uuid.uuid4()),
+            "X-Hub-Signature-256": _sign(args.secret, body),
+        }
+        sent = time.time()
+        try:
+            resp = client.post(f"{args.target}/api/code-review/webhook", content=body, headers=headers)
+            data = resp.json() if resp.status_code == 200 else {}
+        except (httpx.HTTPError, ValueError) as e:
+            return {"sent": sent, "ack_s": time.time() - sent, "job_id": None, "error": str(e)}
+        return {"sent": sent, "ack_s": time.time() - sent, "job_id": data.get("job_id"),
+                "error": None if data.get("job_id") else f"{resp.status_code} {data.get('review', resp.text[:80])}"}
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        sends = list(pool.map(send, range(args.events)))
+    send_s = time.time() - started
+
+    # Wait for every acknowledged job to finish
+    pending = {s["job_id"] for s in sends if s["job_id"]}
+    jobs: Dict[str, Dict[str, Any]] = {}
+    deadline = time.time() + args.timeout_s
+    while pending and time.time() < deadline:
+        for job_id in list(pending):
+            try:
+                job = client.get(f"{args.target}/api/code-review/jobs/{job_id}", timeout=10).json()
+            except (httpx.HTTPError, ValueError):
+                continue
+            if job.get("status") in TERMINAL:
+                jobs[job_id] = job
+                pending.discard(job_id)
+        if pending:
+            time.sleep(args.poll_s)
+    sampler.stop()
+
+    finished = [j for j in jobs.values() if j["status"] == "done"]
+    end = max((j["finished_at"] for j in jobs.values()), default=time.time())
+    sent_at = {s["job_id"]: s["sent"] for s in sends if s["job_id"]}
+    e2e = [j["finished_at"] - sent_at[j["id"]] for j in finished]
+    stage_ms: Dict[str, List[float]] = {}
+    for job in finished:
+        for name, stage in (job.get("stages") or {}).items():
+            if stage.get("duration_ms") is not None:
+                stage_ms.setdefault(name, []).append(stage["duration_ms"])
+    llm_after = _stub_stats(client, args.llm_stats)
+    gh_after = _stub_stats(client, args.github_stats)
+    acks = [s["ack_s"] for s in sends if s["job_id"]]
+    return {
+        "concurrency": concurrency,
+        "events": args.events,
+        "acked": len(acks),
+        "ack_errors": sum(1 for s in sends if not s["job_id"]),
+        "done": len(finished),
+        "failed": sum(1 for j in jobs.values() if j["status"] == "failed"),
+        "timed_out": len(pending),
+        "send_s": round(send_s, 2),
+        "ack_p50_ms": _ms(_pct(acks, 0.5)),
+        "ack_p95_ms": _ms(_pct(acks, 0.95)),
+        "e2e_p50_s": _s(_pct(e2e, 0.5)),
+        "e2e_p95_s": _s(_pct(e2e, 0.95)),
+        "reviews_per_min": round(len(finished) / max(end - started, 1e-6) * 60, 1),
+        "max_queued": sampler.max_queued,
+        "max_running": sampler.max_running,
+        "queue_wait_p95_s": _s(_pct([j["queue_wait_s"] for j in finished if j.get("queue_wait_s") is not None], 0.95)),
+        "stage_p50_ms": {name: round(statistics.median(v)) for name, v in stage_ms.items()},
+        "llm_calls": _delta(llm_before, llm_after, "chat"),
+        "github_requests": _delta(gh_before, gh_after, "requests"),
+        "errors": sorted({s["error"] for s in sends if s["error"]})[:3],
+    }
+
+
+def _ms(v: Optional[float]) -> Optional[float]:
+    return None if v is None else round(v * 1000, 1)
+
+
+def _s(v: Optional[float]) -> Optional[float]:
+    return None if v is None else round(v, 2)
+
+
+def _delta(before: Dict[str, int], after: Dict[str, int], key: str) -> Optional[int]:
+    return after[key] - before[key] if key in before and key in after else None
+
+
+def _print_table(rows: List[Dict[str, Any]]) -> None:
+    cols = ["concurrency", "acked", "done", "failed", "ack_p50_ms", "ack_p95_ms", "e2e_p50_s", "e2e_p95_s",
+            "reviews_per_min", "max_queued", "queue_wait_p95_s", "llm_calls", "github_requests"]
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in cols]
+    print("  ".join(c.rjust(w) for c, w in zip(cols, widths)))
+    for r in rows:
+        print("  ".join(str(r[c]).rjust(w) for c, w in zip(cols, widths)))
+    for r in rows:
+        stages = ", ".join(f"{k}={v}ms" for k, v in r["stage_p50_ms"].items())
+        print(f"c={r['concurrency']}: stage p50 {stages or '-'}"
+              + (f"; timed out {r['timed_out']}" if r["timed_out"] else "")
+              + (f"; ack errors {r['errors']}" if r["errors"] else ""))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="backend base URL")
+    parser.add_argument("--secret", default="", help="GITHUB_WEBHOOK_SECRET the backend was started with")
+    parser.add_argument("--payload", action="append", default=[], help="recorded webhook body (JSON); repeatable")
+    parser.add_argument("--levels", default="1,2,4,8", help="comma-separated sender concurrency levels")
+    parser.add_argument("--events", type=int, default=20, help="webhooks sent per level")
+    parser.add_argument("--timeout-s", type=float, default=600.0, help="max wait for a level's jobs to finish")
+    parser.add_argument("--poll-s", type=float, default=0.25)
+    parser.add_argument("--sample-s", type=float, default=0.25, help="backlog sampling interval")
+    parser.add_argument("--llm-stats", default="http://127.0.0.1:8900", help="fake LLM server ('' to skip)")
+    parser.add_argument("--github-stats", default="http://127.0.0.1:8901", help="GitHub stub ('' to skip)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+    args.target = args.target.rstrip("/")
+
+    templates = []
+    for path in args.payload:
+        with open(path, encoding="utf-8") as fh:
+            templates.append(json.load(fh))
+    templates = templates or [_template()]
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+
+    rows = []
+    limits = httpx.Limits(max_connections=max(levels) + 8, max_keepalive_connections=max(levels) + 8)
+    with httpx.Client(timeout=60.0, limits=limits) as client:
+        for concurrency in levels:
+            rows.append(run_level(args, client, templates, concurrency))
+            if not args.json:
+                r = rows[-1]
+                print(f"level c={concurrency}: {r['done']}/{r['events']} done, "
+                      f"{r['reviews_per_min']} reviews/min, max backlog {r['max_queued']}")
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print()
+        _print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import ast
+
+from app.services.code_chunker import _pack, merge_tests, split_code
+
+
+def _defined(source: str) -> list[str]:
+    return [n.name for n in ast.parse(source).body if isinstance(n, (ast.FunctionDef, ast.ClassDef))]
+
+
+def test_merge_tests_keeps_colliding_definitions():
+    first = "import pytest\n\n@pytest.fixture\ndef client():\n    return 1\n\ndef test_a(client):\n    assert client == 1\n"
+    second = (
+        "import pytest\n\n@pytest.fixture\ndef client():\n    return 2\n\n"
+        "def test_a(client):\n    assert client == 2\n\nclass TestFoo:\n    def test_a(self):\n        assert self.client\n"
+    )
+    merged = merge_tests([first, second], is_python=True)
+    assert _defined(merged) == ["client", "test_a", "client_2", "test_a_2", "TestFoo"]
+    assert "def test_a_2(client_2):\n    assert client_2 == 2" in merged
+    # Methods and attributes of the renamed part are not top-level names
+    assert "    def test_a(self):\n        assert self.client" in merged
+    assert merged.count("import pytest") == 1
+
+
+def test_pack_never_emits_blank_chunks():
+    assert _pack(["a = 1", "", "  ", "b = 2"], max_chars=6) == ["a = 1\n\n  ", "b = 2"]
+    assert _pack(["", "a = 1"], max_chars=1) == ["\na = 1"]
+    assert _pack(["", " "], max_chars=10) == []
+
+
+def test_split_code_is_lossless_without_blank_chunks():
+    code = "function a() {\n  return 1;\n}\n\n\n\nfunction b() {\n  return 2;\n}\n"
+    chunks = split_code(code, max_chars=20).chunks
+    assert all(c.strip() for c in chunks)
+    assert "\n".join(chunks) == code
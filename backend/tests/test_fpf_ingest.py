@@ -0,0 +1,49 @@
+import uuid
+from pathlib import Path
+
+import chromadb
+
+from app.services.fpf_ingest import ingest
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0, 0.0] for t in texts]
+
+
+def _page(path: Path, url: str, body: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"---\nurl: {url}\ntitle: Page\n---\n{body}\n", encoding="utf-8")
+
+
+def _run(source: Path, collection, manifest: Path):
+    return ingest(source, collection, FakeEmbeddings(), manifest, "fake")
+
+
+def test_renamed_file_with_same_url_keeps_its_chunks(tmp_path):
+    source, manifest = tmp_path / "dump", tmp_path / "manifest.json"
+    collection = chromadb.EphemeralClient().create_collection(f"fpf-{uuid.uuid4().hex[:8]}")
+    _page(source / "old.md", "https://example.org/a", "Food contact chemicals.")
+    _run(source, collection, manifest)
+    assert collection.count() == 1
+
+    (source / "old.md").rename(source / "new.md")
+    report = _run(source, collection, manifest)
+    assert report.files_removed == 1
+    assert report.chunks_deleted == 0
+    assert collection.count() == 1
+
+    assert _run(source, collection, manifest).files_unchanged == 1
+    assert collection.count() == 1
+
+
+def test_files_sharing_a_url_keep_shared_chunks(tmp_path):
+    source, manifest = tmp_path / "dump", tmp_path / "manifest.json"
+    collection = chromadb.EphemeralClient().create_collection(f"fpf-{uuid.uuid4().hex[:8]}")
+    _page(source / "a.md", "https://example.org/a", "Shared text.")
+    _page(source / "b.md", "https://example.org/a", "Shared text.")
+    assert _run(source, collection, manifest).chunks_embedded == 1
+
+    (source / "b.md").unlink()
+    _run(source, collection, manifest)
+    assert collection.count() == 1